@@ -1,13 +1,29 @@
-from flask import Blueprint, request, jsonify
+import json
+
+from flask import Blueprint, Response, request, jsonify
 
 from game.state import GameStore
-from models import random_name
+from game import cluster, mapgen
+from game.spectators import spectators
+import metrics
+from logger import get_logger
+
+log = get_logger('api')
 # Bot support
 from game.bot import Bot
 
 api_bp = Blueprint('api', __name__)
 
 
+@api_bp.before_request
+def _check_game_owner():
+    # clustered mode: every call for a game must reach the worker that holds it
+    # (the router sends /api/games/<n>-... to worker n; see game.cluster)
+    game_id = (request.view_args or {}).get('game_id')
+    if game_id and cluster.enabled() and not cluster.is_local(game_id):
+        return jsonify({'error': 'game held by another worker', 'worker': cluster.owner_of(game_id)}), 421
+
+
 @api_bp.route('', methods=['GET'])
 @api_bp.route('/', methods=['GET'])
 def api_index():
@@ -18,7 +34,9 @@ def api_index():
         'endpoints': [
             '/api/games [GET,POST]',
             '/api/games/<game_id>/join [POST]',
-            '/api/games/<game_id>/state [GET]'
+            '/api/games/<game_id>/state?wait=<rev>&timeout=<s> [GET]',
+            '/api/games/<game_id>/log?after=<seq>&limit=<n> [GET]',
+            '/api/metrics [GET]'
         ]
     }), 200
 
@@ -28,12 +46,43 @@ def create_game():
     data = request.get_json() or {}
     name = data.get('name', 'Game')
     max_players = int(data.get('maxPlayers', 2))
+    # optional seed for reproducible games (random when omitted)
+    seed = data.get('seed')
+    try:
+        seed = int(seed) if seed is not None else None
+    except (TypeError, ValueError):
+        return jsonify({'error': 'seed must be an integer'}), 400
+    # seconds before a turn is skipped (0 = never); server default when omitted
+    turn_budget = data.get('turnBudget')
+    try:
+        turn_budget = max(0.0, float(turn_budget)) if turn_budget is not None else None
+    except (TypeError, ValueError):
+        return jsonify({'error': 'turnBudget must be a number'}), 400
+    # optional map size (tiles) and style, generated from the seed (game.mapgen)
+    try:
+        map_width, map_height, map_style = mapgen.validate(data.get('mapWidth'), data.get('mapHeight'),
+                                                           data.get('mapStyle'))
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': str(e)}), 400
+    # fog of war: players only see entities within viewRadius tiles, in line of sight (0 = off)
+    view_radius = data.get('viewRadius')
+    try:
+        view_radius = max(0, int(view_radius)) if view_radius is not None else None
+    except (TypeError, ValueError):
+        return jsonify({'error': 'viewRadius must be an integer'}), 400
 
-    game = GameStore.create_game(name=name, max_players=max_players)
-    # start the game if it hasn't been started yet (generate map, roll initiative)
-    if getattr(game, 'status', None) == 'waiting' and not getattr(game, 'map', None):
-        game.start()
-    return jsonify({'gameId': game.id, 'name': game.name}), 201
+    try:
+        game = GameStore.create_game(name=name, max_players=max_players, seed=seed, turn_budget=turn_budget,
+                                     map_width=map_width, map_height=map_height, map_style=map_style,
+                                     view_radius=view_radius)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if game is None:
+        return jsonify({'error': 'too many games'}), 503
+    # start the game if it hasn't been started yet (roll initiative)
+    if getattr(game, 'status', None) == 'waiting':
+        game.call(game.start)
+    return jsonify({'gameId': game.id, 'name': game.name, 'seed': game.seed}), 201
 
 
 @api_bp.route('/games', methods=['GET'])
@@ -45,7 +94,8 @@ def list_games():
 @api_bp.route('/games/<game_id>/join', methods=['POST'])
 def join_game(game_id):
     data = request.get_json() or {}
-    player_name = data.get('playerName') or random_name()
+    # an empty name makes the game pick one from its own rng
+    player_name = data.get('playerName')
     # option to auto-create/start a bot after join (default True for convenience)
     auto_bot = bool(data.get('autoBot', True))
 
@@ -63,26 +113,180 @@ def join_game(game_id):
             has_bot = any((p.name or '').startswith('Computer') for p in game.players.values())
             # ensure there's room for the bot
             if not has_bot and len(game.players) < game.max_players:
-                bot = Bot(game_id, name='Computer')
                 try:
-                    bot_id = bot.start()
-                    # log successful bot start for visibility
-                    print(f"started bot {bot_id} in game {game_id}")
-                    # keep bot reference on game for potential future management
-                    if not hasattr(game, '_bots'):
-                        game._bots = []
-                    game._bots.append(bot)
+                    bot = GameStore.start_bot(game_id, name='Computer')
+                    log.info('started bot', game=game_id, bot=bot.player_id)
                 except Exception as e:
-                    print(f"failed to start bot for game {game_id}: {e}")
+                    log.error('failed to start bot', game=game_id, error=str(e))
         except Exception:
             pass
 
-    return jsonify({'playerId': player.id, 'name': player.name, **(game.to_dict() if game else {})}), 200
+    # proof of identity for the fogged /state and /log reads of this player
+    token = GameStore.player_token(game_id, player.id)
+    if not game:
+        return jsonify({'playerId': player.id, 'name': player.name, 'token': token}), 200
+    if game.view_radius:
+        # fog of war: only what the new player sees
+        view = game.call(game.view_of, player.id, False)
+        return jsonify(dict(view, playerId=player.id, token=token)), 200
+    # splice the cached snapshot bytes instead of re-encoding the whole state
+    # ('name' is the snapshot's game name, as when the dicts were merged)
+    head = json.dumps({'playerId': player.id, 'token': token}).encode('utf-8')
+    return Response(head[:-1] + b',' + game.snapshot_json()[1:], status=200, mimetype='application/json')
+
+
+def _fog_viewer(game):
+    """(player id, error response) of a fogged read: `?playerId=` with its join token
+    (`X-Player-Token` header or `?token=`); no playerId reads the view of nobody."""
+    player_id = request.args.get('playerId')
+    if player_id is None:
+        return None, None
+    token = request.headers.get('X-Player-Token') or request.args.get('token')
+    if not GameStore.check_player_token(game.id, player_id, token):
+        return None, (jsonify({'error': 'invalid player token'}), 403)
+    return player_id, None
+
+
+# longest a ?wait= long-poll is held before answering 304
+MAX_WAIT = 60.0
+
+
+def _etag_revs(header):
+    # revisions named by an If-None-Match header ("<rev>" / "<rev>-gzip", weak or not)
+    revs = set()
+    for tag in (header or '').split(','):
+        tag = tag.strip()
+        if tag.startswith('W/'):
+            tag = tag[2:]
+        tag = tag.strip('"')
+        if tag.endswith('-gzip'):
+            tag = tag[:-5]
+        if tag.isdigit():
+            revs.add(int(tag))
+    return revs
 
 
 @api_bp.route('/games/<game_id>/state', methods=['GET'])
 def get_state(game_id):
+    """Full game state with a revision ETag.
+
+    `If-None-Match: "<rev>"` answers 304 while the game is still at that
+    revision. `?wait=<rev>` (long-poll) holds the request until the game
+    moves past `rev` or `timeout` seconds (default 25, max 60) elapse, then
+    answers 304 if nothing changed.
+
+    Under fog of war the state is the view of `?playerId=`, which needs the
+    token returned by its join (403 otherwise); no entities without it.
+    """
+    game = GameStore.get_game(game_id)
+    if not game:
+        return jsonify({'error': 'not found'}), 404
+    viewer = None
+    if game.view_radius:
+        viewer, error = _fog_viewer(game)
+        if error:
+            return error
+    wait = request.args.get('wait')
+    if wait is not None:
+        try:
+            wait = int(wait)
+            timeout = min(MAX_WAIT, max(0.0, float(request.args.get('timeout', 25))))
+        except ValueError:
+            return jsonify({'error': 'wait and timeout must be numbers'}), 400
+        game.wait_for_change(wait, timeout)
+    if game.view_radius:
+        view = game.call(game.view_of, viewer, False)
+        etag = f'"{view["rev"]}"'
+        if view['rev'] in _etag_revs(request.headers.get('If-None-Match')) or (wait is not None and view['rev'] == wait):
+            resp = Response(status=304)
+        else:
+            resp = jsonify(view)
+        resp.headers['ETag'] = etag
+        resp.headers['Cache-Control'] = 'no-cache'
+        return resp
+    # same bytes for every poller until the game changes
+    gz = 'gzip' in (request.headers.get('Accept-Encoding') or '')
+    rev, data, gz_data = game.encoded_snapshot(gz)[:3]
+    etag = f'"{rev}-gzip"' if gz else f'"{rev}"'
+    if rev in _etag_revs(request.headers.get('If-None-Match')) or (wait is not None and rev == wait):
+        resp = Response(status=304)
+    elif gz:
+        resp = Response(gz_data, mimetype='application/json')
+        resp.headers['Content-Encoding'] = 'gzip'
+    else:
+        resp = Response(data, mimetype='application/json')
+    resp.headers['ETag'] = etag
+    resp.headers['Cache-Control'] = 'no-cache'
+    resp.headers['Vary'] = 'Accept-Encoding'
+    return resp
+
+
+@api_bp.route('/games/<game_id>/map/chunk/<int:cx>/<int:cy>', methods=['GET'])
+def get_map_chunk(game_id, cx, cy):
+    """One map chunk (tiles row-major) with an ETag of the map and chunk versions.
+
+    Static chunks keep their ETag, so `If-None-Match` answers 304 and the
+    tiles are never sent twice to a caching client.
+    """
+    game = GameStore.get_game(game_id)
+    if not game or not game.map:
+        return jsonify({'error': 'not found'}), 404
+    if not game.map.has_chunk(cx, cy):
+        return jsonify({'error': 'chunk out of map'}), 404
+    info, chunk = game.call(lambda: (game.map.info(game._map_rev), game.map.chunk(cx, cy)))
+    etag = f'"{info["rev"]}.{chunk["v"]}"'
+    if etag in [t.strip().replace('W/', '', 1) for t in (request.headers.get('If-None-Match') or '').split(',')]:
+        resp = Response(status=304)
+    else:
+        chunk['tiles'] = list(chunk['tiles'])
+        chunk['map'] = info
+        resp = jsonify(chunk)
+    resp.headers['ETag'] = etag
+    resp.headers['Cache-Control'] = 'no-cache'
+    return resp
+
+
+# upper bound for one page of /log
+MAX_LOG_PAGE = 1000
+
+
+@api_bp.route('/games/<game_id>/log', methods=['GET'])
+def get_log(game_id):
+    """Page through the game log: entries with seq > `after`, oldest first.
+
+    Under fog of war the entries are filtered by what `?playerId=` (with its
+    join token, as for /state) sees now, as in its deltas; `next` still
+    follows the unfiltered log.
+    """
     game = GameStore.get_game(game_id)
     if not game:
         return jsonify({'error': 'not found'}), 404
-    return jsonify(game.to_dict())
+    viewer = None
+    if game.view_radius:
+        viewer, error = _fog_viewer(game)
+        if error:
+            return error
+    try:
+        after = max(0, int(request.args.get('after', 0)))
+        limit = min(MAX_LOG_PAGE, max(1, int(request.args.get('limit', 100))))
+    except ValueError:
+        return jsonify({'error': 'after and limit must be integers'}), 400
+    entries = game.call(game.log.since, after, limit)
+    shown = game.call(game.log_for, viewer, entries)
+    return jsonify({
+        'gameId': game.id,
+        'entries': shown,
+        'first_seq': game.log.first_seq,
+        'last_seq': game.log.last_seq,
+        # cursor for the next page
+        'next': entries[-1]['seq'] if entries else max(after, game.log.first_seq - 1),
+        # entries between `after` and first_seq were dropped from the ring buffer
+        'truncated': after + 1 < game.log.first_seq,
+    })
+
+
+@api_bp.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Prometheus text exposition of the server metrics (see metrics.py)."""
+    body = metrics.render(GameStore.list_games(local_only=True), GameStore.list_bots(), spectators.counts())
+    return Response(body, mimetype='text/plain; version=0.0.4')
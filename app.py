@@ -5,6 +5,8 @@ from flask_socketio import SocketIO
 # support both package-relative and top-level imports (used by tests)
 from api import api_bp
 from socketio_events import register_socketio_handlers
+from game.state import GameStore
+from game import persistence
 
 
 def create_app():
@@ -19,6 +21,15 @@ def create_app():
         # Log full exception so docker logs capture the root cause
         app.logger.exception('Failed to register api blueprint: %s', e)
 
+    # Optional durable games: set FUNGAME_DATA_DIR to snapshot/journal games and
+    # reload them on startup (e.g. across `docker compose down`/up)
+    try:
+        restored = GameStore.enable_persistence(persistence.enable_from_env())
+        if restored:
+            app.logger.info('Restored %d games from %s', len(restored), os.environ.get('FUNGAME_DATA_DIR'))
+    except Exception as e:
+        app.logger.exception('Failed to enable persistence: %s', e)
+
     # CORS + Private Network Access handling
     # We respond to preflight OPTIONS and add the necessary headers including
     # Access-Control-Allow-Private-Network when the browser requests it.
@@ -188,7 +199,8 @@ def create_app():
 if __name__ == '__main__':
     app = create_app()
     # use threading async mode for development simplicity
-    socketio = SocketIO(app, cors_allowed_origins='*', async_mode='threading')
+    from game.wire import SocketIOJSON
+    socketio = SocketIO(app, cors_allowed_origins='*', async_mode='threading', json=SocketIOJSON)
     # expose socketio instance for other modules
     try:
         import socketio_instance
@@ -196,6 +208,7 @@ if __name__ == '__main__':
     except Exception:
         pass
     register_socketio_handlers(socketio)
+    GameStore.start_reaper()
     # run with socketio.run for proper handling
     # extra log to confirm running and paths
     app.logger.info('Starting FunGame app, serving on 0.0.0.0:5000')
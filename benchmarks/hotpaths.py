@@ -0,0 +1,230 @@
+"""Micro-benchmarks for the game hot paths.
+
+Measures GameState.process_action (move/attack/end_turn), GameState.to_dict,
+the cached GameState.snapshot_json, GameState.add_player spawn search,
+Engine.advance_turn / roll_initiative, the bot decision step and the
+persistence snapshot (the copy taken inside the command vs the pickling done
+by the writer thread) at several
+scales (entities x map size x log length), all on seeded games so runs are
+comparable.
+
+Usage::
+
+    python -m benchmarks.hotpaths --out bench.json
+    python -m benchmarks.hotpaths --quick --out new.json --compare bench.json --threshold 0.25
+
+With --compare, every benchmark slower than the baseline by more than
+`threshold` (relative) is reported and the exit status is 1.
+"""
+import argparse
+import json
+import pickle
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+from models import GameState, Player
+from game.bot import choose_action
+
+# (entities, map width, map height): small room, crowded arena, huge map
+SCALES = [
+    (2, 16, 12),
+    (50, 16, 12),
+    (50, 128, 128),
+    (500, 128, 128),
+    (500, 512, 512),
+    (50, 1024, 1024),
+]
+QUICK_SCALES = [(2, 16, 12), (50, 128, 128)]
+# log lengths for the serialization benchmarks: short vs 100k entries
+LOG_SIZES = [20, 100000]
+
+
+def make_game(entities, width, height, log_entries=0, seed=1):
+    """Running seeded game with `entities` players on a width x height floor map."""
+    # beyond the server's MAX_ENTITIES on purpose: the large scales measure crowded games;
+    # no turn budget, as in game.simulate: the shared timer wheel must not skip turns
+    # under the measurement nor keep discarded games alive
+    game = GameState(name='bench', max_players=entities + 1, seed=seed, max_entities=entities + 1, turn_budget=0,
+                     log_capacity=max(log_entries, 1000), map_width=width, map_height=height)
+    game.start()
+    for i in range(entities):
+        if not game.add_player(Player(name=f'p{i}', rng=game.rng)):
+            raise RuntimeError(f'could not add player {i} of {entities} to the benchmark game')
+    game.engine.roll_initiative()
+    for i in range(log_entries - len(game.log)):
+        game.add_log({'event': 'bench', 'i': i, 'time': 0.0})
+    return game
+
+
+def measure(fn, min_time=0.2, repeats=5):
+    """Median nanoseconds per call of `fn` over `repeats` timed batches."""
+    # calibrate a batch size that runs for roughly min_time / repeats
+    n = 1
+    while True:
+        t0 = time.perf_counter()
+        for _ in range(n):
+            fn()
+        dt = time.perf_counter() - t0
+        if dt >= min_time / repeats or n >= 1 << 20:
+            break
+        n *= 2
+    samples = []
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        for _ in range(n):
+            fn()
+        samples.append((time.perf_counter() - t0) / n * 1e9)
+    return {'ns_per_op': statistics.median(samples), 'min_ns': min(samples), 'batch': n}
+
+
+def _bench_move(game):
+    actor = next(iter(game.players.values()))
+    x0, y0 = actor.x, actor.y
+    # find a free neighbour to move back and forth to
+    for dx, dy in ((1, 0), (-1, 0), (0, 1), (0, -1)):
+        nx, ny = x0 + dx, y0 + dy
+        if game.map.passable(nx, ny) and not game.occupancy.is_occupied(nx, ny):
+            break
+    tiles = [(nx, ny), (x0, y0)]
+    state = {'i': 0}
+
+    def step():
+        x, y = tiles[state['i'] & 1]
+        state['i'] += 1
+        game.current_turn = actor.id
+        game.process_action(actor.id, {'type': 'move', 'x': x, 'y': y})
+    return step
+
+
+def _bench_attack(game):
+    actors = list(game.players.values())
+    actor, target = actors[0], actors[1]
+    # keep the target alive whatever the rolls
+    target.hp = target.max_hp = 10 ** 9
+
+    def step():
+        game.current_turn = actor.id
+        game.process_action(actor.id, {'type': 'attack', 'targetId': target.id})
+    return step
+
+
+def _bench_end_turn(game):
+    def step():
+        game.process_action(game.current_turn, {'type': 'end_turn'})
+    return step
+
+
+def _bench_add_player(entities, width, height):
+    # spawn search for one more player once the corners are taken
+    game = make_game(entities, width, height)
+
+    def step():
+        p = Player(name='late', rng=game.rng)
+        game.add_player(p)
+        game.remove_player(p.id)
+    return step
+
+
+def _bench_bot_decision(game):
+    actor = next(iter(game.players.values()))
+
+    def step():
+        choose_action(game, actor)
+    return step
+
+
+def run(scales=SCALES, log_sizes=LOG_SIZES, min_time=0.2):
+    results = {}
+
+    def record(name, params, fn):
+        res = measure(fn, min_time=min_time)
+        res['params'] = params
+        results[name] = res
+        print(f"{name:55s} {res['ns_per_op'] / 1000:10.2f} us/op", flush=True)
+
+    for entities, width, height in scales:
+        params = {'entities': entities, 'width': width, 'height': height}
+        tag = f"e{entities}_m{width}x{height}"
+        record(f'process_action.move[{tag}]', params, _bench_move(make_game(entities, width, height)))
+        record(f'process_action.attack[{tag}]', params, _bench_attack(make_game(entities, width, height)))
+        record(f'process_action.end_turn[{tag}]', params, _bench_end_turn(make_game(entities, width, height)))
+        record(f'engine.advance_turn[{tag}]', params, make_game(entities, width, height).engine.advance_turn)
+        record(f'engine.roll_initiative[{tag}]', params, make_game(entities, width, height).engine.roll_initiative)
+        record(f'add_player.spawn[{tag}]', params, _bench_add_player(entities, width, height))
+        record(f'bot.choose_action[{tag}]', params, _bench_bot_decision(make_game(entities, width, height)))
+        for log_entries in log_sizes:
+            game = make_game(entities, width, height, log_entries=log_entries)
+            record(f'to_dict[{tag}_log{log_entries}]', dict(params, log_entries=log_entries), game.to_dict)
+        # cached encoded snapshot between two mutations (REST pollers, joiners)
+        record(f'snapshot_json.cached[{tag}]', params, make_game(entities, width, height).snapshot_json)
+        # periodic persistence snapshot: GameState.frozen runs on the action's path,
+        # the pickle on the journal writer thread
+        game = make_game(entities, width, height, log_entries=log_sizes[-1])
+        record(f'persistence.freeze[{tag}]', params, game.frozen)
+        record(f'persistence.pickle[{tag}]', params,
+               lambda: pickle.dumps(game.frozen(), protocol=pickle.HIGHEST_PROTOCOL))
+    return results
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL, text=True).strip()
+    except Exception:
+        return None
+
+
+def compare(results, baseline, threshold):
+    """Return [(name, baseline ns, current ns, ratio)] for regressions above threshold."""
+    regressions = []
+    for name, res in results.items():
+        base = baseline.get('results', {}).get(name)
+        if not base:
+            continue
+        ratio = res['ns_per_op'] / base['ns_per_op'] if base['ns_per_op'] else 1.0
+        if ratio > 1 + threshold:
+            regressions.append((name, base['ns_per_op'], res['ns_per_op'], ratio))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the FunGame hot paths.')
+    parser.add_argument('--out', help='write results to this JSON file')
+    parser.add_argument('--compare', help='baseline JSON file produced by an earlier run')
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help='relative slowdown reported as a regression (default 0.25 = +25%%)')
+    parser.add_argument('--quick', action='store_true', help='small scales and short timings only')
+    args = parser.parse_args(argv)
+
+    if args.quick:
+        results = run(QUICK_SCALES, log_sizes=LOG_SIZES[:1], min_time=0.05)
+    else:
+        results = run()
+    report = {
+        'meta': {
+            'time': time.time(),
+            'commit': _git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+        },
+        'results': results,
+    }
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        for name, base, cur, ratio in regressions:
+            print(f"REGRESSION {name}: {base / 1000:.2f} -> {cur / 1000:.2f} us/op (x{ratio:.2f})")
+        if regressions:
+            return 1
+        print(f"no regression above {args.threshold:.0%} against {args.compare}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,22 +1,94 @@
 import React, { useEffect, useState, useRef } from 'react'
 import { io } from 'socket.io-client'
 import * as PIXI from 'pixi.js'
+import { decode } from '@msgpack/msgpack'
+
+// Clustered servers (game/cluster.py) prefix game ids with the owning worker ("2-9f1c...")
+// and the proxy routes /socket.io by the `game` query parameter: the socket must
+// carry the id of the game it is going to join.
+function clusterWorker(gameId){
+  const m = /^(\d+)-/.exec(gameId || '')
+  return m ? m[1] : ''
+}
+function storedGame(){
+  try{ return sessionStorage.getItem('gameId') || '' }catch(e){ return '' }
+}
 
 // Connect to the same origin so the client uses the frontend host (nginx) as proxy for socket.io.
 // Prefer websocket transport and fall back to polling if needed.
-const socket = io(window.location.origin, { path: '/socket.io', transports: ['websocket','polling'] })
+const socket = io(window.location.origin, { path: '/socket.io', transports: ['websocket','polling'], query: { game: storedGame() } })
+
+// point the socket at the worker holding `gameId`; reconnects only when the worker changes
+function routeSocket(gameId){
+  try{
+    const prev = (socket.io.opts.query || {}).game
+    socket.io.opts.query = { ...(socket.io.opts.query || {}), game: gameId }
+    if(clusterWorker(prev) !== clusterWorker(gameId) && socket.connected){
+      socket.disconnect()
+      socket.connect()
+    }
+  }catch(e){ console.warn('routeSocket failed', e) }
+}
 
 // diagnostic handlers for connection issues
 socket.on('connect_error', (err) => { console.error('socket connect_error', err) })
 socket.on('reconnect_error', (err) => { console.error('socket reconnect_error', err) })
 socket.on('disconnect', (reason) => { console.warn('socket disconnected', reason) })
 
+// Binary wire format negotiated on `join` (server falls back to JSON when unsupported).
+// Compact layout, see game/wire.py: entities are arrays in ENTITY_FIELDS order
+// (template_id only for monsters), the map is {w, h, tiles} with one byte per tile.
+const WIRE_ENCODING = 'msgpack'
+const WIRE_EVENTS = new Set(['state_update', 'state_delta', 'action_result', 'game_started', 'map_chunks'])
+const ENTITY_FIELDS = ['id', 'name', 'hp', 'max_hp', 'ac', 'x', 'y', 'initiative', 'is_connected', 'color', 'score', 'template_id']
+
+function expandEntity(e){
+  if(!Array.isArray(e)) return e
+  const out = {}
+  ENTITY_FIELDS.forEach((f, i) => { if(i < e.length) out[f] = e[i] })
+  out.position = {x: out.x, y: out.y}
+  delete out.x
+  delete out.y
+  return out
+}
+
+function unpackMap(m){
+  if(!m || Array.isArray(m) || !m.tiles) return m
+  const rows = []
+  for(let y = 0; y < m.h; y++) rows.push(Array.from(m.tiles.subarray(y * m.w, (y + 1) * m.w)))
+  return rows
+}
+
+// binary payload -> same object shape as the JSON events
+function decodeWire(data){
+  if(!(data instanceof ArrayBuffer || ArrayBuffer.isView(data))) return data
+  const d = decode(data instanceof ArrayBuffer ? new Uint8Array(data) : data)
+  if(!d || typeof d !== 'object') return d
+  if(d.players) d.players = d.players.map(expandEntity)
+  if(d.monsters) d.monsters = d.monsters.map(expandEntity)
+  if(d.map) d.map = unpackMap(d.map)
+  return d
+}
+
 // Safe socket helpers: avoid calling .on/.off/.emit when socket is not a valid object
+const _wireHandlers = new WeakMap()
 function safeOn(ev, handler){
-  try{ if(socket && typeof socket.on === 'function') socket.on(ev, handler) }catch(e){ console.warn('safeOn failed', e) }
+  try{
+    if(!socket || typeof socket.on !== 'function') return
+    if(WIRE_EVENTS.has(ev) && typeof handler === 'function'){
+      // decode binary payloads before the handler sees them
+      let wrapped = _wireHandlers.get(handler)
+      if(!wrapped){ wrapped = (data, ...rest) => handler(decodeWire(data), ...rest); _wireHandlers.set(handler, wrapped) }
+      socket.on(ev, wrapped)
+    } else socket.on(ev, handler)
+  }catch(e){ console.warn('safeOn failed', e) }
 }
 function safeOff(ev, handler){
-  try{ if(socket && typeof socket.off === 'function') socket.off(ev, handler) }catch(e){ console.warn('safeOff failed', e) }
+  try{
+    if(!socket || typeof socket.off !== 'function') return
+    if(handler && _wireHandlers.has(handler)) socket.off(ev, _wireHandlers.get(handler))
+    else socket.off(ev, handler)
+  }catch(e){ console.warn('safeOff failed', e) }
 }
 function safeEmit(...args){
   try{ if(socket && typeof socket.emit === 'function') socket.emit(...args) }catch(e){ console.warn('safeEmit failed', e) }
@@ -26,6 +98,113 @@ const TILE_SIZE = 48
 const VIEWPORT_TILES_X = 16
 const VIEWPORT_TILES_Y = 12
 
+// Map tiles arrive by chunk (`map_chunks` event near our player, or
+// /api/games/<id>/map/chunk/<cx>/<cy> for the others) and are kept here for
+// the map identified by (gameId, rev); states only carry `map_info`.
+const mapChunks = {gameId: null, rev: null, size: 16, byKey: new Map(), pending: new Set()}
+
+function resetChunks(gameId, info){
+  if(!info) return
+  if(mapChunks.gameId === gameId && mapChunks.rev === info.rev) return
+  mapChunks.gameId = gameId
+  mapChunks.rev = info.rev
+  mapChunks.size = info.chunk
+  mapChunks.byKey = new Map()
+  mapChunks.pending = new Set()
+}
+
+function storeChunks(gameId, info, chunks){
+  resetChunks(gameId, info)
+  for(const c of chunks || []){
+    const key = `${c.cx},${c.cy}`
+    const known = mapChunks.byKey.get(key)
+    if(!known || known.v <= c.v) mapChunks.byKey.set(key, c)
+    mapChunks.pending.delete(key)
+  }
+}
+
+// tile value at (x, y), undefined while its chunk has not arrived
+function tileAt(x, y){
+  const size = mapChunks.size
+  const c = mapChunks.byKey.get(`${Math.floor(x / size)},${Math.floor(y / size)}`)
+  if(!c) return undefined
+  return c.tiles[(y - c.y) * c.w + (x - c.x)]
+}
+
+async function fetchChunk(gameId, cx, cy){
+  const key = `${cx},${cy}`
+  if(mapChunks.pending.has(key)) return false
+  mapChunks.pending.add(key)
+  try{
+    const base = window.location.origin || 'http://localhost:5000'
+    const r = await fetch(`${base}/api/games/${gameId}/map/chunk/${cx}/${cy}`)
+    if(!r.ok) return false
+    const c = await r.json()
+    if(mapChunks.gameId === gameId && mapChunks.rev === c.map.rev) storeChunks(gameId, c.map, [c])
+    return true
+  }catch(e){
+    mapChunks.pending.delete(key)
+    return false
+  }
+}
+
+// top-left tile of the viewport: centered on the local player, clamped to the map
+function cameraOrigin(s, localId){
+  if(!s || !s.map_info) return {x: 0, y: 0}
+  const rows = s.map_info.h
+  const cols = s.map_info.w
+  const me = (s.players || []).find(p => p.id === localId)
+  const cx = me ? me.position.x : 0
+  const cy = me ? me.position.y : 0
+  const clamp = (v, size, view) => Math.max(0, Math.min(v, size - view))
+  return {
+    x: clamp(cx - Math.floor(VIEWPORT_TILES_X / 2), cols, VIEWPORT_TILES_X),
+    y: clamp(cy - Math.floor(VIEWPORT_TILES_Y / 2), rows, VIEWPORT_TILES_Y),
+  }
+}
+// number of log entries kept client-side
+const LOG_TAIL = 50
+
+// merge changed entities (by id) into the previous list, keeping order
+function mergeEntities(prev, changed){
+  if(!changed || changed.length === 0) return prev || []
+  const byId = {}
+  for(const e of changed) byId[e.id] = e
+  const out = (prev || []).map(e => {
+    if(byId[e.id]){ const n = byId[e.id]; delete byId[e.id]; return n }
+    return e
+  })
+  for(const id of Object.keys(byId)) out.push(byId[id])
+  return out
+}
+
+// apply a server `state_delta` patch; returns null when the patch does not
+// cover our revision (caller must then ask the server to resync). A patch from
+// an older base is a superset of what we lack (spectator frames after a newer
+// snapshot): entities are replaced whole, log entries we have are skipped.
+function applyDelta(s, d){
+  if(!s || !d || s.id !== d.id || d.base_rev > s.rev || d.rev < s.rev) return null
+  const next = {...s, rev: d.rev, status: d.status, current_turn: d.current_turn}
+  next.players = mergeEntities(s.players, d.players)
+  next.monsters = mergeEntities(s.monsters, d.monsters)
+  // `hidden`: entities that left our view (fog of war), gone until they come back into it
+  const dropped = (d.removed || []).concat(d.hidden || [])
+  if(dropped.length){
+    const gone = new Set(dropped)
+    next.players = next.players.filter(e => !gone.has(e.id))
+    next.monsters = next.monsters.filter(e => !gone.has(e.id))
+  }
+  if(d.turn_queue) next.turn_queue = d.turn_queue
+  if(d.map_info) next.map_info = d.map_info
+  const log = (d.log || []).filter(e => !(e.rev <= s.rev))
+  if(log.length){
+    // keep only a bounded tail; older entries are paged from /api/games/<id>/log
+    next.log = (s.log || []).concat(log).slice(-LOG_TAIL)
+    next.log_seq = log[log.length - 1].seq
+  }
+  return next
+}
+
 function makeTexture(color){
   const canvas = document.createElement('canvas')
   canvas.width = TILE_SIZE
@@ -42,10 +221,14 @@ function makeTexture(color){
 export default function App(){
   const [connected, setConnected] = useState(false)
   const [state, setState] = useState(null)
+  // bumped when map chunks arrive so the canvas is redrawn
+  const [mapVersion, setMapVersion] = useState(0)
   const [player, setPlayer] = useState(null)
   const [joined, setJoined] = useState(false)
   const [hasStoredPlayer, setHasStoredPlayer] = useState(false)
   const [gamesExist, setGamesExist] = useState(false)
+  // read-only watch mode (`spectate`): {gameId, encoding, fps} once the server accepted
+  const [spectating, setSpectating] = useState(null)
   // notification messages (toasts) from server action_result / action_error
   const [messages, setMessages] = useState([])
   const canvasRef = useRef(null)
@@ -53,6 +236,9 @@ export default function App(){
   const scaleRef = useRef(1)
   const animRef = useRef(null)
   const spriteClickRef = useRef(false)
+  const cameraRef = useRef({x: 0, y: 0})
+  // latest applied state, readable from socket handlers without re-subscribing
+  const stateRef = useRef(null)
 
   function pushMessage(text, level='info', ttl = 4000){
     const id = Date.now().toString(36) + Math.random().toString(36).slice(2,8)
@@ -76,6 +262,7 @@ export default function App(){
 
   // helper to safely send actions only for the local browser's player
   function sendAction(action, gameIdOverride){
+    if(spectating) return
     const localId = getLocalPlayerId()
     const gid = gameIdOverride || (state && state.id) || (player && player.gameId)
     if(!localId || !gid) return
@@ -113,7 +300,7 @@ export default function App(){
               }
             }catch(e){/* ignore fetch errors and attempt join */}
             console.log('attempting automatic rejoin', storedGameId, storedPlayerId)
-            safeEmit('join', {gameId: storedGameId, playerId: storedPlayerId}, (resp) => {
+            safeEmit('join', {gameId: storedGameId, playerId: storedPlayerId, encoding: WIRE_ENCODING}, (resp) => {
               if(resp && resp.error){
                 console.warn('rejoin ack error', resp)
                 const errMsg = String(resp.error || resp.message || '')
@@ -133,7 +320,20 @@ export default function App(){
       }catch(e){ console.warn('automatic rejoin failed', e) }
     })
     safeOn('connected', d=> console.log('server', d))
-    safeOn('state_update', s=> setState(s))
+    safeOn('state_update', s=> { stateRef.current = s; setState(s) })
+    const _onStateDelta = (d) => {
+      if(!d) return
+      const cur = stateRef.current
+      const next = applyDelta(cur, d)
+      if(next){
+        stateRef.current = next
+        setState(next)
+      } else if(!cur || cur.id === d.id){
+        // missed a revision (or no snapshot yet): ask for what we lack
+        safeEmit('sync', {gameId: d.id, rev: cur ? cur.rev : null})
+      }
+    }
+    safeOn('state_delta', _onStateDelta)
     // display human messages sent by server after actions
     const _onActionResult = (res) => {
       try{
@@ -149,6 +349,14 @@ export default function App(){
     }
     safeOn('action_result', _onActionResult)
     safeOn('action_error', _onActionError)
+    const _onMapChunks = (d) => {
+      if(!d || !d.chunks) return
+      storeChunks(d.gameId, d.map, d.chunks)
+      setMapVersion(v => v + 1)
+    }
+    safeOn('map_chunks', _onMapChunks)
+    const _onSpectating = (d) => { console.log('spectating', d); setSpectating(d) }
+    safeOn('spectating', _onSpectating)
 
     safeOn('joined', d=> {
       console.log('joined', d)
@@ -165,8 +373,11 @@ export default function App(){
       safeOff('connect')
       safeOff('connected')
       safeOff('state_update')
+      safeOff('state_delta', _onStateDelta)
       safeOff('action_result', _onActionResult)
       safeOff('action_error', _onActionError)
+      safeOff('map_chunks', _onMapChunks)
+      safeOff('spectating', _onSpectating)
       safeOff('joined')
     }
   }, [])
@@ -283,12 +494,27 @@ export default function App(){
       tilesContainer.removeChildren()
       entitiesContainer.removeChildren()
       hudContainer.removeChildren()
-      if(!s || !s.map) return
-      const rows = s.map.length
-      const cols = s.map[0].length
-      for(let y=0;y<rows;y++){
-        for(let x=0;x<cols;x++){
-          const tile = s.map[y][x]
+      if(!s || !s.map_info) return
+      resetChunks(s.id, s.map_info)
+      const rows = s.map_info.h
+      const cols = s.map_info.w
+      // maps can be larger than the viewport: draw only the visible tiles and
+      // shift tiles and entities by the camera
+      // spectators follow the entity whose turn it is
+      const cam = cameraOrigin(s, player ? player.playerId : s.current_turn)
+      cameraRef.current = cam
+      tilesContainer.x = entitiesContainer.x = -cam.x * TILE_SIZE
+      tilesContainer.y = entitiesContainer.y = -cam.y * TILE_SIZE
+      const missing = new Set()
+      const me = (s.players || []).find(p => player && p.id === player.playerId)
+      const fog = (s.view_radius && me) ? {x: me.position.x, y: me.position.y, r: s.view_radius} : null
+      for(let y=cam.y;y<Math.min(rows, cam.y + VIEWPORT_TILES_Y);y++){
+        for(let x=cam.x;x<Math.min(cols, cam.x + VIEWPORT_TILES_X);x++){
+          const tile = tileAt(x, y)
+          if(tile === undefined){
+            missing.add(`${Math.floor(x / mapChunks.size)},${Math.floor(y / mapChunks.size)}`)
+            continue
+          }
           const tex = tile === 1 ? textures.wall : textures.floor
           const spr = new PIXI.Sprite(tex)
           // draw in logical coordinates; stage.scale handles visual scaling
@@ -296,9 +522,16 @@ export default function App(){
           spr.y = y * TILE_SIZE
           spr.width = TILE_SIZE
           spr.height = TILE_SIZE
+          // fog of war: dim the tiles beyond our view radius
+          if(fog && (x - fog.x) * (x - fog.x) + (y - fog.y) * (y - fog.y) > fog.r * fog.r) spr.alpha = 0.4
           tilesContainer.addChild(spr)
         }
       }
+      // visible chunks not pushed by the server (e.g. far from our player): fetch them
+      for(const key of missing){
+        const [cx, cy] = key.split(',').map(Number)
+        fetchChunk(s.id, cx, cy).then(ok => { if(ok) setMapVersion(v => v + 1) })
+      }
       for(const p of s.players || []){
         const tex = getPlayerTexture(p.color)
         const spr = new PIXI.Sprite(tex)
@@ -405,8 +638,8 @@ export default function App(){
       // convert visual pixels back to logical pixels
       const logicalX = x / scale
       const logicalY = y / scale
-      const gridX = Math.floor(logicalX / TILE_SIZE)
-      const gridY = Math.floor(logicalY / TILE_SIZE)
+      const gridX = Math.floor(logicalX / TILE_SIZE) + cameraRef.current.x
+      const gridY = Math.floor(logicalY / TILE_SIZE) + cameraRef.current.y
       sendAction({type: 'move', x: gridX, y: gridY})
     })
 
@@ -418,7 +651,7 @@ export default function App(){
       appRef.current = null
     }
   // eslint-disable-next-line react-hooks/exhaustive-deps
-  }, [player, state])
+  }, [player, state, mapVersion])
 
   function clearStoredPlayer(){
     try{
@@ -432,6 +665,7 @@ export default function App(){
 
   const join = async ()=>{
     console.log('join() clicked')
+    if(spectating){ safeEmit('unspectate', {}); setSpectating(null) }
     try{
       // If this browser already has a stored playerId, try to rejoin that player instead
       try{
@@ -452,7 +686,7 @@ export default function App(){
               } else {
                 console.log('reusing stored player', storedGameId, storedPlayerId)
                 // try socket join; if server refuses, the ack handler will clear storage for player_already
-                safeEmit('join', {gameId: storedGameId, playerId: storedPlayerId}, (resp) => {
+                safeEmit('join', {gameId: storedGameId, playerId: storedPlayerId, encoding: WIRE_ENCODING}, (resp) => {
                   if(resp && resp.error){
                     console.warn('join ack error', resp)
                     const errMsg = String(resp.error || resp.message || '')
@@ -486,7 +720,8 @@ export default function App(){
             if(!r.ok) throw new Error('join REST failed: ' + r.status)
             const pj = await r.json()
             console.log('joined existing game via REST', pj)
-            safeEmit('join', {gameId: targetGameId, playerId: pj.playerId})
+            routeSocket(targetGameId)
+            safeEmit('join', {gameId: targetGameId, playerId: pj.playerId, encoding: WIRE_ENCODING})
             return
           }
         }
@@ -498,13 +733,42 @@ export default function App(){
       if(!r.ok) throw new Error('join REST failed: ' + r.status)
       const pj = await r.json()
       console.log('created and joined via REST', pj)
-      safeEmit('join', {gameId: newGame.gameId, playerId: pj.playerId})
+      routeSocket(newGame.gameId)
+      safeEmit('join', {gameId: newGame.gameId, playerId: pj.playerId, encoding: WIRE_ENCODING})
     }catch(err){
       console.error('join error', err)
       try{ alert('Join failed: ' + (err && err.message ? err.message : String(err))) }catch(e){}
     }
   }
 
+  // watch the first listed game without joining it (no player, no actions)
+  const watch = async ()=>{
+    try{
+      const r = await fetch(`${window.location.origin}/api/games`)
+      if(!r.ok) throw new Error('games list failed: ' + r.status)
+      const list = await r.json()
+      if(!Array.isArray(list) || list.length === 0){
+        pushMessage('Aucune partie à regarder', 'error')
+        return
+      }
+      const gameId = list[0].gameId
+      routeSocket(gameId)
+      safeEmit('spectate', {gameId, encoding: WIRE_ENCODING}, (resp) => {
+        if(resp && resp.error) pushMessage(String(resp.error), 'error')
+      })
+    }catch(err){
+      console.error('watch error', err)
+      pushMessage('Impossible de regarder : ' + (err && err.message ? err.message : String(err)), 'error')
+    }
+  }
+
+  const stopWatching = ()=>{
+    safeEmit('unspectate', {})
+    setSpectating(null)
+    stateRef.current = null
+    setState(null)
+  }
+
   return (
     <div style={{padding:20}}>
       <h1>FunGame (frontend) - PixiJS</h1>
@@ -512,6 +776,12 @@ export default function App(){
       <button disabled={joined || hasStoredPlayer} title={hasStoredPlayer ? 'Player already stored in this browser' : ''} onClick={join}>
         {joined ? 'Joined' : (hasStoredPlayer ? 'Stored player' : (gamesExist ? 'Join Game' : 'Create Game'))}
       </button>
+      {!joined && (spectating ? (
+        <button style={{marginLeft:12}} onClick={stopWatching}>Stop watching</button>
+      ) : (
+        <button style={{marginLeft:12}} disabled={!gamesExist} onClick={watch}>Watch</button>
+      ))}
+      {spectating && <span style={{marginLeft:12}}>Spectating {spectating.gameId} (max {spectating.fps} fps)</span>}
       {/* Respawn button: show when local stored player exists and is dead */}
       {(() => {
         try{
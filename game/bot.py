@@ -1,8 +1,88 @@
-import threading
 import time
-import random
 import math
 from game.state import GameStore
+from game.scheduler import scheduler
+from game.pathfinding import PathFinder, UNREACHABLE
+from logger import get_logger
+
+log = get_logger('bot')
+
+
+# enemies (closest by Manhattan distance first) whose path length is compared
+TARGETS_CONSIDERED = 4
+# A* budget of one decision on big maps: farther targets are not chased
+SEARCH_NODES = 5000
+
+
+def choose_action(game, actor):
+    """Default bot policy: the action `actor` takes on its turn in `game`.
+
+    Attacks an adjacent alive entity if any, otherwise takes one step along a
+    shortest path toward the nearest alive entity (game.pathfinding),
+    otherwise moves to a random free adjacent tile, otherwise ends its turn.
+    Pure decision (no side effects besides drawing from the game's rng), so it
+    is also used by the headless simulator.
+    """
+    bx = actor.x
+    by = actor.y
+    # try to find adjacent player to attack (adjacency: 4-directional)
+    candidates = []
+    for eid in game.occupancy.adjacent(bx, by):
+        if eid != actor.id and (eid in game.players or eid in game.monsters):
+            candidates.append(eid)
+    if candidates:
+        return {'type': 'attack', 'targetId': game.rng.choice(candidates)}
+    step = _step_toward_nearest(game, actor)
+    if step is not None:
+        return {'type': 'move', 'x': step[0], 'y': step[1]}
+    return wander_action(game, actor)
+
+
+def _step_toward_nearest(game, actor):
+    finder = PathFinder.for_game(game)
+    bx = actor.x
+    by = actor.y
+    if finder is None or not finder.inside(bx, by):
+        return None
+    targets = [e for e in list(game.players.values()) + list(game.monsters.values())
+               if e.id != actor.id and getattr(e, 'hp', 0) > 0]
+    if not targets:
+        return None
+    targets.sort(key=lambda e: abs(e.x - bx) + abs(e.y - by))
+    target = targets[0]
+    # with distance fields, path lengths are lookups: pick the closest by path
+    # among the few closest by Manhattan (big maps just chase the latter)
+    if finder.uses_fields:
+        best = None
+        for e in targets[:TARGETS_CONSIDERED]:
+            d = finder.distance((bx, by), (e.x, e.y))
+            if d != UNREACHABLE and (best is None or d < best[0]):
+                best = (d, e)
+        if best is None:
+            return None
+        target = best[1]
+    return finder.next_step((bx, by), (target.x, target.y),
+                            is_blocked=lambda x, y: game.occupancy.is_occupied(x, y, ignore=actor.id),
+                            blocked=game.occupancy.tiles(), max_nodes=SEARCH_NODES)
+
+
+def wander_action(game, actor):
+    """Previous default policy: random free adjacent tile, else end the turn."""
+    bx = actor.x
+    by = actor.y
+    moves = [(0,1),(0,-1),(1,0),(-1,0)]
+    game.rng.shuffle(moves)
+    for dx, dy in moves:
+        nx = bx + dx
+        ny = by + dy
+        # stay on the map's floor tiles
+        if game.map and not game.map.passable(nx, ny):
+            continue
+        # check occupancy
+        if game.occupancy.is_occupied(nx, ny, ignore=actor.id):
+            continue
+        return {'type': 'move', 'x': nx, 'y': ny}
+    return {'type': 'end_turn'}
 
 
 class Bot:
@@ -13,9 +93,11 @@ class Bot:
     - If the game is in 'waiting' state, calls game.start() to roll initiative
     - When it's the bot's turn it will:
       - attempt to attack an adjacent alive player
+      - otherwise step along a shortest path toward the nearest entity
       - otherwise move to a random adjacent free tile
       - then end its turn
-    - Runs in a background thread with configurable think interval
+    - Driven by the shared BotScheduler: woken only when its turn comes,
+      it acts after a configurable think interval
     """
 
     def __init__(self, game_id, name='Computer', think_interval=1.0, color=None):
@@ -23,8 +105,6 @@ class Bot:
         self.name = name
         self.think_interval = think_interval
         self.color = color
-        self._stop = threading.Event()
-        self._thread = None
         self.player_id = None
 
     def start(self):
@@ -38,206 +118,108 @@ class Bot:
         self.player_id = player.id
         # mark connected
         GameStore.set_player_connected(self.game_id, self.player_id, True)
-        print(f"Bot {self.name} ({self.player_id}) added to game {self.game_id}")
+        log.info('bot added', game=self.game_id, bot=self.player_id, name=self.name)
+        # start the game or take a place in the running turn queue, serialized
+        # with the other mutations of the game
+        game.call(self._enter_game, game, player)
+        # hand the bot over to the shared scheduler (no thread per bot)
+        scheduler.register(self)
+        log.debug('bot registered', game=self.game_id, bot=self.player_id)
+        return self.player_id
+
+    def _enter_game(self, game, player):
+        # runs inside the game's command queue
         # if waiting, start the game (roll initiative)
         if game.status == 'waiting':
             try:
                 game.start()
-                print(f"Bot {self.player_id}: started game (rolled initiative). Queue={game.turn_queue}")
+                log.debug('bot started game', game=self.game_id, bot=self.player_id, queue=game.turn_queue)
             except Exception as e:
-                print(f"Bot {self.player_id}: failed to start game: {e}")
+                log.error('bot failed to start game', game=self.game_id, bot=self.player_id, error=str(e))
         else:
-            # If game already running, roll initiative for this new entity and insert into turn_queue
+            # If game already running, roll initiative for this new entity and take its rank in the turn order
             try:
-                # roll initiative for the new player
-                roll = random.randint(1, 20)
+                roll = game.rng.randint(1, 20)
                 player.initiative = roll
-                # build entries from all existing entities (players + monsters)
-                entries = []
-                for p in list(game.players.values()) + list(game.monsters.values()):
-                    # ensure initiative exists (default 0)
-                    iv = getattr(p, 'initiative', 0) or 0
-                    entries.append((iv, p.id))
-                # sort by initiative desc
-                entries.sort(reverse=True)
-                new_queue = [eid for (_, eid) in entries]
-                # preserve current_turn: rotate queue so previous current remains at head
-                prev_current = game.current_turn
-                if prev_current and prev_current in new_queue:
-                    # rotate until head == prev_current
-                    while new_queue and new_queue[0] != prev_current:
-                        new_queue.append(new_queue.pop(0))
-                game.turn_queue = new_queue
-                game.current_turn = game.turn_queue[0] if game.turn_queue else None
-                game.log.append({'event': 'initiative_add', 'entity': player.id, 'roll': roll, 'queue': game.turn_queue, 'time': time.time()})
-                print(f"Bot {self.player_id}: assigned initiative {roll}, new queue={game.turn_queue}")
+                game.touch(player)
+                # entities that joined the running game without a place (humans join
+                # outside the turn order) get theirs too, highest initiative first
+                missing = [p for p in list(game.players.values()) + list(game.monsters.values()) if p.id not in game.turns]
+                missing.sort(key=lambda p: getattr(p, 'initiative', 0) or 0, reverse=True)
+                for p in missing:
+                    game.engine.join_turn_order(p.id, p.initiative)
+                game.add_log({'event': 'initiative_add', 'entity': player.id, 'roll': roll, 'queue': game.turn_queue, 'time': time.time()})
+                log.debug('bot initiative', game=self.game_id, bot=self.player_id, roll=roll, queue=game.turn_queue)
             except Exception as e:
-                print(f"failed to assign initiative to bot {self.player_id} in game {self.game_id}: {e}")
-        # launch background thread
-        self._thread = threading.Thread(target=self._run_loop, daemon=True)
-        self._thread.start()
-        print(f"Bot {self.player_id}: background thread started")
-        return self.player_id
+                log.error('bot failed to get initiative', game=self.game_id, bot=self.player_id, error=str(e))
 
     def stop(self):
-        self._stop.set()
-        if self._thread:
-            self._thread.join(timeout=2)
-
-    def _run_loop(self):
-        game = GameStore.get_game(self.game_id)
-        if not game:
-            return
-        while not self._stop.is_set():
-            try:
-                # reload game reference each loop (store is in-memory)
-                game = GameStore.get_game(self.game_id)
-                if not game:
-                    break
-                # if game not running, just wait
-                if game.status != 'running':
-                    time.sleep(self.think_interval)
-                    continue
-
-                # --- sanitize turn queue: remove dead entities and ensure current_turn valid ---
-                try:
-                    # remove dead entities from turn_queue
-                    alive_ids = set()
-                    for p in list(game.players.values()) + list(game.monsters.values()):
-                        if getattr(p, 'hp', 0) > 0:
-                            alive_ids.add(p.id)
-                    # filter queue
-                    new_queue = [eid for eid in game.turn_queue if eid in alive_ids]
-                    # if bot is alive and not present, keep it available
-                    if getattr(game.players.get(self.player_id) or game.monsters.get(self.player_id), 'hp', 0) > 0:
-                        if self.player_id not in new_queue:
-                            new_queue.append(self.player_id)
-                    game.turn_queue = new_queue
-                    # ensure current_turn is valid
-                    if not game.turn_queue:
-                        game.current_turn = None
-                    else:
-                        if game.current_turn not in game.turn_queue:
-                            # set to head or None
-                            game.current_turn = game.turn_queue[0]
-                except Exception as _:
-                    pass
-
-                # if there are no alive opponents (only bot alive or none), make sure bot can act
-                bot_actor = game.players.get(self.player_id) or game.monsters.get(self.player_id)
-                if bot_actor and getattr(bot_actor, 'hp', 0) > 0:
-                    # count alive non-bot entities
-                    alive_non_bot = [p for p in list(game.players.values()) + list(game.monsters.values()) if p.id != self.player_id and getattr(p, 'hp', 0) > 0]
-                    if not alive_non_bot:
-                        # ensure bot is in queue and set as current_turn so it can act
-                        if self.player_id not in game.turn_queue:
-                            game.turn_queue.append(self.player_id)
-                        if game.current_turn != self.player_id:
-                            game.current_turn = self.player_id
-
-                # if bot is dead or removed, break
-                bot_actor = game.players.get(self.player_id) or game.monsters.get(self.player_id)
-                if not bot_actor:
-                    break
-                if getattr(bot_actor, 'hp', 0) <= 0:
-                    # try to respawn
-                    print(f"Bot {self.player_id}: dead, attempting respawn")
-                    game.process_action(self.player_id, {'type': 'respawn'})
-                    time.sleep(self.think_interval)
-                    continue
-
-                # If it's not bot's turn, wait
-                if game.current_turn != self.player_id:
-                    # debug log occasionally to trace
-                    # print(f"Bot {self.player_id}: waiting, current_turn={game.current_turn}")
-                    time.sleep(self.think_interval)
-                    continue
-
-                # It's the bot's turn -> choose action
-                print(f"Bot {self.name}: it's my turn")
-                acted = False
-                # try to find adjacent player to attack
-                bx = bot_actor.position.get('x', 0)
-                by = bot_actor.position.get('y', 0)
-                candidates = []
-                for p in list(game.players.values()) + list(game.monsters.values()):
-                    if p.id == self.player_id:
-                        continue
-                    if getattr(p, 'hp', 0) <= 0:
-                        continue
-                    dx = abs(p.position.get('x', 0) - bx)
-                    dy = abs(p.position.get('y', 0) - by)
-                    # adjacency: 4-directional
-                    if (dx == 1 and dy == 0) or (dx == 0 and dy == 1):
-                        candidates.append(p)
-                if candidates:
-                    target = random.choice(candidates)
-                    print(f"Bot {self.name}: attacking target {target.id} at pos {target.position}")
-                    res = game.process_action(self.player_id, {'type': 'attack', 'targetId': target.id})
-                    acted = True
-                    if isinstance(res, dict) and res.get('error'):
-                        print(f"Bot {self.name}: attack error: {res}")
-                    else:
-                        print(f"Bot {self.name}: attack result: {res}")
-                else:
-                    # move to a random adjacent free tile within map
-                    moves = [(0,1),(0,-1),(1,0),(-1,0)]
-                    random.shuffle(moves)
-                    moved = False
-                    for dx, dy in moves:
-                        nx = bx + dx
-                        ny = by + dy
-                        # bounds check if map exists
-                        if game.map:
-                            if ny < 0 or ny >= len(game.map) or nx < 0 or nx >= len(game.map[0]):
-                                continue
-                        # check occupancy
-                        occupied = False
-                        for p in list(game.players.values()) + list(game.monsters.values()):
-                            if p.id == self.player_id:
-                                continue
-                            if getattr(p, 'hp', 1) <= 0:
-                                continue
-                            pos = p.position or {}
-                            if pos.get('x') == nx and pos.get('y') == ny:
-                                occupied = True
-                                break
-                        if occupied:
-                            continue
-                        # perform move
-                        print(f"Bot {self.name}: moving to {nx},{ny}")
-                        res = game.process_action(self.player_id, {'type': 'move', 'x': nx, 'y': ny})
-                        moved = True
-                        acted = True
-                        if isinstance(res, dict) and res.get('error'):
-                            print(f"Bot {self.name}: move error: {res}")
-                        else:
-                            print(f"Bot {self.name}: move result: {res}")
-                        break
-                # end turn if we acted (or even if not, to avoid stuck turns)
-                # If the action already advanced the turn (result contains 'next'), do not call end_turn again.
-                try:
-                    need_end_turn = True
-                    if 'res' in locals() and isinstance(res, dict) and res.get('next'):
-                        need_end_turn = False
-                    if acted:
-                        print(f"Bot {self.name}: ending turn (acted={acted}, need_end_turn={need_end_turn})")
-                        if need_end_turn:
-                            game.process_action(self.player_id, {'type': 'end_turn'})
-                    else:
-                        # if we didn't act, advance to avoid stuck turns
-                        print(f"Bot {self.name}: no action possible, advancing turn")
-                        game.process_action(self.player_id, {'type': 'end_turn'})
-                except Exception as e:
-                    print(f"Bot {self.name}: error ending/advancing turn: {e}")
-                # short sleep after action
-                time.sleep(self.think_interval)
-            except Exception as e:
-                # log the error to stdout to help debug
-                print(f"Bot error in game {self.game_id}: {e}")
-                time.sleep(self.think_interval)
+        scheduler.unregister(self.player_id)
         # cleanup
         try:
             GameStore.set_player_connected(self.game_id, self.player_id, False)
         except Exception:
             pass
+
+    def step(self):
+        """Take one decision for the bot (called by the scheduler when woken).
+
+        Returns True when the bot wants to be woken again after its think
+        interval (e.g. it is still its turn), False to wait for the next
+        turn-change event.
+        """
+        # reload game reference (store is in-memory)
+        game = GameStore.get_game(self.game_id)
+        if not game:
+            self.stop()
+            return False
+        # decide and act as one command so no human action interleaves
+        return game.call(self._step, game)
+
+    def _step(self, game):
+        # if game not running, wait until initiative is rolled
+        if game.status != 'running':
+            return False
+        try:
+            # dead entities leave the turn order when they die (Engine.remove_entity) and
+            # come back on respawn: only make sure a living bot has its place
+            bot_actor = game.players.get(self.player_id) or game.monsters.get(self.player_id)
+            if bot_actor and getattr(bot_actor, 'hp', 0) > 0:
+                if self.player_id not in game.turns:
+                    game.engine.join_turn_order(self.player_id, bot_actor.initiative)
+                # no alive opponent left: take the turn so the bot can act
+                alive_non_bot = any(p.id != self.player_id and getattr(p, 'hp', 0) > 0
+                                    for p in list(game.players.values()) + list(game.monsters.values()))
+                if not alive_non_bot:
+                    game.engine.set_turn(self.player_id)
+
+            # if bot is removed, stop managing it; if dead, respawn
+            bot_actor = game.players.get(self.player_id) or game.monsters.get(self.player_id)
+            if not bot_actor:
+                self.stop()
+                return False
+            if getattr(bot_actor, 'hp', 0) <= 0:
+                # try to respawn; the scheduler wakes us again when our turn comes
+                log.debug('bot respawn', game=self.game_id, bot=self.player_id)
+                res = game.process_action(self.player_id, {'type': 'respawn'})
+                return isinstance(res, dict) and bool(res.get('error'))
+
+            # If it's not bot's turn, wait to be woken by the scheduler
+            if game.current_turn != self.player_id:
+                return False
+
+            # It's the bot's turn -> choose action
+            action = choose_action(game, bot_actor)
+            acted = action['type'] != 'end_turn'
+            res = game.process_action(self.player_id, action)
+            log.debug('bot action', game=self.game_id, bot=self.player_id, action=action, result=res)
+            # when nothing was possible the policy already ended the turn.
+            # If the action already advanced the turn (result contains 'next'), do not call end_turn again.
+            try:
+                if acted and not (isinstance(res, dict) and res.get('next')):
+                    game.process_action(self.player_id, {'type': 'end_turn'})
+            except Exception as e:
+                log.error('bot failed to end turn', game=self.game_id, bot=self.player_id, error=str(e))
+        except Exception as e:
+            log.exception('bot error', game=self.game_id, bot=self.player_id)
+        return game.current_turn == self.player_id
@@ -0,0 +1,246 @@
+"""Clustered mode: games partitioned across several server processes.
+
+Each process (one eventlet worker) owns a slice of the games. Its index and
+the cluster size come from the environment:
+
+- ``FUNGAME_WORKERS``: number of workers (default 1 = no clustering);
+- ``FUNGAME_WORKER_INDEX``: this worker's index, 0 .. FUNGAME_WORKERS-1;
+- ``FUNGAME_BUS``: message bus between workers, ``unix:<dir>`` (default
+  ``unix:/tmp/fungame-bus``, one datagram socket per worker) or ``local``
+  (in-process, for tests and scripts running several servers in one process).
+
+In clustered mode game ids carry their owner as a prefix (``"2-9f1c..."``) so
+a sticky router (see ``deploy/nginx.cluster.conf``) can send every REST call
+and every Socket.IO connection for a game to the worker that holds it. Ids
+without a prefix (single-worker games, old snapshots) belong to worker 0.
+
+Socket.IO emits go through `ClusterManager`: emits to a game room owned by
+this worker stay local (affinity guarantees its clients are here), anything
+else (broadcasts, other workers' rooms, unknown sids) is published on the bus.
+Workers also announce their games on the bus every `ANNOUNCE_INTERVAL`
+seconds so `GameStore.list_games()` can list the whole cluster.
+"""
+import os
+import pickle
+import queue
+import socket
+import time
+
+from socketio.base_manager import BaseManager
+from socketio.pubsub_manager import PubSubManager
+
+from logger import get_logger
+
+log = get_logger('cluster')
+
+WORKER_COUNT = max(1, int(os.environ.get('FUNGAME_WORKERS', '1') or 1))
+WORKER_INDEX = int(os.environ.get('FUNGAME_WORKER_INDEX', '0') or 0) % WORKER_COUNT
+BUS_URL = os.environ.get('FUNGAME_BUS', 'unix:/tmp/fungame-bus')
+ANNOUNCE_INTERVAL = float(os.environ.get('FUNGAME_CLUSTER_ANNOUNCE', '2.0'))
+# a worker that missed this many announces is considered gone
+ANNOUNCE_TTL = 3 * ANNOUNCE_INTERVAL
+# bus messages that are ours, not python-socketio's
+GAMES_METHOD = 'fungame.games'
+
+# worker index -> (monotonic time received, [GameSummary])
+_directory = {}
+
+
+def enabled():
+    return WORKER_COUNT > 1
+
+
+def game_id(raw_id):
+    """Id for a game created by this worker (prefixed with its index in clustered mode)."""
+    return f'{WORKER_INDEX}-{raw_id}' if enabled() else raw_id
+
+
+def owner_of(game_id):
+    head, sep, _ = (game_id or '').partition('-')
+    if sep and head.isdigit():
+        return int(head) % WORKER_COUNT
+    return 0
+
+
+def is_local(game_id):
+    return owner_of(game_id) == WORKER_INDEX
+
+
+class GameSummary:
+    """What list_games() knows about a game held by another worker."""
+
+    __slots__ = ('id', 'name', 'status', 'worker')
+
+    def __init__(self, id, name, status, worker):
+        self.id = id
+        self.name = name
+        self.status = status
+        self.worker = worker
+
+
+def remote_games():
+    now = time.monotonic()
+    games = []
+    for worker, (seen, summaries) in list(_directory.items()):
+        if worker == WORKER_INDEX:
+            continue
+        if now - seen > ANNOUNCE_TTL:
+            _directory.pop(worker, None)
+            continue
+        games.extend(summaries)
+    return games
+
+
+def _record_announce(message, own=WORKER_INDEX):
+    worker = message.get('worker')
+    if worker is None or worker == own:
+        return
+    summaries = [GameSummary(gid, name, status, worker) for gid, name, status in message.get('games', ())]
+    _directory[worker] = (time.monotonic(), summaries)
+
+
+# --- buses: publish(dict) to every worker (including ourselves), listen() -> iterator of dicts ---
+
+class LocalBus:
+    """In-process bus: every subscriber gets every message."""
+
+    def __init__(self):
+        self._subscribers = []
+
+    def publish(self, message):
+        for q in list(self._subscribers):
+            q.put(message)
+
+    def listen(self):
+        q = queue.Queue()
+        self._subscribers.append(q)
+        while True:
+            yield q.get()
+
+
+class UnixBus:
+    """One datagram socket per worker in `directory`; publish sends to all of them.
+
+    Messages are pickled; a datagram is limited by the socket buffers
+    (net.core.wmem_max, ~200KB by default), larger messages are dropped and
+    logged. Peers that are not running are skipped.
+    """
+
+    def __init__(self, directory, index=None, count=None):
+        self.directory = directory
+        self.index = WORKER_INDEX if index is None else index
+        self.count = WORKER_COUNT if count is None else count
+        os.makedirs(directory, exist_ok=True)
+        self._out = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+
+    def path(self, index):
+        return os.path.join(self.directory, f'worker-{index}.sock')
+
+    def publish(self, message):
+        data = pickle.dumps(message)
+        for index in range(self.count):
+            try:
+                self._out.sendto(data, self.path(index))
+            except (FileNotFoundError, ConnectionRefusedError):
+                pass
+            except OSError as e:
+                log.warning('bus send failed', worker=index, size=len(data), error=str(e))
+
+    def listen(self):
+        path = self.path(self.index)
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        sock.bind(path)
+        while True:
+            data = sock.recv(1 << 20)
+            try:
+                yield pickle.loads(data)
+            except Exception:
+                log.warning('bad bus message', size=len(data))
+
+
+def bus_from_url(url=None):
+    url = url or BUS_URL
+    if url == 'local':
+        return LocalBus()
+    if url.startswith('unix:'):
+        return UnixBus(url[len('unix:'):])
+    raise ValueError(f'unsupported FUNGAME_BUS: {url}')
+
+
+class ClusterManager(PubSubManager):
+    """python-socketio client manager relaying emits between workers over a bus."""
+
+    name = 'fungame-cluster'
+
+    def __init__(self, bus, worker=None, channel='socketio', write_only=False, logger=None):
+        super().__init__(channel=channel, write_only=write_only, logger=logger)
+        self.bus = bus
+        self.worker = WORKER_INDEX if worker is None else worker
+
+    def _is_local_room(self, room, namespace):
+        if room is None:
+            return False
+        if isinstance(room, str) and self.is_connected(room, namespace or '/'):
+            return True
+        # game rooms (and their '#bin' twins) of games this worker owns
+        return enabled() and isinstance(room, str) and owner_of(room.split('#', 1)[0]) == self.worker
+
+    def emit(self, event, data, namespace=None, room=None, skip_sid=None, callback=None, **kwargs):
+        if kwargs.get('ignore_queue') or self._is_local_room(room, namespace):
+            return BaseManager.emit(self, event, data, namespace=namespace, room=room, skip_sid=skip_sid,
+                                    callback=callback)
+        return super().emit(event, data, namespace=namespace, room=room, skip_sid=skip_sid, callback=callback,
+                            **kwargs)
+
+    def announce(self, games):
+        self.bus.publish({'method': GAMES_METHOD, 'worker': self.worker,
+                          'games': [(g.id, g.name, g.status) for g in games]})
+
+    def _publish(self, data):
+        self.bus.publish(data)
+
+    def _listen(self):
+        for message in self.bus.listen():
+            if isinstance(message, dict) and message.get('method') == GAMES_METHOD:
+                _record_announce(message, self.worker)
+                continue
+            yield message
+
+
+_manager = None
+
+
+def client_manager(bus=None):
+    """ClusterManager for SocketIO(client_manager=...), or None when not clustered."""
+    global _manager
+    if not enabled() and bus is None:
+        return None
+    _manager = ClusterManager(bus or bus_from_url())
+    return _manager
+
+
+def start(sio, list_local_games):
+    """Start listening to the bus and announce this worker's games until the process exits."""
+    if _manager is None:
+        return None
+    import socketio_instance
+    # python-socketio only starts the manager (hence the bus listener) on the
+    # first client connection; a worker must hear the others before that
+    server = getattr(sio, 'server', None)
+    if server is not None and not server.manager_initialized:
+        server.manager_initialized = True
+        _manager.initialize()
+
+    def _announce_loop():
+        while True:
+            try:
+                _manager.announce(list_local_games())
+            except Exception as e:
+                log.warning('announce failed', error=str(e))
+            time.sleep(ANNOUNCE_INTERVAL)
+    log.info('cluster worker started', worker=WORKER_INDEX, workers=WORKER_COUNT, bus=BUS_URL)
+    return socketio_instance.start_background_task(_announce_loop)
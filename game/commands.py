@@ -0,0 +1,89 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+import metrics
+import socketio_instance as _si
+
+
+class CommandQueue:
+    """Single-writer command queue for one game.
+
+    Every mutation of a game (actions, joins, connection flags, bot turns) is
+    submitted as a command and applied strictly one at a time, so socket
+    handlers, REST requests and bots never interleave inside the game state.
+
+    There is no dedicated thread per game: the first caller that finds the
+    queue idle becomes the executor and drains it (including commands queued
+    meanwhile by other callers), the others just wait on their Future. A
+    command that submits to its own game again is run inline to avoid
+    deadlocking on itself. `post` never drains in the caller: a background
+    task does when the queue is idle, for callers that must not run game
+    work themselves (timer wheel, spectator frames).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._queue = deque()
+        self._draining = False
+        self._owner = None
+
+    def submit(self, fn, *args, **kwargs):
+        """Queue `fn(*args, **kwargs)` and return a Future with its result."""
+        fut = Future()
+        if self._owner is not None and self._owner == threading.get_ident():
+            # re-entrant call from the command being executed
+            self._run(fut, fn, args, kwargs)
+            return fut
+        with self._lock:
+            self._queue.append((fut, fn, args, kwargs, time.perf_counter()))
+            if self._draining:
+                return fut
+            self._draining = True
+            self._owner = threading.get_ident()
+        self._drain()
+        return fut
+
+    def post(self, fn, *args, **kwargs):
+        """Like submit, but `fn` never runs in the caller (a background task drains an idle queue)."""
+        fut = Future()
+        with self._lock:
+            self._queue.append((fut, fn, args, kwargs, time.perf_counter()))
+            if self._draining:
+                return fut
+            self._draining = True
+        _si.start_background_task(self._drain_posted)
+        return fut
+
+    def _drain_posted(self):
+        with self._lock:
+            self._owner = threading.get_ident()
+        self._drain()
+
+    def call(self, fn, *args, **kwargs):
+        """Run `fn` through the queue and wait for its result (re-raises errors)."""
+        return self.submit(fn, *args, **kwargs).result()
+
+    @staticmethod
+    def _run(fut, fn, args, kwargs):
+        if not fut.set_running_or_notify_cancel():
+            return
+        try:
+            fut.set_result(fn(*args, **kwargs))
+        except BaseException as e:
+            fut.set_exception(e)
+
+    def _drain(self):
+        while True:
+            with self._lock:
+                if not self._queue:
+                    self._owner = None
+                    self._draining = False
+                    return
+                fut, fn, args, kwargs, queued = self._queue.popleft()
+            metrics.COMMAND_WAIT.observe(time.perf_counter() - queued)
+            self._run(fut, fn, args, kwargs)
+
+    def __len__(self):
+        return len(self._queue)
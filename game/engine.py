@@ -1,11 +1,32 @@
-import random
 import time
 
+from game.timers import turn_timers
+
+
 class Engine:
     """Simple turn engine: computes initiative and advances turns."""
 
+    # callables invoked as listener(event, game_state, entity_id) for every game:
+    # 'turn' when current_turn changes (entity_id = new current turn) and
+    # 'removed' when an entity leaves the turn queue. Used by the bot scheduler.
+    listeners = []
+
     def __init__(self, game_state):
         self.game_state = game_state
+        # bumped on every turn change: a deadline only expires the turn that armed it
+        self.turn_seq = 0
+
+    def _notify(self, event, entity_id):
+        for listener in list(Engine.listeners):
+            try:
+                listener(event, self.game_state, entity_id)
+            except Exception:
+                pass
+
+    def notify_turn(self):
+        """Tell listeners whose turn it is (call after setting current_turn directly)."""
+        self.arm_turn_timer()
+        self._notify('turn', self.game_state.current_turn)
 
     def _name_for(self, entity_id):
         # helper to get a readable name for an id
@@ -18,40 +39,113 @@ class Engine:
         entries = []
         for p in list(self.game_state.players.values()) + list(self.game_state.monsters.values()):
             # d20 roll
-            roll = random.randint(1, 20)
+            roll = self.game_state.rng.randint(1, 20)
             # store initiative value on entity
             p.initiative = roll
             entries.append((roll, p.id))
         # sort by initiative desc, tie-break by insertion order
-        entries.sort(reverse=True)
-        # store as queue of ids
-        queue_ids = [eid for (_, eid) in entries]
-        self.game_state.turn_queue = queue_ids
-        self.game_state.current_turn = self.game_state.turn_queue[0] if self.game_state.turn_queue else None
+        entries.sort(key=lambda e: e[0], reverse=True)
+        self.game_state.turns.reset(entries)
+        queue_ids = self.game_state.turns.ids()
+        self.game_state.current_turn = self.game_state.turns.current
+        self.game_state.touch(*list(self.game_state.players.values()) + list(self.game_state.monsters.values()))
+        self.game_state.touch_queue()
         # build readable queue names for logging
         queue_names = [self._name_for(eid) for eid in queue_ids]
-        self.game_state.log.append({'event': 'initiative_roll', 'queue_ids': queue_ids, 'queue_names': queue_names, 'time': time.time()})
+        self.game_state.add_log({'event': 'initiative_roll', 'queue_ids': queue_ids, 'queue_names': queue_names, 'time': time.time()})
+        self.notify_turn()
+
+    def _turn_changed(self):
+        # current_turn moved along the ring: log it with a readable name and tell listeners
+        current_name = self._name_for(self.game_state.current_turn)
+        self.game_state.add_log({'event': 'advance_turn', 'current': self.game_state.current_turn, 'current_name': current_name, 'time': time.time()})
+        self.notify_turn()
 
     def advance_turn(self):
-        """Rotate to next entity in the queue."""
-        if not self.game_state.turn_queue:
-            self.game_state.current_turn = None
+        """Pass the turn to the next entity of the ring (O(1))."""
+        g = self.game_state
+        turns = g.turns
+        if not turns:
+            if g.current_turn is not None:
+                g.current_turn = None
+                g.touch_queue()
             return None
-        # pop first and append to end
-        first = self.game_state.turn_queue.pop(0)
-        self.game_state.turn_queue.append(first)
-        self.game_state.current_turn = self.game_state.turn_queue[0]
-        # include readable name for current turn
-        current_name = self._name_for(self.game_state.current_turn)
-        self.game_state.log.append({'event': 'advance_turn', 'current': self.game_state.current_turn, 'current_name': current_name, 'time': time.time()})
-        return self.game_state.current_turn
+        # current_turn may have been set directly: continue from there
+        if g.current_turn != turns.current:
+            turns.set_current(g.current_turn)
+        g.current_turn = turns.advance()
+        g.touch_queue()
+        self._turn_changed()
+        return g.current_turn
+
+    def join_turn_order(self, entity_id, initiative):
+        """Insert an entity at its initiative rank (O(n) memmove, see TurnOrder); it gets the turn if nobody has it."""
+        g = self.game_state
+        if not g.turns.add(entity_id, initiative):
+            return False
+        g.touch_queue()
+        if g.current_turn is None or g.current_turn not in g.turns:
+            g.turns.set_current(entity_id)
+            g.current_turn = entity_id
+            self.notify_turn()
+        return True
+
+    def set_turn(self, entity_id):
+        """Give the turn to `entity_id`, adding it to the ring if needed."""
+        g = self.game_state
+        if entity_id not in g.turns:
+            ent = g.players.get(entity_id) or g.monsters.get(entity_id)
+            g.turns.add(entity_id, getattr(ent, 'initiative', 0))
+        if g.current_turn == entity_id:
+            return False
+        g.turns.set_current(entity_id)
+        g.current_turn = entity_id
+        g.touch_queue()
+        self.notify_turn()
+        return True
 
     def remove_entity(self, entity_id):
-        # remove from queue if present
-        if entity_id in self.game_state.turn_queue:
-            self.game_state.turn_queue = [e for e in self.game_state.turn_queue if e != entity_id]
-            if self.game_state.current_turn == entity_id:
-                # advance if removed current
-                self.advance_turn()
-
-    # placeholder for more engine features (timeouts, AP refresh, etc.)
+        # O(1) unlink; the next entity takes the turn if it was the removed one's
+        g = self.game_state
+        if g.turns.remove(entity_id):
+            g.touch_queue()
+            if g.current_turn == entity_id:
+                g.current_turn = g.turns.current
+                if g.current_turn is not None:
+                    self._turn_changed()
+        self._notify('removed', entity_id)
+
+    # --- turn deadlines (shared timer wheel, see game.timers) ---
+
+    def arm_turn_timer(self):
+        """Start the current turn's deadline, replacing the previous one.
+
+        A game with a `turn_budget` (seconds, 0 = none) skips any turn that
+        lasts longer than that.
+        """
+        g = self.game_state
+        self.turn_seq += 1
+        budget = getattr(g, 'turn_budget', 0) or 0
+        if budget > 0 and g.current_turn is not None and g.status == 'running':
+            turn_timers.schedule(g.id, budget, self._turn_expired, self.turn_seq)
+        else:
+            turn_timers.cancel(g.id)
+
+    def _turn_expired(self, seq):
+        # runs in the wheel's task: post the skip, a background task applies it in order
+        g = self.game_state
+        g.commands.post(g._run_command, self._skip_turn, (seq,), {}, None, {'type': 'turn_timeout'})
+
+    def _skip_turn(self, seq):
+        g = self.game_state
+        if seq != self.turn_seq or g.current_turn is None or g.status != 'running':
+            # the turn ended in time
+            return None
+        base = g.revision
+        timed_out = g.current_turn
+        g.add_log({'event': 'turn_timeout', 'entity': timed_out, 'name': self._name_for(timed_out), 'time': time.time()})
+        next_entity = self.advance_turn()
+        g.emit_about('turn_timeout', {'gameId': g.id, 'playerId': timed_out, 'next': next_entity},
+                     keys=('playerId', 'next'))
+        g._broadcast(base)
+        return next_entity
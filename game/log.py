@@ -0,0 +1,78 @@
+import os
+
+# default number of entries kept per game (older entries are dropped)
+DEFAULT_CAPACITY = int(os.environ.get('FUNGAME_LOG_CAPACITY', '1000'))
+
+
+class GameLog:
+    """Fixed-capacity ring buffer of game events.
+
+    Every appended entry gets a monotonically increasing `seq` (starting at 1).
+    Once the buffer is full the oldest entries are overwritten, so memory stays
+    bounded however long the game runs; `first_seq`/`last_seq` tell which
+    sequence numbers are still available.
+    """
+
+    def __init__(self, capacity=None):
+        self.capacity = max(1, int(capacity or DEFAULT_CAPACITY))
+        self._buf = [None] * self.capacity
+        self._size = 0
+        self.last_seq = 0
+
+    @property
+    def first_seq(self):
+        # seq of the oldest retained entry (last_seq + 1 when empty)
+        return self.last_seq - self._size + 1
+
+    def append(self, entry):
+        self.last_seq += 1
+        entry['seq'] = self.last_seq
+        self._buf[(self.last_seq - 1) % self.capacity] = entry
+        if self._size < self.capacity:
+            self._size += 1
+        return entry
+
+    def restore(self, entry):
+        """Re-append an entry that already has a `seq` (journal replay)."""
+        seq = entry.get('seq', 0)
+        if seq <= self.last_seq:
+            return None
+        if seq > self.last_seq + 1:
+            # entries in between are unknown: start the buffer over at `seq`
+            self.clear()
+            self.last_seq = seq - 1
+        return self.append(entry)
+
+    def since(self, after=0, limit=None):
+        """Return up to `limit` entries with seq > `after`, oldest first."""
+        start = max(int(after) + 1, self.first_seq)
+        end = self.last_seq
+        if limit is not None:
+            end = min(end, start + max(0, int(limit)) - 1)
+        return [self._buf[(s - 1) % self.capacity] for s in range(start, end + 1)]
+
+    def tail(self, n):
+        """Return the `n` most recent entries, oldest first."""
+        return self.since(self.last_seq - n)
+
+    def copy(self):
+        """Independent copy; entries are shared (they are not mutated once appended)."""
+        log = GameLog.__new__(GameLog)
+        log.__dict__.update(self.__dict__)
+        log._buf = list(self._buf)
+        return log
+
+    def clear(self):
+        # drop retained entries but keep the sequence monotonic
+        self._buf = [None] * self.capacity
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def __iter__(self):
+        return iter(self.since(0))
+
+    def __reversed__(self):
+        for s in range(self.last_seq, self.first_seq - 1, -1):
+            yield self._buf[(s - 1) % self.capacity]
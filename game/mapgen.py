@@ -0,0 +1,306 @@
+"""Seeded map generation and compact tile storage.
+
+A `TileMap` keeps one byte per tile in a flat row-major ``bytearray``
+(``tiles[y * width + x]``): a 1024x1024 map is 1 MiB, where nested lists of
+ints cost 8 bytes per tile for the pointers alone. ``game.map[y][x]`` and
+``len(game.map)`` still work (rows are ``bytes`` slices), so code written for
+nested lists keeps reading it.
+
+Styles:
+
+- ``arena``: open floor, spawns in the corners (the historical 16x12 map);
+- ``dungeon``: walls with rectangular rooms joined by corridors, one spawn
+  per room, spread so that the first players start far apart.
+
+The same (width, height, style, seed) always generates the same map.
+
+Maps are delivered to clients in `CHUNK_SIZE` x `CHUNK_SIZE` chunks (see
+`TileMap.chunk`), each with a version bumped whenever one of its tiles
+changes, so a client only fetches the chunks it has not seen yet.
+"""
+import random
+from array import array
+
+FLOOR = 0
+WALL = 1
+
+DEFAULT_WIDTH = 16
+DEFAULT_HEIGHT = 12
+MIN_SIZE = 8
+MAX_SIZE = 1024
+STYLES = ('arena', 'dungeon')
+DEFAULT_STYLE = 'arena'
+
+# dungeon rooms: side lengths and how many rooms per tile of map
+ROOM_MIN = 4
+ROOM_MAX = 12
+TILES_PER_ROOM = 150
+MAX_ROOMS = 4000
+# spawn points kept per map (rooms beyond that are not spawn candidates)
+MAX_SPAWNS = 64
+# side of a map chunk, in tiles
+CHUNK_SIZE = 16
+
+
+class TileMap:
+    __slots__ = ('width', 'height', 'tiles', 'spawns', 'chunk_versions', '_frozen')
+    # pickled slots (_frozen is a cache)
+    FIELDS = ('width', 'height', 'tiles', 'spawns', 'chunk_versions')
+
+    def __init__(self, width, height, tiles=None, spawns=()):
+        self.width = width
+        self.height = height
+        self.tiles = bytearray(width * height) if tiles is None else bytearray(tiles)
+        # preferred spawn tiles, best first
+        self.spawns = [tuple(s) for s in spawns]
+        # per-chunk version, row-major over chunks
+        self.chunk_versions = array('I', [1]) * (self.chunk_cols * self.chunk_rows)
+        self._frozen = None
+
+    def __getstate__(self):
+        return None, {k: getattr(self, k) for k in self.FIELDS}
+
+    def __setstate__(self, state):
+        for key, value in state[1].items():
+            setattr(self, key, value)
+        self._frozen = None
+        # pickled before chunk versions existed
+        if not hasattr(self, 'chunk_versions'):
+            self.chunk_versions = array('I', [1]) * (self.chunk_cols * self.chunk_rows)
+
+    def frozen(self):
+        """Copy of the map for background snapshots; copy-on-write, the same
+        copy is handed out until a tile changes."""
+        copy = self._frozen
+        if copy is None:
+            copy = TileMap.__new__(TileMap)
+            copy.__setstate__((None, {'width': self.width, 'height': self.height, 'tiles': bytearray(self.tiles),
+                                      'spawns': list(self.spawns), 'chunk_versions': array('I', self.chunk_versions)}))
+            self._frozen = copy
+        return copy
+
+    @classmethod
+    def from_rows(cls, rows, spawns=()):
+        """TileMap from nested lists (old snapshots and journals, wire payloads)."""
+        if isinstance(rows, TileMap):
+            return rows
+        height = len(rows)
+        width = len(rows[0]) if height else 0
+        tiles = bytearray(width * height)
+        for y, row in enumerate(rows):
+            tiles[y * width:(y + 1) * width] = bytes(row)
+        return cls(width, height, tiles, spawns or _corner_spawns(width, height))
+
+    def rows(self):
+        """Nested lists of ints (the JSON shape of `map`)."""
+        w = self.width
+        return [list(self.tiles[y * w:(y + 1) * w]) for y in range(self.height)]
+
+    def __len__(self):
+        return self.height
+
+    def __getitem__(self, y):
+        if y < 0:
+            y += self.height
+        if not 0 <= y < self.height:
+            raise IndexError(y)
+        return bytes(self.tiles[y * self.width:(y + 1) * self.width])
+
+    def __iter__(self):
+        for y in range(self.height):
+            yield self[y]
+
+    def __eq__(self, other):
+        if isinstance(other, TileMap):
+            return (self.width, self.height, self.tiles) == (other.width, other.height, other.tiles)
+        return NotImplemented
+
+    __hash__ = None
+
+    def inside(self, x, y):
+        return 0 <= x < self.width and 0 <= y < self.height
+
+    def get(self, x, y):
+        return self.tiles[y * self.width + x]
+
+    def passable(self, x, y):
+        return 0 <= x < self.width and 0 <= y < self.height and self.tiles[y * self.width + x] == FLOOR
+
+    def sees(self, x0, y0, x1, y1):
+        """Line of sight: no wall on the Bresenham line strictly between the two tiles."""
+        if x0 == x1 and y0 == y1:
+            return True
+        dx = abs(x1 - x0)
+        dy = -abs(y1 - y0)
+        sx = 1 if x0 < x1 else -1
+        sy = 1 if y0 < y1 else -1
+        err = dx + dy
+        x, y = x0, y0
+        w = self.width
+        tiles = self.tiles
+        while True:
+            e2 = 2 * err
+            if e2 >= dy:
+                err += dy
+                x += sx
+            if e2 <= dx:
+                err += dx
+                y += sy
+            if x == x1 and y == y1:
+                return True
+            if not (0 <= x < w and 0 <= y < self.height) or tiles[y * w + x] != FLOOR:
+                return False
+
+    def set(self, x, y, value):
+        """Change one tile; bumps its chunk's version when the value differs."""
+        i = y * self.width + x
+        if self.tiles[i] != value:
+            self.tiles[i] = value
+            self._frozen = None
+            self.chunk_versions[(y // CHUNK_SIZE) * self.chunk_cols + x // CHUNK_SIZE] += 1
+
+    @property
+    def chunk_cols(self):
+        return -(-self.width // CHUNK_SIZE)
+
+    @property
+    def chunk_rows(self):
+        return -(-self.height // CHUNK_SIZE)
+
+    def info(self, rev=0):
+        """What clients need to request chunks (`rev` identifies this map)."""
+        return {'w': self.width, 'h': self.height, 'chunk': CHUNK_SIZE, 'rev': rev}
+
+    def has_chunk(self, cx, cy):
+        return 0 <= cx < self.chunk_cols and 0 <= cy < self.chunk_rows
+
+    def chunk_version(self, cx, cy):
+        return self.chunk_versions[cy * self.chunk_cols + cx]
+
+    def chunk(self, cx, cy):
+        """Chunk (cx, cy): origin, size (smaller on the right/bottom edges), version and row-major tile bytes."""
+        x0 = cx * CHUNK_SIZE
+        y0 = cy * CHUNK_SIZE
+        w = min(CHUNK_SIZE, self.width - x0)
+        h = min(CHUNK_SIZE, self.height - y0)
+        tiles = bytearray(w * h)
+        for row in range(h):
+            start = (y0 + row) * self.width + x0
+            tiles[row * w:(row + 1) * w] = self.tiles[start:start + w]
+        return {'cx': cx, 'cy': cy, 'x': x0, 'y': y0, 'w': w, 'h': h, 'v': self.chunk_version(cx, cy),
+                'tiles': bytes(tiles)}
+
+    def chunks_around(self, x, y, radius):
+        """(cx, cy) of the chunks within `radius` chunks of tile (x, y), row by row."""
+        ccx = x // CHUNK_SIZE
+        ccy = y // CHUNK_SIZE
+        keys = []
+        for cy in range(max(0, ccy - radius), min(self.chunk_rows, ccy + radius + 1)):
+            for cx in range(max(0, ccx - radius), min(self.chunk_cols, ccx + radius + 1)):
+                keys.append((cx, cy))
+        return keys
+
+    def floor_tiles(self):
+        """Every passable (x, y), row by row."""
+        w = self.width
+        tiles = self.tiles
+        i = tiles.find(FLOOR)
+        while i != -1:
+            yield i % w, i // w
+            i = tiles.find(FLOOR, i + 1)
+
+
+def _corner_spawns(width, height):
+    right = width - 1
+    bottom = height - 1
+    return [(0, 0), (right, 0), (0, bottom), (right, bottom)]
+
+
+def _carve(tiles, width, x0, y0, x1, y1):
+    # floor on the rectangle [x0, x1) x [y0, y1)
+    run = bytes(x1 - x0)
+    for y in range(y0, y1):
+        tiles[y * width + x0:y * width + x1] = run
+
+
+def _has_floor(tiles, width, x0, y0, x1, y1):
+    # any floor on the rectangle [x0, x1) x [y0, y1)
+    return any(tiles.find(FLOOR, y * width + x0, y * width + x1) != -1 for y in range(y0, y1))
+
+
+def _spread(points, count):
+    # farthest-point order: each next spawn is the one farthest from those already taken
+    if not points:
+        return []
+    chosen = [points[0]]
+    dist = [abs(x - points[0][0]) + abs(y - points[0][1]) for x, y in points]
+    while len(chosen) < min(count, len(points)):
+        i = max(range(len(points)), key=dist.__getitem__)
+        if dist[i] == 0:
+            break
+        px, py = points[i]
+        chosen.append(points[i])
+        for j, (x, y) in enumerate(points):
+            d = abs(x - px) + abs(y - py)
+            if d < dist[j]:
+                dist[j] = d
+    return chosen
+
+
+def _arena(width, height, rng):
+    return TileMap(width, height, spawns=_corner_spawns(width, height))
+
+
+def _dungeon(width, height, rng):
+    tiles = bytearray([WALL]) * (width * height)
+    wanted = min(MAX_ROOMS, max(2, width * height // TILES_PER_ROOM))
+    rooms = []
+    # rejection sampling of rooms that keep 1 tile of wall from already carved ones
+    for _ in range(wanted * 4):
+        if len(rooms) >= wanted:
+            break
+        w = rng.randint(ROOM_MIN, min(ROOM_MAX, width - 2))
+        h = rng.randint(ROOM_MIN, min(ROOM_MAX, height - 2))
+        x = rng.randint(1, width - w - 1)
+        y = rng.randint(1, height - h - 1)
+        if _has_floor(tiles, width, x - 1, y - 1, x + w + 1, y + h + 1):
+            continue
+        rooms.append((x, y, w, h))
+        _carve(tiles, width, x, y, x + w, y + h)
+    if not rooms:
+        return _arena(width, height, rng)
+    # chain rooms in a snake order over coarse bands so corridors stay short;
+    # consecutive rooms are joined by an L-shaped corridor, so everything connects
+    band = max(ROOM_MAX * 2, 1)
+    rooms.sort(key=lambda r: (r[1] // band, r[0] if (r[1] // band) % 2 == 0 else -r[0]))
+    centers = [(x + w // 2, y + h // 2) for x, y, w, h in rooms]
+    for (ax, ay), (bx, by) in zip(centers, centers[1:]):
+        if rng.random() < 0.5:
+            _carve(tiles, width, min(ax, bx), ay, max(ax, bx) + 1, ay + 1)
+            _carve(tiles, width, bx, min(ay, by), bx + 1, max(ay, by) + 1)
+        else:
+            _carve(tiles, width, ax, min(ay, by), ax + 1, max(ay, by) + 1)
+            _carve(tiles, width, min(ax, bx), by, max(ax, bx) + 1, by + 1)
+    return TileMap(width, height, tiles, _spread(centers, MAX_SPAWNS))
+
+
+_GENERATORS = {'arena': _arena, 'dungeon': _dungeon}
+
+
+def validate(width=None, height=None, style=None):
+    """Normalized (width, height, style); raises ValueError on unsupported values."""
+    width = DEFAULT_WIDTH if width is None else int(width)
+    height = DEFAULT_HEIGHT if height is None else int(height)
+    style = style or DEFAULT_STYLE
+    if not (MIN_SIZE <= width <= MAX_SIZE and MIN_SIZE <= height <= MAX_SIZE):
+        raise ValueError(f'map size must be between {MIN_SIZE} and {MAX_SIZE}')
+    if style not in _GENERATORS:
+        raise ValueError(f"unknown map style {style!r} (choose from {', '.join(STYLES)})")
+    return width, height, style
+
+
+def generate(width=None, height=None, style=None, seed=None):
+    """Seeded map; its own rng, so the game's random stream is left untouched."""
+    width, height, style = validate(width, height, style)
+    rng = random.Random(f'map:{style}:{width}x{height}:{seed}')
+    return _GENERATORS[style](width, height, rng)
@@ -0,0 +1,205 @@
+"""Shortest paths over a game's map.
+
+Tiles with value `FLOOR` (game.mapgen) are passable; every other tile value
+blocks. Two tools, both on a flat ``y * width + x`` index:
+
+- distance fields: BFS distance of every tile to one target tile, ignoring
+  entities. A field only depends on the map, so fields are cached per target
+  tile (LRU, bounded in cells) and dropped when the map revision changes. An
+  entity that moves just reads the field of its new tile: bots chasing the
+  same target, or a target that stays put, cost one lookup per decision;
+- A*: Manhattan-guided search that also treats occupied tiles as blocked,
+  used when a field would be too large to build (big maps) or when entities
+  block the greedy descent.
+
+`PathFinder.for_game(game)` returns the finder of a game (kept in a weak map,
+so nothing is pickled with the game).
+"""
+import heapq
+import weakref
+from array import array
+from collections import OrderedDict, deque
+
+from game.mapgen import FLOOR, TileMap
+
+UNREACHABLE = 0xFFFFFFFF
+# maps up to this many tiles use cached distance fields, bigger ones A*
+# (a field is rebuilt whenever a chased target moves: keep the BFS short)
+FIELD_MAX_AREA = 64 * 64
+# total cells kept in cached fields per game (4 bytes each)
+FIELD_CACHE_CELLS = 1 << 20
+# A* gives up after expanding this many tiles
+ASTAR_MAX_NODES = 50000
+# A* routes kept per game (goal tile -> next tile of every tile on the path)
+ROUTE_CACHE = 64
+
+_finders = weakref.WeakKeyDictionary()
+# tile value -> 1 if passable (bytes.translate table)
+_WALK = bytes(1 if t == FLOOR else 0 for t in range(256))
+
+
+class PathFinder:
+    def __init__(self, grid):
+        # a TileMap, or nested lists of tiles
+        grid = TileMap.from_rows(grid)
+        self.width = grid.width
+        self.height = grid.height
+        self.area = self.width * self.height
+        # 1 = passable
+        self.walk = bytearray(grid.tiles.translate(_WALK))
+        self._fields = OrderedDict()
+        self._max_fields = max(1, FIELD_CACHE_CELLS // max(1, self.area))
+        self._routes = OrderedDict()
+        self.rev = None
+
+    @property
+    def uses_fields(self):
+        return self.area <= FIELD_MAX_AREA
+
+    @classmethod
+    def for_game(cls, game):
+        """Finder for game.map at its current revision (None when the game has no map)."""
+        if not game.map:
+            return None
+        finder = _finders.get(game)
+        rev = getattr(game, '_map_rev', 0)
+        if finder is None or finder.rev != rev:
+            finder = cls(game.map)
+            finder.rev = rev
+            _finders[game] = finder
+        return finder
+
+    def index(self, x, y):
+        return y * self.width + x
+
+    def inside(self, x, y):
+        return 0 <= x < self.width and 0 <= y < self.height
+
+    def passable(self, x, y):
+        return self.inside(x, y) and self.walk[y * self.width + x] == 1
+
+    def _neighbours(self, i):
+        w = self.width
+        x = i % w
+        if i >= w:
+            yield i - w
+        if i + w < self.area:
+            yield i + w
+        if x > 0:
+            yield i - 1
+        if x + 1 < w:
+            yield i + 1
+
+    def field(self, x, y):
+        """Cached BFS distances (array of uint32, UNREACHABLE if cut off) to tile (x, y)."""
+        target = self.index(x, y)
+        field = self._fields.get(target)
+        if field is not None:
+            self._fields.move_to_end(target)
+            return field
+        field = array('I', [UNREACHABLE]) * self.area
+        field[target] = 0
+        walk = self.walk
+        todo = deque([target])
+        while todo:
+            i = todo.popleft()
+            d = field[i] + 1
+            for j in self._neighbours(i):
+                if walk[j] and field[j] == UNREACHABLE:
+                    field[j] = d
+                    todo.append(j)
+        self._fields[target] = field
+        while len(self._fields) > self._max_fields:
+            self._fields.popitem(last=False)
+        return field
+
+    def astar(self, start, goal, blocked=(), max_nodes=ASTAR_MAX_NODES):
+        """Tiles from `start` (excluded) to `goal` (included), avoiding `blocked` tiles; None if no path."""
+        w = self.width
+        s = self.index(*start)
+        g = self.index(*goal)
+        gx, gy = goal
+        blocked_idx = {self.index(bx, by) for bx, by in blocked if self.inside(bx, by)}
+        blocked_idx.discard(g)
+        came = {s: None}
+        cost = {s: 0}
+        h = abs(start[0] - gx) + abs(start[1] - gy)
+        # (estimate, remaining, cost, tile): on equal estimates the tile
+        # closest to the goal goes first, so open ground is crossed in a line
+        heap = [(h, h, 0, s)]
+        expanded = 0
+        while heap:
+            _, _, c, i = heapq.heappop(heap)
+            if i == g:
+                path = []
+                while i != s:
+                    path.append((i % w, i // w))
+                    i = came[i]
+                path.reverse()
+                return path
+            if c > cost[i]:
+                continue
+            expanded += 1
+            if expanded > max_nodes:
+                return None
+            for j in self._neighbours(i):
+                if not self.walk[j] or j in blocked_idx:
+                    continue
+                nc = c + 1
+                if nc < cost.get(j, UNREACHABLE):
+                    cost[j] = nc
+                    came[j] = i
+                    h = abs(j % w - gx) + abs(j // w - gy)
+                    heapq.heappush(heap, (nc + h, h, nc, j))
+        return None
+
+    def next_step(self, start, goal, is_blocked=None, blocked=(), max_nodes=ASTAR_MAX_NODES):
+        """First tile of a shortest path from `start` toward `goal`, or None.
+
+        Small maps descend the goal's distance field, skipping neighbours for
+        which `is_blocked(x, y)` is true. Big maps follow the cached A* route
+        to the goal while `start` is on it. Otherwise (every shorter neighbour
+        blocked, no route yet) A* runs around the `blocked` tiles.
+        """
+        sx, sy = start
+        goal = tuple(goal)
+        if self.uses_fields:
+            field = self.field(*goal)
+            here = field[self.index(sx, sy)]
+            if here == UNREACHABLE:
+                return None
+            gx, gy = goal
+            w = self.width
+            # among equally short steps, head for the straight line to the goal
+            # (a moving target's sidesteps are not mirrored)
+            steps = sorted(self._neighbours(self.index(sx, sy)),
+                           key=lambda j: (field[j], (j % w - gx) ** 2 + (j // w - gy) ** 2))
+            for j in steps:
+                if field[j] >= here:
+                    break
+                nx, ny = j % w, j // w
+                if (nx, ny) == (gx, gy) or is_blocked is None or not is_blocked(nx, ny):
+                    return nx, ny
+        else:
+            route = self._routes.get(goal)
+            step = route.get((sx, sy)) if route is not None else None
+            if step is not None and (step == goal or is_blocked is None or not is_blocked(*step)):
+                self._routes.move_to_end(goal)
+                return step
+        path = self.astar(start, goal, blocked, max_nodes)
+        if not path:
+            return None
+        if not self.uses_fields:
+            tiles = [(sx, sy)] + path
+            self._routes[goal] = dict(zip(tiles, path))
+            self._routes.move_to_end(goal)
+            while len(self._routes) > ROUTE_CACHE:
+                self._routes.popitem(last=False)
+        return path[0]
+
+    def distance(self, start, goal):
+        """Path length ignoring entities (UNREACHABLE if none); uses the goal's field on small maps."""
+        if self.uses_fields:
+            return self.field(*goal)[self.index(*start)]
+        path = self.astar(start, goal)
+        return len(path) if path is not None else UNREACHABLE
@@ -0,0 +1,211 @@
+"""Optional durability for GameStore: snapshots + write-ahead action journal.
+
+Layout of the data directory (one pair of files per game):
+
+- ``<game_id>.snap``: pickled GameState, rewritten atomically every
+  ``snapshot_every`` journaled commands;
+- ``<game_id>.journal``: one compact JSON line per accepted command since
+  that snapshot: ``{"r": rev, "b": base_rev, "a": actor, "x": action, "p": patch, "w": draws}``
+  where ``patch`` is ``GameState.diff_since(base_rev)`` and ``draws`` the
+  number of words the game's rng had consumed (models.GameRandom).
+
+Recording happens inside the game's command (so the journal order matches the
+state order) but only enqueues work: the journal line, and every
+``snapshot_every`` entries a point-in-time copy of the game
+(``GameState.frozen``: entities, turn order and log ring, the map only when it
+changed). A background writer pickles the snapshots, batches the writes and
+fsyncs them, so action latency depends neither on the disk nor on the size
+of the game's pickle. On
+startup each game is rebuilt from its snapshot and the journal tail replayed
+with ``GameState.apply_patch``.
+
+Enabled by setting ``FUNGAME_DATA_DIR`` (see ``enable_from_env``).
+"""
+import json
+import os
+import pickle
+import time
+
+from logger import get_logger, native
+
+log = get_logger('persistence')
+
+_threading = native('threading')
+_queue = native('queue')
+
+SNAPSHOT_SUFFIX = '.snap'
+JOURNAL_SUFFIX = '.journal'
+
+
+class Persistence:
+    """Batched journal writer and snapshot store for one data directory."""
+
+    def __init__(self, data_dir, snapshot_every=200, flush_interval=0.05):
+        self.data_dir = data_dir
+        self.snapshot_every = max(1, int(snapshot_every))
+        self.flush_interval = flush_interval
+        os.makedirs(data_dir, exist_ok=True)
+        self._queue = _queue.Queue()
+        self._files = {}    # game id -> open journal file
+        self._counts = {}   # game id -> entries journaled since last snapshot
+        self._thread = _threading.Thread(target=self._run, name='fungame-journal', daemon=True)
+        self._thread.start()
+
+    def _path(self, game_id, suffix):
+        return os.path.join(self.data_dir, game_id + suffix)
+
+    # --- called from inside game commands (must stay cheap) ---
+
+    def record(self, game, base, actor=None, action=None):
+        patch = game.diff_since(base)
+        if patch is None:
+            return
+        line = json.dumps({'r': game.revision, 'b': base, 'a': actor, 'x': action, 'p': patch,
+                           'w': getattr(game.rng, 'draws', None)},
+                          separators=(',', ':'), default=str)
+        self._queue.put(('journal', game.id, line))
+        count = self._counts.get(game.id, 0) + 1
+        self._counts[game.id] = count
+        if count >= self.snapshot_every:
+            self._counts[game.id] = 0
+            self.snapshot(game)
+
+    def snapshot(self, game):
+        # frozen in command order, pickled by the writer, which replaces the journal with it
+        self._queue.put(('snapshot', game.id, game.frozen()))
+
+    def delete(self, game_id):
+        self._counts.pop(game_id, None)
+        self._queue.put(('delete', game_id, None))
+
+    def flush(self, timeout=5.0):
+        """Block until everything queued so far is on disk."""
+        done = _threading.Event()
+        self._queue.put(('flush', None, done))
+        return done.wait(timeout)
+
+    # --- background writer ---
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            # gather what is already queued (or arrives shortly) into one batch
+            deadline = time.monotonic() + self.flush_interval
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except _queue.Empty:
+                    break
+            try:
+                self._write_batch(batch)
+            except Exception:
+                log.exception('failed to write batch')
+
+    def _journal_file(self, game_id):
+        f = self._files.get(game_id)
+        if f is None:
+            f = open(self._path(game_id, JOURNAL_SUFFIX), 'a', encoding='utf-8')
+            self._files[game_id] = f
+        return f
+
+    def _close(self, game_id):
+        f = self._files.pop(game_id, None)
+        if f is not None:
+            f.close()
+
+    def _write_batch(self, batch):
+        dirty = set()
+        waiters = []
+        for kind, game_id, payload in batch:
+            if kind == 'journal':
+                self._journal_file(game_id).write(payload + '\n')
+                dirty.add(game_id)
+            elif kind == 'snapshot':
+                # entries already in the journal are covered by the snapshot
+                try:
+                    data = pickle.dumps(payload, protocol=pickle.HIGHEST_PROTOCOL)
+                except Exception as e:
+                    # the journal keeps growing from the previous snapshot
+                    log.error('cannot pickle snapshot', game=game_id, error=str(e))
+                    continue
+                path = self._path(game_id, SNAPSHOT_SUFFIX)
+                tmp = path + '.tmp'
+                with open(tmp, 'wb') as f:
+                    f.write(data)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp, path)
+                self._close(game_id)
+                open(self._path(game_id, JOURNAL_SUFFIX), 'w').close()
+                dirty.discard(game_id)
+            elif kind == 'delete':
+                self._close(game_id)
+                dirty.discard(game_id)
+                for suffix in (SNAPSHOT_SUFFIX, JOURNAL_SUFFIX):
+                    try:
+                        os.remove(self._path(game_id, suffix))
+                    except FileNotFoundError:
+                        pass
+            elif kind == 'flush':
+                waiters.append(payload)
+        for game_id in dirty:
+            f = self._files.get(game_id)
+            if f is not None:
+                f.flush()
+                os.fsync(f.fileno())
+        for done in waiters:
+            done.set()
+
+    # --- startup ---
+
+    def load_games(self):
+        """Rebuild every persisted game: snapshot + replay of the journal tail."""
+        games = []
+        for name in sorted(os.listdir(self.data_dir)):
+            if not name.endswith(SNAPSHOT_SUFFIX):
+                continue
+            game_id = name[:-len(SNAPSHOT_SUFFIX)]
+            try:
+                with open(self._path(game_id, SNAPSHOT_SUFFIX), 'rb') as f:
+                    game = pickle.load(f)
+            except Exception as e:
+                log.error('cannot load snapshot', game=game_id, error=str(e))
+                continue
+            replayed = 0
+            draws = None
+            try:
+                with open(self._path(game_id, JOURNAL_SUFFIX), encoding='utf-8') as f:
+                    for line in f:
+                        try:
+                            entry = json.loads(line)
+                        except ValueError:
+                            # torn last line from a crash: everything before it is valid
+                            break
+                        if entry.get('r', 0) <= game.revision:
+                            continue
+                        game.apply_patch(entry['p'])
+                        draws = entry.get('w', draws)
+                        replayed += 1
+            except FileNotFoundError:
+                pass
+            # patches do not replay the dice: bring the rng to where the journal ends
+            if draws is not None and hasattr(game.rng, 'advance'):
+                game.rng.advance(draws - game.rng.draws)
+            self._counts[game_id] = replayed
+            games.append(game)
+        return games
+
+
+def enable_from_env():
+    """Return a Persistence for $FUNGAME_DATA_DIR, or None when unset."""
+    data_dir = os.environ.get('FUNGAME_DATA_DIR')
+    if not data_dir:
+        return None
+    return Persistence(
+        data_dir,
+        snapshot_every=int(os.environ.get('FUNGAME_SNAPSHOT_EVERY', '200')),
+        flush_interval=float(os.environ.get('FUNGAME_JOURNAL_FLUSH', '0.05')),
+    )
@@ -0,0 +1,110 @@
+import heapq
+import itertools
+import threading
+import time
+
+import socketio_instance as _si
+from game.engine import Engine
+from logger import get_logger
+
+log = get_logger('bot')
+
+
+class BotScheduler:
+    """Runs the bots of every game from a small pool of background workers.
+
+    Bots do not poll: a bot is queued only when the engine reports that
+    `current_turn` became its id (or that it left the turn queue, e.g. died),
+    and it acts after its `think_interval`. Pending wake-ups live in a single
+    heap ordered by due time, so thousands of bots cost one sleeping worker.
+    Workers are started through socketio_instance so they are green threads
+    under eventlet.
+    """
+
+    def __init__(self, workers=1):
+        self.workers = max(1, int(workers))
+        self._bots = {}        # player id -> Bot
+        self._heap = []        # (due, seq, player id)
+        self._pending = set()  # player ids with a queued wake-up
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._started = False
+
+    def _ensure_started(self):
+        with self._cond:
+            if self._started:
+                return
+            self._started = True
+        Engine.listeners.append(self._on_engine_event)
+        for _ in range(self.workers):
+            _si.start_background_task(self._run)
+
+    def register(self, bot):
+        """Manage `bot` (already added to its game) and give it a first look at the game."""
+        self._ensure_started()
+        with self._cond:
+            self._bots[bot.player_id] = bot
+        self.wake(bot.player_id)
+
+    def unregister(self, player_id):
+        with self._cond:
+            return self._bots.pop(player_id, None)
+
+    def get(self, player_id):
+        return self._bots.get(player_id)
+
+    def bots(self, game_id=None):
+        with self._cond:
+            bots = list(self._bots.values())
+        if game_id is None:
+            return bots
+        return [b for b in bots if b.game_id == game_id]
+
+    def wake(self, player_id, delay=None):
+        """Queue a decision step for the bot `player_id` (no-op if one is queued)."""
+        with self._cond:
+            bot = self._bots.get(player_id)
+            if bot is None or player_id in self._pending:
+                return False
+            if delay is None:
+                delay = bot.think_interval
+            self._pending.add(player_id)
+            heapq.heappush(self._heap, (time.monotonic() + delay, next(self._seq), player_id))
+            self._cond.notify()
+            return True
+
+    def _on_engine_event(self, event, game_state, entity_id):
+        # only bots whose turn just came (or that just died) need to think
+        if entity_id is not None and entity_id in self._bots:
+            self.wake(entity_id)
+
+    def _next_due(self):
+        with self._cond:
+            while True:
+                if self._heap:
+                    due = self._heap[0][0]
+                    now = time.monotonic()
+                    if due <= now:
+                        _, _, player_id = heapq.heappop(self._heap)
+                        self._pending.discard(player_id)
+                        bot = self._bots.get(player_id)
+                        if bot is not None:
+                            return bot
+                        continue
+                    self._cond.wait(due - now)
+                else:
+                    self._cond.wait()
+
+    def _run(self):
+        while True:
+            bot = self._next_due()
+            try:
+                if bot.step():
+                    # the bot asked to look again later (e.g. still its turn)
+                    self.wake(bot.player_id)
+            except Exception:
+                log.exception('bot error', game=bot.game_id, bot=bot.player_id)
+
+
+# process-wide scheduler shared by all games
+scheduler = BotScheduler()
@@ -0,0 +1,247 @@
+"""Headless batch simulation of complete games, for balance tuning.
+
+Runs GameState + Engine directly (no GameStore, Flask or Socket.IO: with no
+Socket.IO instance registered, socketio_instance.emit_event is a no-op) with a
+bot policy per seat, spreads the games over a ProcessPoolExecutor and merges
+win rates, game lengths and damage distributions into one report.
+
+Simulated games have no respawn: a game ends when at most one entity is left
+alive (its seat wins) or after `max_turns` actions (draw).
+
+Python API::
+
+    from game.simulate import run_batch
+    report = run_batch(10000, policies=('bot', 'hunter'), seed=1)
+
+CLI::
+
+    python -m game.simulate -n 10000 -p bot,hunter --seed 1 --json report.json
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+from models import GameState, Player, COLORS
+from game.bot import choose_action, wander_action
+
+
+def _hunter(game, actor):
+    # attack when adjacent, otherwise step toward the nearest alive enemy
+    bx = actor.x
+    by = actor.y
+    best = None
+    for p in list(game.players.values()) + list(game.monsters.values()):
+        if p.id == actor.id or p.hp <= 0:
+            continue
+        d = abs(p.x - bx) + abs(p.y - by)
+        if best is None or d < best[0]:
+            best = (d, p)
+    if best is None:
+        return {'type': 'end_turn'}
+    dist, target = best
+    if dist == 1:
+        return {'type': 'attack', 'targetId': target.id}
+    dx = target.x - bx
+    dy = target.y - by
+    steps = []
+    if dx:
+        steps.append((bx + (1 if dx > 0 else -1), by))
+    if dy:
+        steps.append((bx, by + (1 if dy > 0 else -1)))
+    for nx, ny in steps:
+        if not game.occupancy.is_occupied(nx, ny, ignore=actor.id):
+            return {'type': 'move', 'x': nx, 'y': ny}
+    return choose_action(game, actor)
+
+
+def _wander(game, actor):
+    # the bots' policy before pathfinding: attack when adjacent, otherwise a random step
+    for eid in game.occupancy.adjacent(actor.x, actor.y):
+        if eid != actor.id and eid in game.players and game.players[eid].hp > 0:
+            return {'type': 'attack', 'targetId': eid}
+    return wander_action(game, actor)
+
+
+def _idle(game, actor):
+    return {'type': 'end_turn'}
+
+
+# policy name -> callable(game, actor) returning the action to play
+POLICIES = {
+    'bot': choose_action,
+    'hunter': _hunter,
+    'wander': _wander,
+    'idle': _idle,
+}
+
+
+def _percentile(hist, q):
+    total = sum(hist.values())
+    if not total:
+        return 0
+    rank = q * (total - 1)
+    seen = 0
+    for value in sorted(hist):
+        seen += hist[value]
+        if seen > rank:
+            return value
+    return max(hist)
+
+
+class SimStats:
+    """Mergeable aggregate of simulated games (cheap to send between processes)."""
+
+    def __init__(self, policies=()):
+        self.policies = list(policies)
+        self.games = 0
+        self.draws = 0
+        self.wins = Counter()          # seat index -> wins
+        self.turns = Counter()         # game length (actions) -> games
+        self.attacks = 0
+        self.hits = 0
+        self.damage_per_hit = Counter()
+        self.damage_per_game = Counter()
+
+    def merge(self, other):
+        self.games += other.games
+        self.draws += other.draws
+        self.wins.update(other.wins)
+        self.turns.update(other.turns)
+        self.attacks += other.attacks
+        self.hits += other.hits
+        self.damage_per_hit.update(other.damage_per_hit)
+        self.damage_per_game.update(other.damage_per_game)
+        return self
+
+    def to_dict(self):
+        games = self.games or 1
+        seats = []
+        for i, policy in enumerate(self.policies):
+            seats.append({'seat': i, 'policy': policy, 'wins': self.wins[i], 'win_rate': self.wins[i] / games})
+        turns_total = sum(t * c for t, c in self.turns.items())
+        return {
+            'games': self.games,
+            'seats': seats,
+            'draws': self.draws,
+            'draw_rate': self.draws / games,
+            'turns': {
+                'mean': turns_total / games,
+                'p50': _percentile(self.turns, 0.5),
+                'p95': _percentile(self.turns, 0.95),
+                'max': max(self.turns) if self.turns else 0,
+            },
+            'attacks': self.attacks,
+            'hit_rate': self.hits / self.attacks if self.attacks else 0.0,
+            'damage_per_hit': dict(sorted(self.damage_per_hit.items())),
+            'damage_per_game': dict(sorted(self.damage_per_game.items())),
+        }
+
+
+def simulate_game(seed, policies=('bot', 'bot'), max_turns=1000, stats=None):
+    """Play one game to the end; returns (and accumulates into) a SimStats."""
+    stats = stats if stats is not None else SimStats(policies)
+    fns = [POLICIES[name] for name in policies]
+    game = GameState(name='sim', max_players=len(policies), seed=seed, log_capacity=64, turn_budget=0,
+                     max_entities=len(policies))
+    seats = {}
+    for i, policy in enumerate(policies):
+        player = Player(name=f'{policy}#{i}', color=COLORS[i % len(COLORS)], rng=game.rng)
+        game.add_player(player)
+        seats[player.id] = i
+    game.start()
+    turns = 0
+    damage = 0
+    alive = len(seats)
+    while turns < max_turns and alive > 1:
+        actor_id = game.current_turn
+        if actor_id is None:
+            break
+        actor = game.players[actor_id]
+        action = fns[seats[actor_id]](game, actor)
+        res = game.process_action(actor_id, action)
+        turns += 1
+        if res.get('error'):
+            game.process_action(actor_id, {'type': 'end_turn'})
+            continue
+        if action['type'] == 'attack':
+            stats.attacks += 1
+            if res['hit']:
+                stats.hits += 1
+                stats.damage_per_hit[res['dmg']] += 1
+                damage += res['dmg']
+            if res['died']:
+                alive -= 1
+    stats.games += 1
+    stats.turns[turns] += 1
+    stats.damage_per_game[damage] += 1
+    survivors = [pid for pid, p in game.players.items() if p.hp > 0]
+    if len(survivors) == 1:
+        stats.wins[seats[survivors[0]]] += 1
+    else:
+        stats.draws += 1
+    return stats
+
+
+def _run_chunk(first_seed, count, policies, max_turns):
+    # executed in worker processes: one SimStats per chunk keeps IPC small
+    stats = SimStats(policies)
+    for seed in range(first_seed, first_seed + count):
+        simulate_game(seed, policies, max_turns, stats)
+    return stats
+
+
+def run_batch(n, policies=('bot', 'bot'), seed=0, max_turns=1000, workers=None, chunk_size=250):
+    """Simulate `n` games (seeds seed..seed+n-1) and return the report dict."""
+    policies = tuple(policies)
+    for name in policies:
+        if name not in POLICIES:
+            raise ValueError(f"unknown policy {name!r} (choose from {', '.join(POLICIES)})")
+    workers = workers or os.cpu_count() or 1
+    chunks = [(seed + start, min(chunk_size, n - start), policies, max_turns) for start in range(0, n, chunk_size)]
+    total = SimStats(policies)
+    if workers == 1:
+        for chunk in chunks:
+            total.merge(_run_chunk(*chunk))
+    elif chunks:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for stats in pool.map(_run_chunk, *zip(*chunks)):
+                total.merge(stats)
+    return total.to_dict()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run headless FunGame simulations and report balance stats.')
+    parser.add_argument('-n', '--games', type=int, default=1000, help='number of games to simulate')
+    parser.add_argument('-p', '--policies', default='bot,bot',
+                        help=f"comma-separated policy per seat ({', '.join(POLICIES)})")
+    parser.add_argument('--seed', type=int, default=0, help='seed of the first game')
+    parser.add_argument('--max-turns', type=int, default=1000, help='actions before a game is a draw')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes (default: all cores)')
+    parser.add_argument('--json', dest='json_path', help='also write the report to this JSON file')
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    report = run_batch(args.games, args.policies.split(','), args.seed, args.max_turns, args.workers)
+    elapsed = time.perf_counter() - started
+    report['elapsed_s'] = elapsed
+    report['games_per_minute'] = args.games / elapsed * 60 if elapsed else 0.0
+
+    print(f"{report['games']} games in {elapsed:.1f}s ({report['games_per_minute']:.0f} games/min)")
+    for seat in report['seats']:
+        print(f"  seat {seat['seat']} ({seat['policy']}): {seat['win_rate']:.1%} wins")
+    print(f"  draws: {report['draw_rate']:.1%}")
+    t = report['turns']
+    print(f"  turns: mean {t['mean']:.1f}, p50 {t['p50']}, p95 {t['p95']}, max {t['max']}")
+    print(f"  hit rate: {report['hit_rate']:.1%} over {report['attacks']} attacks")
+    if args.json_path:
+        with open(args.json_path, 'w') as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
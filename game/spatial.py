@@ -0,0 +1,111 @@
+class SpatialIndex:
+    """Tile -> entity id index of the alive entities of a game.
+
+    Lookups by tile are O(1). The index must be kept in sync by the game state:
+    `place` on spawn/move/respawn, `remove` on death or when an entity leaves.
+    Two entities may end up on the same tile (fallback spawn on a full map);
+    the extra ones are stacked so removing one never hides the other.
+    Entities are also bucketed in CELL x CELL cells for range queries
+    (`within`), whose cost depends on the area searched, not on the map.
+    """
+
+    # 4-directional neighbourhood used for adjacency queries
+    NEIGHBOURS = ((0, 1), (0, -1), (1, 0), (-1, 0))
+    # side of the buckets used by within()
+    CELL = 8
+
+    def __init__(self):
+        self._tiles = {}    # (x, y) -> entity id
+        self._pos = {}      # entity id -> (x, y)
+        self._stacked = {}  # (x, y) -> [entity ids hidden under _tiles[(x, y)]]
+        self._cells = {}    # (x // CELL, y // CELL) -> {entity ids}
+
+    def place(self, entity_id, x, y):
+        self.remove(entity_id)
+        tile = (x, y)
+        other = self._tiles.get(tile)
+        if other is not None:
+            self._stacked.setdefault(tile, []).append(other)
+        self._tiles[tile] = entity_id
+        self._pos[entity_id] = tile
+        self._cells.setdefault((x // self.CELL, y // self.CELL), set()).add(entity_id)
+
+    def remove(self, entity_id):
+        tile = self._pos.pop(entity_id, None)
+        if tile is None:
+            return
+        cell = (tile[0] // self.CELL, tile[1] // self.CELL)
+        members = self._cells.get(cell)
+        if members is not None:
+            members.discard(entity_id)
+            if not members:
+                del self._cells[cell]
+        stacked = self._stacked.get(tile)
+        if self._tiles.get(tile) == entity_id:
+            if stacked:
+                self._tiles[tile] = stacked.pop()
+            else:
+                del self._tiles[tile]
+        elif stacked and entity_id in stacked:
+            stacked.remove(entity_id)
+        if stacked is not None and not stacked:
+            del self._stacked[tile]
+
+    def at(self, x, y):
+        """Return the id of the alive entity on tile (x, y), or None."""
+        return self._tiles.get((x, y))
+
+    def is_occupied(self, x, y, ignore=None):
+        eid = self._tiles.get((x, y))
+        if eid is None:
+            return False
+        if eid != ignore:
+            return True
+        # `ignore` is on top: the tile is still occupied if someone is stacked under it
+        return bool(self._stacked.get((x, y)))
+
+    def position_of(self, entity_id):
+        return self._pos.get(entity_id)
+
+    def tiles(self):
+        """Occupied tiles (a live view)."""
+        return self._tiles.keys()
+
+    def adjacent(self, x, y):
+        """Return ids of alive entities 4-adjacent to (x, y)."""
+        out = []
+        for dx, dy in self.NEIGHBOURS:
+            eid = self._tiles.get((x + dx, y + dy))
+            if eid is not None:
+                out.append(eid)
+        return out
+
+    def within(self, x, y, radius):
+        """Ids of alive entities at Euclidean distance <= radius of (x, y)."""
+        cell = self.CELL
+        r2 = radius * radius
+        pos = self._pos
+        out = []
+        for cy in range((y - radius) // cell, (y + radius) // cell + 1):
+            for cx in range((x - radius) // cell, (x + radius) // cell + 1):
+                for eid in self._cells.get((cx, cy), ()):
+                    ex, ey = pos[eid]
+                    if (ex - x) * (ex - x) + (ey - y) * (ey - y) <= r2:
+                        out.append(eid)
+        return out
+
+    def rebuild(self, entities):
+        # reset from scratch (e.g. after loading a game): alive entities only
+        self._tiles = {}
+        self._pos = {}
+        self._stacked = {}
+        self._cells = {}
+        for ent in entities:
+            if getattr(ent, 'hp', 0) > 0:
+                self.place(ent.id, ent.x, ent.y)
+
+    def __contains__(self, entity_id):
+        return entity_id in self._pos
+
+    def __len__(self):
+        return len(self._pos)
@@ -0,0 +1,163 @@
+"""Read-only spectators of a game.
+
+Spectators are not players: they sit in the game's `spectator_room` and
+receive coalesced frames, at most `FPS` per second. A frame is one
+`state_delta` from the revision of the previous frame to the current one,
+encoded once (JSON, plus MessagePack when a spectator negotiated it) and
+emitted once to the whole room, so hundreds of spectators cost the same
+encoding work as one. Joining spectators get the cached snapshot of the
+current revision (GameState.snapshot_json): no spectator ever costs its
+own to_dict().
+
+Frames follow each other (base_rev of a frame is the rev of the previous
+one); a spectator whose snapshot is newer than a frame's base applies it
+anyway, the patch being a superset of what it lacks.
+"""
+import json
+import os
+import threading
+import time
+
+import metrics
+import socketio_instance as _si
+from game import wire
+from game.timers import TimerWheel
+from game.wire import RawJSON
+from logger import get_logger
+
+log = get_logger('spectators')
+
+# frames per second sent to the spectators of a game (changes in between are coalesced)
+FPS = float(os.environ.get('FUNGAME_SPECTATOR_FPS', '5'))
+
+
+class _Stream:
+    __slots__ = ('game', 'sids', 'rev', 'last', 'pending')
+
+    def __init__(self, game):
+        self.game = game
+        self.sids = set()
+        # revision the spectators were last brought to
+        self.rev = game.revision
+        self.last = 0.0
+        self.pending = False
+
+
+class SpectatorHub:
+    def __init__(self, fps=FPS, timers=None):
+        self.fps = fps
+        self._timers = timers or TimerWheel(tick=0.02)
+        self._streams = {}  # game id -> _Stream
+        self._games = {}    # sid -> game id
+        self._lock = threading.Lock()
+
+    def watching(self, game_id):
+        return game_id in self._streams
+
+    def count(self, game_id):
+        stream = self._streams.get(game_id)
+        return len(stream.sids) if stream else 0
+
+    def counts(self):
+        """{game id: number of spectators}."""
+        with self._lock:
+            return {gid: len(s.sids) for gid, s in self._streams.items()}
+
+    def game_of(self, sid):
+        return self._games.get(sid)
+
+    def add(self, game, sid, binary=False):
+        """Register `sid` as a spectator of `game` (its room is joined by the caller)."""
+        with self._lock:
+            previous = self._games.get(sid)
+            if previous is not None and previous != game.id:
+                self._discard_locked(previous, sid)
+            stream = self._streams.get(game.id)
+            if stream is None:
+                stream = self._streams[game.id] = _Stream(game)
+            stream.sids.add(sid)
+            self._games[sid] = game.id
+            count = len(stream.sids)
+        if previous is not None and previous != game.id:
+            _si.set_binary(_si.spectator_room(previous), sid, False)
+        _si.set_binary(_si.spectator_room(game.id), sid, binary)
+        return count
+
+    def remove(self, sid):
+        """Forget spectator `sid`; returns the game id it watched (None if it was not a spectator)."""
+        with self._lock:
+            game_id = self._games.pop(sid, None)
+            if game_id is not None:
+                self._discard_locked(game_id, sid)
+        if game_id is not None:
+            _si.set_binary(_si.spectator_room(game_id), sid, False)
+        return game_id
+
+    def _discard_locked(self, game_id, sid):
+        stream = self._streams.get(game_id)
+        if stream is None:
+            return
+        stream.sids.discard(sid)
+        if not stream.sids:
+            del self._streams[game_id]
+            self._timers.cancel(game_id)
+
+    def close(self, game_id, reason='removed'):
+        """The game is gone: tell its spectators and drop its stream."""
+        with self._lock:
+            stream = self._streams.pop(game_id, None)
+            if stream is None:
+                return
+            for sid in stream.sids:
+                self._games.pop(sid, None)
+        self._timers.cancel(game_id)
+        room = _si.spectator_room(game_id)
+        _si.emit_event('game_closed', {'gameId': game_id, 'reason': reason}, to=room)
+        for sid in stream.sids:
+            _si.set_binary(room, sid, False)
+
+    def changed(self, game):
+        """The game moved to a new revision: schedule a frame unless one is already due."""
+        now = time.monotonic()
+        with self._lock:
+            stream = self._streams.get(game.id)
+            if stream is None or stream.pending:
+                return
+            stream.pending = True
+            delay = max(0.0, stream.last + 1.0 / self.fps - now) if self.fps > 0 else 0.0
+        self._timers.schedule(game.id, delay, self._frame, game.id)
+
+    def _frame(self, game_id):
+        # wheel task: must not block, the frame is posted to the game's command queue
+        stream = self._streams.get(game_id)
+        if stream is None:
+            return
+        game = stream.game
+        game.commands.post(game._run_command, self._emit_frame, (game,), {})
+
+    def _emit_frame(self, game):
+        with self._lock:
+            stream = self._streams.get(game.id)
+            if stream is None:
+                return
+            stream.pending = False
+            stream.last = time.monotonic()
+            base = stream.rev
+            stream.rev = game.revision
+        if base == game.revision:
+            return
+        room = _si.spectator_room(game.id)
+        patch = game.diff_since(base)
+        try:
+            if patch is None:
+                _si.emit_game(room, 'state_update', RawJSON(game.snapshot_json()), packed=game.snapshot_msgpack)
+            else:
+                data = json.dumps(patch, separators=(',', ':'), default=str).encode('utf-8')
+                _si.emit_game(room, 'state_delta', RawJSON(data), packed=lambda: wire.pack(patch))
+            metrics.SPECTATOR_FRAMES.inc()
+        except Exception as e:
+            log.error('failed to emit spectator frame', game=game.id, error=str(e))
+
+
+# process-wide hub for the spectators of every game
+spectators = SpectatorHub()
@@ -1,31 +1,135 @@
+import hashlib
+import hmac
+import os
+import secrets
 import threading
 import uuid
 import time
-from models import GameState, Player, COLORS
-import random
+from models import GameState, Player, COLORS, MAX_ENTITIES
+import metrics
+import socketio_instance as _si
+from game import cluster
+from game.timers import turn_timers
+from game.spectators import spectators
+from logger import get_logger
+
+log = get_logger('store')
+
+# games without a connected human for this many seconds are removed (0 disables)
+IDLE_TTL = float(os.environ.get('FUNGAME_IDLE_TTL', '600'))
+REAP_INTERVAL = float(os.environ.get('FUNGAME_REAP_INTERVAL', '30'))
+# per-process cap; when reached, the least recently active game without a
+# connected human is evicted (games do not finish: dead entities respawn)
+MAX_GAMES = int(os.environ.get('FUNGAME_MAX_GAMES', '1000'))
+# key of the player tokens (see GameStore.player_token); random per process
+# unless set, in which case tokens stay valid across restarts
+TOKEN_SECRET = (os.environ.get('FUNGAME_TOKEN_SECRET') or secrets.token_hex(32)).encode('utf-8')
 
 
 class GameStore:
+    # game id -> GameState. Reads are lock-free (a single dict lookup/copy is
+    # atomic); _lock only serializes writers. Mutating a game goes through its
+    # own command queue (GameState.call / dispatch), never through this lock.
     _games = {}
     _lock = threading.Lock()
+    # optional game.persistence.Persistence (see enable_persistence)
+    _persistence = None
+    # game id -> time since which no human is connected (see reap)
+    _idle_since = {}
+    _reaper = None
 
     @classmethod
-    def create_game(cls, name='Game', max_players=2):
+    def create_game(cls, name='Game', max_players=2, seed=None, turn_budget=None, map_width=None, map_height=None,
+                    map_style=None, view_radius=None):
+        """New game, or None when MAX_GAMES is reached and every game has a connected human.
+
+        Raises ValueError when `max_players` exceeds MAX_ENTITIES.
+        """
+        max_players = max(1, int(max_players))
+        if max_players > MAX_ENTITIES:
+            raise ValueError(f'maxPlayers must be at most {MAX_ENTITIES}')
+        evicted = None
+        waited = time.perf_counter()
         with cls._lock:
+            metrics.LOCK_WAIT.observe(time.perf_counter() - waited)
+            if len(cls._games) >= MAX_GAMES:
+                idle = [g for g in cls._games.values() if not cls._has_connected_human(g)]
+                if not idle:
+                    return None
+                evicted = min(idle, key=lambda g: g.last_active)
+                del cls._games[evicted.id]
             # create a new independent game for each call (tests expect this)
-            game = GameState(name=name, max_players=max_players)
+            game = GameState(name=name, max_players=max_players, seed=seed, turn_budget=turn_budget,
+                             map_width=map_width, map_height=map_height, map_style=map_style,
+                             view_radius=view_radius)
             cls._games[game.id] = game
-            return game
+        if evicted is not None:
+            cls._dispose(evicted, 'evicted')
+        if cls._persistence is not None:
+            game.call(cls._persistence.snapshot, game)
+        return game
 
     @classmethod
-    def list_games(cls):
+    def enable_persistence(cls, persistence):
+        """Journal every game to `persistence` and reload the games it holds."""
+        if persistence is None or cls._persistence is not None:
+            return []
+        from game.bot import Bot
+        from game.scheduler import scheduler
+        # in clustered mode every worker reloads only the games it owns
+        restored = [g for g in persistence.load_games() if cluster.is_local(g.id)]
         with cls._lock:
-            return list(cls._games.values())
+            cls._persistence = persistence
+            GameState.persistence = persistence
+            for game in restored:
+                cls._games.setdefault(game.id, game)
+        now = time.time()
+        for game in restored:
+            specs = game.__dict__.pop('_bot_specs', [])
+            # no client survived the restart: humans come back through `join`, and
+            # the reaper counts the game as idle from now until one does
+            bot_ids = {spec[0] for spec in specs}
+            for player_id, player in list(game.players.items()):
+                if player.is_connected and player_id not in bot_ids:
+                    game.call(game.set_player_connected, player_id, False)
+            cls._idle_since[game.id] = now
+            # the current turn gets a full budget again after a restart
+            game.engine.arm_turn_timer()
+            # bring the game's bots back under the scheduler
+            game._bots = []
+            for player_id, name, think_interval in specs:
+                if player_id not in game.players:
+                    continue
+                bot = Bot(game.id, name=name, think_interval=think_interval)
+                bot.player_id = player_id
+                game._bots.append(bot)
+                scheduler.register(bot)
+        return restored
+
+    @staticmethod
+    def player_token(game_id, player_id):
+        """Proof of being `player_id`, handed out by REST join; required to read its fogged view."""
+        msg = f'{game_id}:{player_id}'.encode('utf-8')
+        return hmac.new(TOKEN_SECRET, msg, hashlib.sha256).hexdigest()[:32]
+
+    @classmethod
+    def check_player_token(cls, game_id, player_id, token):
+        if not token or not player_id:
+            return False
+        return hmac.compare_digest(str(token), cls.player_token(game_id, player_id))
+
+    @classmethod
+    def list_games(cls, local_only=False):
+        """Games of this worker, followed (in clustered mode) by the other workers'
+        games as game.cluster.GameSummary (id, name, status, worker)."""
+        games = list(cls._games.values())
+        if local_only or not cluster.enabled():
+            return games
+        return games + cluster.remote_games()
 
     @classmethod
     def get_game(cls, game_id):
-        with cls._lock:
-            return cls._games.get(game_id)
+        return cls._games.get(game_id)
 
     @classmethod
     def get_player(cls, game_id, player_id):
@@ -38,13 +142,18 @@ class GameStore:
     def set_player_connected(cls, game_id, player_id, connected):
         game = cls.get_game(game_id)
         if game:
-            game.set_player_connected(player_id, connected)
+            game.call(game.set_player_connected, player_id, connected)
 
     @classmethod
     def add_player(cls, game_id, player_name):
         game = cls.get_game(game_id)
         if not game:
             return None
+        return game.call(cls._add_player, game, player_name)
+
+    @staticmethod
+    def _add_player(game, player_name):
+        # runs inside the game's command queue
         # choose a color not already taken
         used = [p.color for p in game.players.values() if getattr(p, 'color', None) is not None]
         color = None
@@ -54,13 +163,119 @@ class GameStore:
                 break
         if color is None:
             # fallback: pick random color from palette
-            color = random.choice(COLORS)
-        player = Player(name=player_name, color=color)
+            color = game.rng.choice(COLORS)
+        player = Player(name=player_name, color=color, rng=game.rng)
         success = game.add_player(player)
         if success:
             return player
         return None
 
+    # --- bot management (bots are driven by the shared game.scheduler) ---
+
+    @classmethod
+    def start_bot(cls, game_id, name='Computer', think_interval=1.0):
+        """Add a bot to the game and register it with the bot scheduler."""
+        from game.bot import Bot
+        game = cls.get_game(game_id)
+        if not game:
+            return None
+        bot = Bot(game_id, name=name, think_interval=think_interval)
+        bot.start()
+        # keep bot reference on game for management
+        if not hasattr(game, '_bots'):
+            game._bots = []
+        game._bots.append(bot)
+        if cls._persistence is not None:
+            # bots are part of the snapshot, not of the journal
+            game.call(cls._persistence.snapshot, game)
+        return bot
 
+    @classmethod
+    def stop_bot(cls, game_id, player_id):
+        game = cls.get_game(game_id)
+        bots = getattr(game, '_bots', []) if game else []
+        for bot in list(bots):
+            if bot.player_id == player_id:
+                bot.stop()
+                bots.remove(bot)
+                # nobody plays its turns any more: they would stall until the turn budget expires
+                game.call(game.engine.remove_entity, player_id)
+                if cls._persistence is not None:
+                    game.call(cls._persistence.snapshot, game)
+                return True
+        return False
+
+    @classmethod
+    def list_bots(cls, game_id=None):
+        from game.scheduler import scheduler
+        return scheduler.bots(game_id)
+
+    # --- cleanup: idle reaper and evictions ---
+
+    @classmethod
+    def remove_game(cls, game_id, reason='removed'):
+        with cls._lock:
+            game = cls._games.pop(game_id, None)
+        if game is None:
+            return False
+        cls._dispose(game, reason)
+        return True
+
+    @classmethod
+    def _dispose(cls, game, reason):
+        # the game is already out of _games: stop its bots, drop its files, tell its room
+        cls._idle_since.pop(game.id, None)
+        turn_timers.cancel(game.id)
+        for bot in list(getattr(game, '_bots', [])):
+            try:
+                bot.stop()
+            except Exception:
+                pass
+        game._bots = []
+        if cls._persistence is not None:
+            cls._persistence.delete(game.id)
+        _si.emit_event('game_closed', {'gameId': game.id, 'reason': reason}, to=game.id)
+        spectators.close(game.id, reason)
+        metrics.GAMES_REMOVED.inc(reason)
+        log.info('game removed', game=game.id, reason=reason, status=game.status, log_seq=game.log.last_seq)
+
+    @staticmethod
+    def _has_connected_human(game):
+        # bots count as absent
+        bots = {b.player_id for b in getattr(game, '_bots', [])}
+        return any(p.is_connected and pid not in bots for pid, p in list(game.players.items()))
+
+    @classmethod
+    def reap(cls, now=None):
+        """Remove the games that have had no connected human for IDLE_TTL seconds.
+
+        Bots count as absent: a game left to its bots is reaped too. Returns
+        the removed game ids.
+        """
+        now = time.time() if now is None else now
+        removed = []
+        for game in list(cls._games.values()):
+            if cls._has_connected_human(game):
+                cls._idle_since.pop(game.id, None)
+                continue
+            since = cls._idle_since.setdefault(game.id, now)
+            if now - since >= IDLE_TTL and cls.remove_game(game.id, 'idle'):
+                removed.append(game.id)
+        return removed
+
+    @classmethod
+    def start_reaper(cls, interval=None):
+        """Run reap() every REAP_INTERVAL seconds in the background (once per process)."""
+        if cls._reaper is not None or IDLE_TTL <= 0:
+            return cls._reaper
+        interval = REAP_INTERVAL if interval is None else interval
 
-# ... potential cleanup utilities
+        def _loop():
+            while True:
+                time.sleep(interval)
+                try:
+                    cls.reap()
+                except Exception:
+                    log.exception('reaper failed')
+        cls._reaper = _si.start_background_task(_loop)
+        return cls._reaper
@@ -0,0 +1,110 @@
+"""Hashed timer wheel for turn deadlines.
+
+One wheel is shared by every game of the process: scheduling, rescheduling
+and cancelling a deadline are O(1) dict operations, and a single background
+task (a green thread under eventlet) advances the wheel every `tick`
+seconds and fires what expired. Tens of thousands of pending deadlines cost
+memory, not threads.
+
+A key (a game id) holds at most one deadline: scheduling again replaces it.
+Callbacks run in the wheel's task and must not block or do game work: game
+timeouts post a command (CommandQueue.post), which a background task applies,
+so one slow game never delays the deadlines of the others (see
+Engine.arm_turn_timer).
+"""
+import threading
+import time
+
+import socketio_instance as _si
+from logger import get_logger
+
+log = get_logger('timers')
+
+
+class TimerWheel:
+    def __init__(self, tick=0.1, slots=512):
+        self.tick = tick
+        self._slots = [{} for _ in range(slots)]
+        self._where = {}  # key -> slot index
+        self._origin = time.monotonic()
+        self._current = 0  # last tick processed
+        self._lock = threading.Lock()
+        self._started = False
+
+    def __len__(self):
+        return len(self._where)
+
+    def _tick_of(self, t):
+        return int((t - self._origin) / self.tick)
+
+    def schedule(self, key, delay, callback, *args):
+        """Call callback(*args) in about `delay` seconds (replaces key's previous deadline)."""
+        # round up: a deadline never fires early
+        due = self._tick_of(time.monotonic() + delay) + 1
+        with self._lock:
+            self._cancel_locked(key)
+            due = max(due, self._current + 1)
+            index = due % len(self._slots)
+            self._slots[index][key] = (due, callback, args)
+            self._where[key] = index
+        self._ensure_started()
+
+    def cancel(self, key):
+        with self._lock:
+            return self._cancel_locked(key)
+
+    def _cancel_locked(self, key):
+        index = self._where.pop(key, None)
+        if index is None:
+            return False
+        self._slots[index].pop(key, None)
+        return True
+
+    def advance(self, now=None):
+        """Fire every deadline up to `now`; returns the number of callbacks run."""
+        target = self._tick_of(time.monotonic() if now is None else now)
+        fired = []
+        with self._lock:
+            if target - self._current >= len(self._slots):
+                # fell behind by a whole turn of the wheel: one sweep of every slot
+                slots = self._slots
+                self._current = target
+            else:
+                slots = []
+                while self._current < target:
+                    self._current += 1
+                    slots.append(self._slots[self._current % len(self._slots)])
+            for slot in slots:
+                if not slot:
+                    continue
+                for key, (due, callback, args) in list(slot.items()):
+                    # entries due in a later round of the wheel stay in place
+                    if due <= target:
+                        del slot[key]
+                        self._where.pop(key, None)
+                        fired.append((key, callback, args))
+        for key, callback, args in fired:
+            try:
+                callback(*args)
+            except Exception:
+                log.exception('timer callback failed', key=key)
+        return len(fired)
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        _si.start_background_task(self._run)
+
+    def _run(self):
+        while True:
+            time.sleep(self.tick)
+            try:
+                self.advance()
+            except Exception:
+                log.exception('timer wheel failed')
+
+
+# process-wide wheel for the turn deadlines of every game
+turn_timers = TimerWheel()
@@ -0,0 +1,134 @@
+"""Wire encoding helpers for Socket.IO payloads.
+
+`RawJSON` wraps an already-encoded JSON document (e.g. a cached game
+snapshot). Emitting it through a Socket.IO server created with
+``json=wire.SocketIOJSON`` splices the bytes into the packet instead of
+encoding the state again for every recipient::
+
+    emit('state_update', RawJSON(game.snapshot_json()), to=sid)
+
+Clients receive exactly the same JSON as if the dict had been emitted.
+
+Clients can also negotiate a binary encoding (``join`` with
+``{"encoding": "msgpack"}``): state-carrying events (``state_update``,
+``state_delta``, ``action_result``, ``game_started``) are then sent as
+MessagePack with a compact layout (see `compact`):
+
+- every entity is a list in `ENTITY_FIELDS` order instead of a dict, with
+  ``position`` flattened into ``x``/``y``; monsters have one more element,
+  their ``template_id`` (players have no such field);
+- the map is ``{"w": width, "h": height, "tiles": <bytes, row-major>}``
+  instead of nested lists (states only carry ``map_info``; map tiles come
+  in ``map_chunks`` events, whose chunk tiles are bytes too, see
+  `chunks_message`).
+
+Everything else keeps the JSON shape. MessagePack is optional: without the
+``msgpack`` package only JSON is offered.
+"""
+import json
+
+try:
+    import msgpack
+except ImportError:  # optional dependency
+    msgpack = None
+
+JSON = 'json'
+MSGPACK = 'msgpack'
+# entity layout in compact payloads (mirrored by the frontend)
+ENTITY_FIELDS = ('id', 'name', 'hp', 'max_hp', 'ac', 'x', 'y', 'initiative', 'is_connected', 'color', 'score',
+                 'template_id')
+
+
+def supported_encodings():
+    return (JSON, MSGPACK) if msgpack is not None else (JSON,)
+
+
+def negotiate(requested):
+    """Encoding to use for a client asking for `requested` (JSON when unsupported)."""
+    return requested if requested in supported_encodings() else JSON
+
+
+def compact_entity(d):
+    pos = d.get('position') or {}
+    out = [d.get('id'), d.get('name'), d.get('hp'), d.get('max_hp'), d.get('ac'), pos.get('x', 0), pos.get('y', 0),
+           d.get('initiative'), d.get('is_connected'), d.get('color'), d.get('score')]
+    # trailing fields only for the entities that have them (monsters)
+    if 'template_id' in d:
+        out.append(d['template_id'])
+    return out
+
+
+def pack_map(grid):
+    """Nested list of 0..255 tiles (or a TileMap) -> {'w', 'h', 'tiles'} with one byte per tile."""
+    if hasattr(grid, 'tiles'):
+        return {'w': grid.width, 'h': grid.height, 'tiles': bytes(grid.tiles)}
+    height = len(grid)
+    width = len(grid[0]) if height else 0
+    tiles = bytearray(width * height)
+    for y, row in enumerate(grid):
+        tiles[y * width:(y + 1) * width] = bytes(row)
+    return {'w': width, 'h': height, 'tiles': bytes(tiles)}
+
+
+def compact(payload):
+    """Compact form of a state / delta / action result (see module docstring)."""
+    if not isinstance(payload, dict):
+        return payload
+    out = dict(payload)
+    for key in ('players', 'monsters'):
+        if out.get(key) is not None:
+            out[key] = [compact_entity(e) for e in out[key]]
+    if out.get('map'):
+        out['map'] = pack_map(out['map'])
+    return out
+
+
+def chunks_message(game_id, map_info, chunks, encoding=JSON):
+    """`map_chunks` event payload for TileMap.chunk() dicts in `encoding`.
+
+    MessagePack keeps the tiles as bytes; JSON sends them as lists of ints.
+    """
+    if encoding == MSGPACK:
+        return msgpack.packb({'gameId': game_id, 'map': map_info, 'chunks': chunks}, use_bin_type=True)
+    return {'gameId': game_id, 'map': map_info, 'chunks': [dict(c, tiles=list(c['tiles'])) for c in chunks]}
+
+
+def pack(payload):
+    """MessagePack bytes of compact(payload)."""
+    return msgpack.packb(compact(payload), use_bin_type=True, default=str)
+
+
+class RawJSON:
+    """Pre-encoded JSON value (bytes or str) to embed verbatim in a packet."""
+
+    __slots__ = ('data',)
+
+    def __init__(self, data):
+        self.data = data.decode('utf-8') if isinstance(data, (bytes, bytearray)) else data
+
+    def __repr__(self):
+        return f'RawJSON({len(self.data)} chars)'
+
+
+def _default(obj):
+    if isinstance(obj, RawJSON):
+        return json.loads(obj.data)
+    raise TypeError(f'Object of type {type(obj).__name__} is not JSON serializable')
+
+
+class SocketIOJSON:
+    """Drop-in `json` module for python-socketio that understands RawJSON arguments."""
+
+    @staticmethod
+    def dumps(obj, **kwargs):
+        # Socket.IO event packets are [event, arg, ...]: splice raw arguments
+        if isinstance(obj, list) and any(isinstance(item, RawJSON) for item in obj):
+            sep = kwargs.get('separators', (',', ':'))[0]
+            parts = [item.data if isinstance(item, RawJSON) else SocketIOJSON.dumps(item, **kwargs) for item in obj]
+            return '[' + sep.join(parts) + ']'
+        kwargs.setdefault('default', _default)
+        return json.dumps(obj, **kwargs)
+
+    @staticmethod
+    def loads(s, **kwargs):
+        return json.loads(s, **kwargs)
@@ -0,0 +1,188 @@
+"""Structured, non-blocking logging for the game server.
+
+Every record is one JSON line on stdout::
+
+    {"ts": 1700000000.123, "level": "INFO", "logger": "socket", "msg": "player joined", "game": "...", "player": "..."}
+
+Call sites never touch stdout: records go to a bounded in-memory queue that a
+native background thread (a real OS thread even under eventlet) formats and
+writes, so a slow stdout cannot block the hub. When the queue is full the
+record is dropped (and counted) rather than waiting.
+
+Usage::
+
+    from logger import get_logger
+    log = get_logger('bot')
+    log.debug('turn', game=game_id, bot=player_id)     # keyword args become JSON fields
+
+Configuration (environment):
+
+- ``FUNGAME_LOG_LEVEL``: default level, ``INFO``;
+- ``FUNGAME_LOG_LEVELS``: per-module levels, e.g. ``bot=DEBUG,actions=DEBUG``.
+  The ``bot`` and ``actions`` traces are DEBUG, hence off by default;
+- ``FUNGAME_LOG_SAMPLE``: keep 1 record out of N per module for records below
+  WARNING, e.g. ``actions=100,bot=10``.
+"""
+import json
+import logging
+import os
+import sys
+import time
+
+
+def native(name):
+    """The unpatched stdlib module `name`, even under eventlet monkey patching.
+
+    Background writers (this module's, game.persistence's) must be real OS
+    threads, otherwise a slow stdout or fsync() would block the hub.
+    """
+    try:
+        from eventlet import patcher
+        return patcher.original(name)
+    except Exception:
+        return __import__(name)
+
+
+_threading = native('threading')
+_queue = native('queue')
+
+ROOT = 'fungame'
+QUEUE_SIZE = 10000
+# LogRecord attributes that are not user fields
+_RESERVED = ('exc_info', 'stack_info', 'stacklevel', 'extra')
+
+
+def _parse_pairs(value):
+    pairs = {}
+    for item in (value or '').split(','):
+        if '=' in item:
+            k, v = item.split('=', 1)
+            pairs[k.strip()] = v.strip()
+    return pairs
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'ts': round(record.created, 3),
+            'level': record.levelname,
+            'logger': record.name[len(ROOT) + 1:] if record.name.startswith(ROOT + '.') else record.name,
+            'msg': record.getMessage(),
+        }
+        entry.update(getattr(record, 'fields', None) or {})
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class SampleFilter(logging.Filter):
+    """Keep one record out of `every` (WARNING and above always pass)."""
+
+    def __init__(self, every):
+        super().__init__()
+        self.every = max(1, int(every))
+        self._count = 0
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        self._count += 1
+        return self._count % self.every == 1 or self.every == 1
+
+
+class QueueWriter(logging.Handler):
+    """Handler that only enqueues; a background thread does the formatting and I/O."""
+
+    def __init__(self, stream=None, maxsize=QUEUE_SIZE):
+        super().__init__()
+        self.stream = stream or sys.stdout
+        self.dropped = 0
+        self._queue = _queue.Queue(maxsize)
+        self._thread = _threading.Thread(target=self._run, name='fungame-log', daemon=True)
+        self._thread.start()
+
+    def emit(self, record):
+        try:
+            self._queue.put_nowait(record)
+        except _queue.Full:
+            self.dropped += 1
+
+    def _run(self):
+        while True:
+            record = self._queue.get()
+            batch = [record]
+            # write whatever else is already queued in one go
+            while len(batch) < 512:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except _queue.Empty:
+                    break
+            lines = []
+            for rec in batch:
+                try:
+                    lines.append(self.format(rec))
+                except Exception:
+                    pass
+            if self.dropped:
+                lines.append(json.dumps({'ts': round(time.time(), 3), 'level': 'WARNING', 'logger': 'log',
+                                         'msg': 'log records dropped', 'count': self.dropped}))
+                self.dropped = 0
+            try:
+                self.stream.write('\n'.join(lines) + '\n')
+                self.stream.flush()
+            except Exception:
+                pass
+
+    def flush(self, timeout=2.0):
+        deadline = time.monotonic() + timeout
+        while not self._queue.empty() and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+
+class StructLogger(logging.LoggerAdapter):
+    """Logger whose keyword arguments become JSON fields of the record."""
+
+    def process(self, msg, kwargs):
+        fields = {k: kwargs.pop(k) for k in list(kwargs) if k not in _RESERVED}
+        if fields:
+            extra = dict(kwargs.get('extra') or {})
+            extra['fields'] = fields
+            kwargs['extra'] = extra
+        return msg, kwargs
+
+
+_configured = False
+_handler = None
+
+
+def configure(stream=None):
+    """Install the queue writer and the levels/sampling from the environment (idempotent)."""
+    global _configured, _handler
+    if _configured:
+        return _handler
+    _configured = True
+    root = logging.getLogger(ROOT)
+    root.setLevel(os.environ.get('FUNGAME_LOG_LEVEL', 'INFO').upper())
+    root.propagate = False
+    _handler = QueueWriter(stream)
+    _handler.setFormatter(JsonFormatter())
+    root.addHandler(_handler)
+    for name, level in _parse_pairs(os.environ.get('FUNGAME_LOG_LEVELS')).items():
+        logging.getLogger(f'{ROOT}.{name}').setLevel(level.upper())
+    for name, every in _parse_pairs(os.environ.get('FUNGAME_LOG_SAMPLE')).items():
+        try:
+            logging.getLogger(f'{ROOT}.{name}').addFilter(SampleFilter(int(every)))
+        except ValueError:
+            pass
+    return _handler
+
+
+def get_logger(name):
+    """Structured logger for module `name` (e.g. 'bot', 'actions', 'socket')."""
+    configure()
+    return StructLogger(logging.getLogger(f'{ROOT}.{name}'), {})
+
+
+def flush(timeout=2.0):
+    if _handler is not None:
+        _handler.flush(timeout)
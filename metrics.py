@@ -0,0 +1,155 @@
+"""In-process metrics exposed by /api/metrics (Prometheus text format).
+
+Recording is meant to stay enabled under full load: a recording is a couple
+of dict/list updates without any lock. Under the GIL (or eventlet green
+threads) these are effectively atomic; a rare lost increment under true
+thread contention is accepted in exchange for zero synchronisation cost.
+
+Game-wide gauges (games, players, bots, log sizes) are not tracked at all:
+they are computed from GameStore when the endpoint is scraped.
+"""
+import json
+import time
+from bisect import bisect_left
+
+# seconds: 50us .. 1s
+LATENCY_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+# action types used as label values (anything else is reported as 'other' so
+# clients cannot blow up the label cardinality)
+ACTION_TYPES = ('move', 'attack', 'end_turn', 'respawn', 'revive')
+# serialized size of to_dict() is measured at most once per this many seconds
+# (json.dumps of a big map costs far more than to_dict itself)
+STATE_BYTES_INTERVAL = 1.0
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(names, values, extra=None):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Counter:
+    def __init__(self, name, doc, labels=()):
+        self.name = name
+        self.doc = doc
+        self.labels = labels
+        self._values = {}
+
+    def inc(self, *labels, n=1):
+        self._values[labels] = self._values.get(labels, 0) + n
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.doc}', f'# TYPE {self.name} counter']
+        for key, value in sorted(self._values.items()):
+            lines.append(f'{self.name}{_labels(self.labels, key)} {value}')
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, doc, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.doc = doc
+        self.labels = labels
+        self.buckets = buckets
+        # labels -> [count per bucket (+Inf last), sum]
+        self._series = {}
+
+    def observe(self, value, *labels):
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series.setdefault(labels, [[0] * (len(self.buckets) + 1), 0.0])
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.doc}', f'# TYPE {self.name} histogram']
+        for key, (counts, total) in sorted(self._series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = 'le="+Inf"' if bound == float('inf') else f'le="{bound!r}"'
+                lines.append(f'{self.name}_bucket{_labels(self.labels, key, le)} {cumulative}')
+            lines.append(f'{self.name}_sum{_labels(self.labels, key)} {total}')
+            lines.append(f'{self.name}_count{_labels(self.labels, key)} {cumulative}')
+        return lines
+
+
+ACTION_SECONDS = Histogram('fungame_action_seconds', 'GameState.process_action latency by action type', ('action',))
+ACTION_ERRORS = Counter('fungame_action_errors_total', 'Rejected actions by action type and error code', ('action', 'error'))
+STATE_SECONDS = Histogram('fungame_state_serialize_seconds', 'GameState.to_dict latency')
+STATE_BYTES = Histogram('fungame_state_serialize_bytes',
+                        f'JSON size of GameState.to_dict (sampled every {STATE_BYTES_INTERVAL:g}s)', buckets=SIZE_BUCKETS)
+EMITS = Counter('fungame_emit_total', 'Socket.IO events emitted by event name', ('event',))
+SNAPSHOT_CACHE = Counter('fungame_snapshot_cache_total', 'Encoded snapshot reads served from cache (hit) or encoded (miss)',
+                         ('result',))
+GAMES_REMOVED = Counter('fungame_games_removed_total', 'Games removed from GameStore by reason (idle, evicted, ...)',
+                        ('reason',))
+LOCK_WAIT = Histogram('fungame_gamestore_lock_wait_seconds', 'Time spent waiting for the GameStore lock')
+COMMAND_WAIT = Histogram('fungame_command_wait_seconds', 'Time a game command waited in its command queue')
+SPECTATOR_FRAMES = Counter('fungame_spectator_frames_total', 'Coalesced frames emitted to spectator rooms')
+
+_state_sampled_at = 0.0
+
+
+def observe_action(action_type, seconds, result):
+    label = action_type if action_type in ACTION_TYPES else 'other'
+    ACTION_SECONDS.observe(seconds, label)
+    if isinstance(result, dict) and result.get('error'):
+        ACTION_ERRORS.inc(label, str(result['error'])[:40])
+
+
+def observe_state(seconds, state):
+    global _state_sampled_at
+    STATE_SECONDS.observe(seconds)
+    now = time.monotonic()
+    if now - _state_sampled_at >= STATE_BYTES_INTERVAL:
+        _state_sampled_at = now
+        try:
+            STATE_BYTES.observe(len(json.dumps(state, separators=(',', ':'), default=str)))
+        except Exception:
+            pass
+
+
+def count_emit(event):
+    EMITS.inc(event)
+
+
+def _gauge(name, doc, samples):
+    lines = [f'# HELP {name} {doc}', f'# TYPE {name} gauge']
+    for labels, value in samples:
+        lines.append(f'{name}{labels} {value}')
+    return lines
+
+
+def render(games=(), bots=(), spectators=None):
+    """Text exposition of every metric plus gauges computed from `games`, `bots` and `spectators` ({game id: count})."""
+    games = list(games)
+    players = connected = 0
+    log_entries = []
+    log_seq = []
+    for g in games:
+        for p in list(g.players.values()):
+            players += 1
+            connected += bool(getattr(p, 'is_connected', False))
+        label = _labels(('game',), (g.id,))
+        log_entries.append((label, len(g.log)))
+        log_seq.append((label, g.log.last_seq))
+    lines = []
+    lines += _gauge('fungame_games', 'Games held by GameStore', [('', len(games))])
+    lines += _gauge('fungame_players', 'Players in all games', [('{connected="true"}', connected),
+                                                                ('{connected="false"}', players - connected)])
+    lines += _gauge('fungame_bots', 'Bots registered with the scheduler', [('', len(list(bots)))])
+    lines += _gauge('fungame_game_log_entries', 'Entries retained in each game log', log_entries)
+    lines += _gauge('fungame_game_log_seq', 'Entries ever appended to each game log', log_seq)
+    lines += _gauge('fungame_spectators', 'Spectators of each watched game',
+                    [(_labels(('game',), (gid,)), n) for gid, n in sorted((spectators or {}).items())])
+    for metric in (ACTION_SECONDS, ACTION_ERRORS, STATE_SECONDS, STATE_BYTES, SNAPSHOT_CACHE, EMITS, GAMES_REMOVED, LOCK_WAIT,
+                   COMMAND_WAIT, SPECTATOR_FRAMES):
+        lines += metric.render()
+    return '\n'.join(lines) + '\n'
@@ -1,9 +1,26 @@
+import gzip
+import json
 import uuid
 import random
+import threading
 import time
 from game.engine import Engine
+from game.log import GameLog
+from game.spatial import SpatialIndex
+from game.turns import TurnOrder
+from game.commands import CommandQueue
+from game.mapgen import TileMap
+from game import mapgen
+from game import wire
+from game import cluster
+from game.spectators import spectators
 import math
+import os
 import socketio_instance as _si
+import metrics
+from logger import get_logger
+
+log = get_logger('game')
 
 # Mapping d'erreurs => messages lisibles (français)
 ERROR_MESSAGES = {
@@ -14,18 +31,66 @@ ERROR_MESSAGES = {
     'target_dead': "La cible est déjà morte",
     'not_your_turn': "Ce n'est pas votre tour",
     'not_dead': "L'acteur n'est pas mort",
+    'blocked': "Case infranchissable",
+    'no_free_tile': "Aucune case libre pour réapparaître",
     'unknown_action': "Action inconnue",
 }
 
+# number of most recent log entries embedded in full snapshots; older ones
+# are available through the paginated /api/games/<id>/log endpoint
+SNAPSHOT_LOG_ENTRIES = 20
+
+# per-game cap on players + monsters (also caps maxPlayers at creation)
+MAX_ENTITIES = int(os.environ.get('FUNGAME_MAX_ENTITIES', '64'))
+
+# default seconds a turn may last before it is skipped (0 = no limit)
+TURN_BUDGET = float(os.environ.get('FUNGAME_TURN_BUDGET', '60'))
+
+# default fog of war: players only receive entities within this many tiles
+# and in line of sight (0 = everyone sees everything)
+VIEW_RADIUS = int(os.environ.get('FUNGAME_VIEW_RADIUS', '0'))
 
 def _err(code):
     return {'error': code, 'message': ERROR_MESSAGES.get(code, code)}
 
 
 def _new_id():
+    # always uuid4, never the game's seeded rng: two games with the same seed
+    # must not share entity ids (the bot scheduler and rooms key on them)
     return uuid.uuid4().hex
 
 
+class GameRandom(random.Random):
+    """random.Random that counts the 32-bit words it consumed since seeding.
+
+    Journal entries record the count (`draws`), so a restored game can move
+    its snapshot's generator forward to where the journal ends
+    (see game.persistence).
+    """
+
+    def seed(self, *args, **kwargs):
+        super().seed(*args, **kwargs)
+        self.draws = 0
+
+    def random(self):
+        # 53-bit float from two words
+        self.draws += 2
+        return super().random()
+
+    def getrandbits(self, k):
+        if k > 0:
+            self.draws += (k + 31) // 32
+        return super().getrandbits(k)
+
+    def advance(self, words):
+        """Skip `words` words, as if they had been drawn."""
+        while words > 0:
+            step = min(words, 4096)
+            super().getrandbits(32 * step)
+            self.draws += step
+            words -= step
+
+
 # Simple random name generator
 ADJECTIVES = [
     'Brave', 'Mighty', 'Swift', 'Clever', 'Fierce', 'Nimble', 'Bold', 'Silent', 'Lucky', 'Wise'
@@ -34,8 +99,9 @@ NOUNS = [
     'Fox', 'Wolf', 'Hawk', 'Bear', 'Lion', 'Raven', 'Tiger', 'Otter', 'Eagle', 'Stag'
 ]
 
-def random_name():
-    return f"{random.choice(ADJECTIVES)} {random.choice(NOUNS)}"
+def random_name(rng=None):
+    rng = rng or random
+    return f"{rng.choice(ADJECTIVES)} {rng.choice(NOUNS)}"
 
 
 # Palette of colors (integers) to assign to players. Pick in order, avoid duplicates.
@@ -52,101 +118,262 @@ COLORS = [
 
 
 class Player:
-    def __init__(self, name='Player', color=None):
+    # slots: no per-instance __dict__, integer coordinates instead of a dict
+    __slots__ = ('id', 'name', 'hp', 'max_hp', 'ac', 'x', 'y', 'initiative', 'is_connected', 'color', 'score',
+                 '_rev', '_cache')
+
+    def __init__(self, name='Player', color=None, rng=None):
         self.id = _new_id()
+        # pass the game's rng for reproducible names
         # if no explicit name provided, generate a friendly random name
         if not name:
-            self.name = random_name()
+            self.name = random_name(rng)
         else:
             self.name = name
         self.hp = 10
         self.max_hp = 10
         self.ac = 10
-        self.position = {'x': 0, 'y': 0}
+        self.x = 0
+        self.y = 0
         self.initiative = 0
         # default to not connected; Socket join will mark connected=True
         self.is_connected = False
         self.color = color
         # gameplay score (number of kills)
         self.score = 0
+        # state revision at which this entity last changed (see GameState.touch)
+        self._rev = 0
+        # cached to_dict(), dropped by mark_dirty()
+        self._cache = None
+
+    # serialized fields, in to_dict() order
+    FIELDS = ('id', 'name', 'hp', 'max_hp', 'ac', 'position', 'initiative', 'is_connected', 'color', 'score')
+
+    @property
+    def position(self):
+        # wire shape {'x', 'y'}; built on demand, prefer .x/.y in game code
+        return {'x': self.x, 'y': self.y}
+
+    @position.setter
+    def position(self, pos):
+        self.x = int(pos.get('x', 0))
+        self.y = int(pos.get('y', 0))
+        self._cache = None
+
+    def mark_dirty(self):
+        """Drop the cached serialized form (GameState.touch calls this)."""
+        self._cache = None
+
+    @classmethod
+    def from_dict(cls, d):
+        ent = cls()
+        ent.update_from(d)
+        return ent
+
+    def update_from(self, d):
+        for key in self.FIELDS:
+            if key in d:
+                setattr(self, key, d[key])
+        self._cache = None
 
     def to_dict(self):
-        return {
-            'id': self.id,
-            'name': self.name,
-            'hp': self.hp,
-            'max_hp': self.max_hp,
-            'ac': self.ac,
-            'position': self.position,
-            'initiative': self.initiative,
-            'is_connected': self.is_connected,
-            'color': self.color,
-            'score': self.score,
-        }
+        # rebuilt only after a change; the returned dict is shared, do not mutate it
+        d = self._cache
+        if d is None:
+            d = self._cache = {
+                'id': self.id,
+                'name': self.name,
+                'hp': self.hp,
+                'max_hp': self.max_hp,
+                'ac': self.ac,
+                'position': {'x': self.x, 'y': self.y},
+                'initiative': self.initiative,
+                'is_connected': self.is_connected,
+                'color': self.color,
+                'score': self.score,
+            }
+        return d
+
+    def __getstate__(self):
+        return {key: getattr(self, key) for key in self._state_keys()}
+
+    def __setstate__(self, state):
+        # also accepts snapshots pickled before entities had slots
+        if isinstance(state, tuple):
+            state = dict(state[0] or {}, **(state[1] or {}))
+        self._cache = None
+        self._rev = 0
+        self.x = self.y = 0
+        for key, value in state.items():
+            if key == 'position':
+                self.position = value
+            elif key != '_cache':
+                setattr(self, key, value)
+
+    def copy(self):
+        """Detached copy with the same pickled state (persistence snapshots)."""
+        ent = self.__class__.__new__(self.__class__)
+        for key in self._state_keys():
+            setattr(ent, key, getattr(self, key))
+        ent._cache = None
+        return ent
+
+    @classmethod
+    def _state_keys(cls):
+        # slots to pickle, computed once per class
+        keys = _STATE_KEYS.get(cls)
+        if keys is None:
+            keys = _STATE_KEYS[cls] = tuple(k for klass in reversed(cls.__mro__)
+                                            for k in getattr(klass, '__slots__', ()) if k != '_cache')
+        return keys
+
+
+# entity class -> its _state_keys()
+_STATE_KEYS = {}
 
 
 class Monster(Player):
-    def __init__(self, template_id='goblin'):
-        super().__init__(name=template_id)
+    __slots__ = ('template_id',)
+
+    def __init__(self, template_id='goblin', rng=None):
+        super().__init__(name=template_id, rng=rng)
         self.template_id = template_id
 
+    FIELDS = Player.FIELDS + ('template_id',)
+
+    @classmethod
+    def from_dict(cls, d):
+        ent = cls(template_id=d.get('template_id', 'goblin'))
+        ent.update_from(d)
+        return ent
+
+    def to_dict(self):
+        d = self._cache
+        if d is None:
+            d = super().to_dict()
+            d['template_id'] = self.template_id
+        return d
+
+
+class _FrozenGame:
+    # pickles as the GameState it was taken from (see GameState.frozen)
+    __slots__ = ('state',)
+
+    def __init__(self, state):
+        self.state = state
+
+    def __reduce__(self):
+        return _restore_game, (self.state,)
+
+
+def _restore_game(state):
+    game = GameState.__new__(GameState)
+    game.__setstate__(state)
+    return game
+
 
 class GameState:
-    def __init__(self, name='Game', max_players=2):
-        self.id = _new_id()
+    # optional game.persistence.Persistence journaling every command that
+    # changes a game (set by GameStore.enable_persistence)
+    persistence = None
+
+    def __init__(self, name='Game', max_players=2, log_capacity=None, seed=None, turn_budget=None,
+                 map_width=None, map_height=None, map_style=None, view_radius=None, max_entities=None):
+        # prefixed with the owning worker in clustered mode (game.cluster)
+        self.id = cluster.game_id(_new_id())
+        # per-game random stream (initiative, combat, bots, names): the same seed
+        # and the same actions replay the same game
+        self.seed = int(seed) if seed is not None else random.randrange(2 ** 32)
+        self.rng = GameRandom(self.seed)
         self.name = name
         self.max_players = max_players
+        # players + monsters cap (MAX_ENTITIES unless given, e.g. by benchmarks)
+        self.max_entities = MAX_ENTITIES if max_entities is None else int(max_entities)
+        # seconds before the current turn is skipped (Engine.arm_turn_timer)
+        self.turn_budget = TURN_BUDGET if turn_budget is None else float(turn_budget)
+        # fog of war radius in tiles (0 = off), see visible_to()
+        self.view_radius = VIEW_RADIUS if view_radius is None else max(0, int(view_radius))
+        # player id -> ids of the entities its clients were last sent (fog of war)
+        self._views = {}
         self.players = {}
         self.monsters = {}
-        self.map = None
-        self.turn_queue = []
+        # generated from the seed at creation so players joining a waiting game
+        # spawn on the map's spawn points (game.mapgen)
+        self.map = mapgen.generate(map_width, map_height, map_style, self.seed)
+        # initiative ring (game.turns); turn_queue is its list view from the current turn
+        self.turns = TurnOrder()
         self.current_turn = None
         self.status = 'waiting'  # waiting, running, finished
-        self.log = []
+        self.log = GameLog(log_capacity)
         self.created_at = time.time()
+        # wall-clock time of the last command that changed the game (LRU eviction)
+        self.last_active = self.created_at
+        # state revision: bumped on every mutation so clients can be sent diffs
+        self.revision = 0
+        self._queue_rev = 0
+        self._map_rev = 0
+        # entity id -> revision at which it was removed from the game
+        self._removed = {}
+        # tile -> alive entity index, kept in sync on spawn/move/death/respawn/remove
+        self.occupancy = SpatialIndex()
+        # single-writer queue: all mutations from sockets/REST/bots go through call()
+        self.commands = CommandQueue()
+        self._in_command = False
+        # [revision, JSON bytes, gzip bytes or None] of the last encoded snapshot
+        self._snapshot_cache = None
+        # long-poll readers (wait_for_change) are woken after each changing command
+        self._changed = threading.Condition()
+        self._pollers = 0
         # engine instance
         self.engine = Engine(self)
 
     def add_player(self, player):
-        if len(self.players) >= self.max_players:
+        if len(self.players) >= self.max_players or len(self.players) + len(self.monsters) >= self.max_entities:
+            return False
+        spawn = self._find_spawn(player.id)
+        if spawn is None:
+            log.warning('no free tile to spawn on', game=self.id, player=player.id)
             return False
-        # add player to registry first
         self.players[player.id] = player
+        x, y = spawn
+        player.x = x
+        player.y = y
+        self.occupancy.place(player.id, x, y)
 
-        # choose spawn: try corners first, then any free tile on map if available
-        corners = [(0, 0), (15, 0), (0, 11), (15, 11)]
-
-        def is_occupied(x, y):
-            for p in list(self.players.values()) + list(self.monsters.values()):
-                if p.id == player.id:
-                    continue
-                pos = p.position or {}
-                if pos.get('x') == x and pos.get('y') == y:
-                    return True
-            return False
+        self.touch(player)
+        return True
 
-        for cx, cy in corners:
-            if not is_occupied(cx, cy):
-                player.position = {'x': cx, 'y': cy}
+    def _find_spawn(self, entity_id):
+        """Free floor tile for `entity_id`: the map's spawn points first, then the first free floor tile.
+
+        Returns None when every floor tile is taken (callers refuse the spawn).
+        """
+        if not self.map:
+            return 0, 0
+        for cx, cy in self.map.spawns:
+            if self.map.passable(cx, cy) and not self.occupancy.is_occupied(cx, cy, ignore=entity_id):
+                return cx, cy
+        # each alive entity takes one tile: among len(occupancy) + 1 floor tiles one is free
+        attempts = len(self.occupancy) + 1
+        for x, y in self.map.floor_tiles():
+            if not self.occupancy.is_occupied(x, y, ignore=entity_id):
+                return x, y
+            attempts -= 1
+            if attempts <= 0:
                 break
-        else:
-            # if map exists, scan for first non-occupied tile
-            if self.map:
-                found = False
-                for y in range(len(self.map)):
-                    for x in range(len(self.map[0])):
-                        if not is_occupied(x, y):
-                            player.position = {'x': x, 'y': y}
-                            found = True
-                            break
-                    if found:
-                        break
-                if not found:
-                    # fallback
-                    player.position = {'x': 0, 'y': 0}
-            else:
-                player.position = {'x': 0, 'y': 0}
+        return None
 
+    def remove_player(self, player_id):
+        """Remove a player (or monster) from the game entirely."""
+        ent = self.players.pop(player_id, None) or self.monsters.pop(player_id, None)
+        if not ent:
+            return False
+        self.occupancy.remove(player_id)
+        try:
+            self.engine.remove_entity(player_id)
+        except Exception:
+            pass
+        self._removed[player_id] = self._bump()
         return True
 
     def get_player(self, player_id):
@@ -156,17 +383,258 @@ class GameState:
         p = self.players.get(player_id)
         if p:
             p.is_connected = connected
+            self.touch(p)
+
+    def call(self, fn, *args, **kwargs):
+        """Run `fn` serialized with every other mutation of this game."""
+        return self.commands.call(self._run_command, fn, args, kwargs)
+
+    def dispatch(self, player_id, action):
+        """Apply an action through the game's command queue and return its result."""
+        return self.commands.call(self._run_command, self.process_action, (player_id, action), {}, player_id, action)
+
+    def _run_command(self, fn, args, kwargs, actor=None, action=None):
+        # executed by the command queue; journals the outermost command if it changed the game
+        if self._in_command:
+            return fn(*args, **kwargs)
+        self._in_command = True
+        base = self.revision
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            self._in_command = False
+            if self.revision != base:
+                self.last_active = time.time()
+                if self.persistence is not None:
+                    try:
+                        self.persistence.record(self, base, actor, action)
+                    except Exception as e:
+                        log.error('failed to journal command', game=self.id, error=str(e))
+                if self._pollers:
+                    with self._changed:
+                        self._changed.notify_all()
+                if spectators.watching(self.id):
+                    spectators.changed(self)
+
+    def wait_for_change(self, rev, timeout):
+        """Block until the revision differs from `rev` or `timeout` expires.
+
+        Returns True when the game changed. Used by long-polling readers.
+        """
+        if self.revision != rev:
+            return True
+        with self._changed:
+            self._pollers += 1
+            try:
+                return self._changed.wait_for(lambda: self.revision != rev, timeout)
+            finally:
+                self._pollers -= 1
+
+    def snapshot(self):
+        """Consistent full state (not torn by a concurrent action)."""
+        return self.commands.call(self.to_dict)
+
+    def snapshot_json(self):
+        """to_dict() as JSON bytes, encoded once per revision.
+
+        Every mutation bumps the revision, so repeat readers (REST pollers,
+        joiners, resyncing clients) reuse the same bytes until the next change.
+        """
+        return self.encoded_snapshot()[1]
+
+    def snapshot_gzip(self):
+        """gzip-compressed snapshot_json(), compressed at most once per revision."""
+        return self.encoded_snapshot(True)[2]
+
+    def snapshot_msgpack(self):
+        """Compact MessagePack snapshot (game.wire.pack), encoded at most once per revision."""
+        cache = self._snapshot_cache
+        if cache is not None and cache[0] == self.revision and cache[3] is not None:
+            metrics.SNAPSHOT_CACHE.inc('hit')
+            return cache[3]
+        return self.commands.call(self._encode_snapshot, packed=True)[3]
+
+    def encoded_snapshot(self, compressed=False):
+        """Cached [revision, JSON bytes, gzip bytes or None, msgpack bytes or None] for the current revision."""
+        cache = self._snapshot_cache
+        if cache is not None and cache[0] == self.revision and (cache[2] is not None or not compressed):
+            metrics.SNAPSHOT_CACHE.inc('hit')
+            return cache
+        return self.commands.call(self._encode_snapshot, compressed)
+
+    def _encode_snapshot(self, compressed=False, packed=False):
+        # runs in the command queue so the cached bytes match `revision`
+        cache = self._snapshot_cache
+        if cache is None or cache[0] != self.revision:
+            metrics.SNAPSHOT_CACHE.inc('miss')
+            state = self.to_dict()
+            data = json.dumps(state, separators=(',', ':'), default=str).encode('utf-8')
+            cache = self._snapshot_cache = [self.revision, data, None, wire.pack(state) if packed else None]
+        if compressed and cache[2] is None:
+            cache[2] = gzip.compress(cache[1], compresslevel=5)
+        if packed and cache[3] is None:
+            cache[3] = wire.pack(self.to_dict())
+        return cache
+
+    def connect_player(self, player_id, connected=True):
+        """Set a player's connection flag; returns the resulting state delta."""
+        def _apply():
+            base = self.revision
+            self.set_player_connected(player_id, connected)
+            return self.diff_since(base)
+        return self.call(_apply)
+
+    def __getstate__(self):
+        # pickled by persistence snapshots: runtime members are rebuilt on load
+        state = self.__dict__.copy()
+        for key in ('commands', 'engine', 'occupancy', '_bots', '_in_command', '_snapshot_cache', '_changed', '_pollers',
+                    '_views'):
+            state.pop(key, None)
+        state['_bot_specs'] = [(b.player_id, b.name, b.think_interval) for b in getattr(self, '_bots', [])]
+        # generator position, so journal replay can move it to the last entry's
+        rng = state.pop('rng')
+        state['rng_state'] = rng.getstate()
+        state['rng_draws'] = getattr(rng, 'draws', 0)
+        return state
+
+    def frozen(self):
+        """Point-in-time copy that pickles like this game, for the persistence writer.
+
+        Taken inside a command: costs a copy of the entities, turn order and log
+        ring (and of the map only when a tile changed since the last one), the
+        pickling itself happens on the writer thread.
+        """
+        state = self.__getstate__()
+        state['players'] = {eid: p.copy() for eid, p in self.players.items()}
+        state['monsters'] = {eid: m.copy() for eid, m in self.monsters.items()}
+        state['map'] = self.map.frozen() if self.map else None
+        state['turns'] = self.turns.copy()
+        state['log'] = self.log.copy()
+        state['_removed'] = dict(self._removed)
+        return _FrozenGame(state)
+
+    @property
+    def turn_queue(self):
+        return self.turns.ids()
+
+    @turn_queue.setter
+    def turn_queue(self, ids):
+        # rebuild the ring from a list (journal replay, old snapshots)
+        entries = []
+        for eid in ids:
+            ent = self.players.get(eid) or self.monsters.get(eid)
+            entries.append((getattr(ent, 'initiative', 0), eid))
+        self.turns.reset(entries, self.current_turn)
+
+    def __setstate__(self, state):
+        # snapshots pickled before the initiative ring stored a plain list
+        legacy_queue = state.pop('turn_queue', None)
+        # snapshots pickled before rng_state held a plain random.Random
+        rng_state = state.pop('rng_state', None)
+        rng_draws = state.pop('rng_draws', 0)
+        legacy_rng = state.pop('rng', None)
+        self.__dict__.update(state)
+        self.rng = GameRandom()
+        if rng_state is None and legacy_rng is not None:
+            rng_state = legacy_rng.getstate()
+        if rng_state is not None:
+            self.rng.setstate(rng_state)
+        self.rng.draws = rng_draws
+        if 'turns' not in state:
+            self.turns = TurnOrder()
+            self.turn_queue = legacy_queue or []
+        # restored games get a fresh start for idle / LRU accounting
+        self.last_active = time.time()
+        self.__dict__.setdefault('turn_budget', TURN_BUDGET)
+        self.__dict__.setdefault('view_radius', 0)
+        self.__dict__.setdefault('max_entities', MAX_ENTITIES)
+        self._views = {}
+        # maps were nested lists before game.mapgen
+        if isinstance(self.map, list):
+            self.map = TileMap.from_rows(self.map)
+        self._in_command = False
+        self._snapshot_cache = None
+        self._changed = threading.Condition()
+        self._pollers = 0
+        self.commands = CommandQueue()
+        self.engine = Engine(self)
+        self.occupancy = SpatialIndex()
+        self.occupancy.rebuild(list(self.players.values()) + list(self.monsters.values()))
+
+    def apply_patch(self, patch):
+        """Apply a diff_since() patch on top of this state (journal replay)."""
+        rev = patch['rev']
+        for key, cls in (('players', Player), ('monsters', Monster)):
+            registry = getattr(self, key)
+            for d in patch.get(key, ()):
+                ent = registry.get(d['id'])
+                if ent is None:
+                    ent = registry[d['id']] = cls.from_dict(d)
+                else:
+                    ent.update_from(d)
+                ent._rev = rev
+        for eid in patch.get('removed', ()):
+            self.players.pop(eid, None)
+            self.monsters.pop(eid, None)
+            self._removed[eid] = rev
+        self.status = patch.get('status', self.status)
+        self.current_turn = patch.get('current_turn', self.current_turn)
+        if 'turn_queue' in patch:
+            self.turn_queue = patch['turn_queue']
+            self._queue_rev = rev
+        elif self.current_turn in self.turns:
+            self.turns.set_current(self.current_turn)
+        if 'map' in patch:
+            # journals written when patches carried the whole map; the spawn points
+            # are not on the wire, maps only change by regeneration from the seed
+            self.map = TileMap.from_rows(patch['map'], self.map.spawns if self.map else ())
+            self._map_rev = rev
+        elif 'map_info' in patch:
+            if self.map is None:
+                self.map = mapgen.generate(seed=self.seed)
+            self._map_rev = rev
+        for entry in patch.get('log', ()):
+            self.log.restore(entry)
+        self.revision = max(self.revision, rev)
+        self.occupancy.rebuild(list(self.players.values()) + list(self.monsters.values()))
+
+    def _bump(self):
+        self.revision += 1
+        return self.revision
+
+    def touch(self, *entities):
+        """Record that the given entities changed in a new state revision."""
+        rev = self._bump()
+        for ent in entities:
+            ent._rev = rev
+            ent._cache = None
+        return rev
+
+    def touch_queue(self):
+        """Record that turn_queue/current_turn changed in a new state revision."""
+        self._queue_rev = self._bump()
+        return self._queue_rev
+
+    def add_log(self, entry):
+        # every log entry is tagged with the revision that produced it
+        entry['rev'] = self._bump()
+        self.log.append(entry)
+        return entry
 
     def start(self):
         # use engine to roll initiative
         self.engine.roll_initiative()
         self.status = 'running'
-        self.log.append({'event': 'game_started', 'time': time.time()})
-        # generate a simple map: 16x12 grid, all floor (0)
-        self.map = [[0 for _ in range(16)] for _ in range(12)]
+        self.engine.arm_turn_timer()
+        self.add_log({'event': 'game_started', 'time': time.time()})
+        # games pickled before maps were generated at creation
+        if self.map is None:
+            self.map = mapgen.generate(seed=self.seed)
+            self._map_rev = self._bump()
 
     def to_dict(self):
-        return {
+        started = time.perf_counter()
+        state = {
             'id': self.id,
             'name': self.name,
             'status': self.status,
@@ -174,48 +642,236 @@ class GameState:
             'monsters': [m.to_dict() for m in self.monsters.values()],
             'turn_queue': self.turn_queue,
             'current_turn': self.current_turn,
-            'log': self.log,
-            'map': self.map,
+            'log': self.log.tail(SNAPSHOT_LOG_ENTRIES),
+            'log_seq': self.log.last_seq,
+            # tiles are fetched by chunk (map_chunks event, /map/chunk/<cx>/<cy>)
+            'map_info': self.map.info(self._map_rev) if self.map else None,
+            'rev': self.revision,
+            'seed': self.seed,
+            'view_radius': self.view_radius,
+        }
+        metrics.observe_state(time.perf_counter() - started, state)
+        return state
+
+    def diff_since(self, rev):
+        """Return a patch with everything that changed after revision `rev`.
+
+        Returns None when `rev` is unknown (e.g. newer than the server state);
+        the caller should then send a full `to_dict()` snapshot instead.
+        """
+        if not isinstance(rev, int) or rev < 0 or rev > self.revision:
+            return None
+        # new log entries are at the end of the log: walk back until we reach known ones
+        new_log = []
+        for entry in reversed(self.log):
+            if entry.get('rev', 0) <= rev:
+                break
+            new_log.append(entry)
+        new_log.reverse()
+        patch = {
+            'id': self.id,
+            'base_rev': rev,
+            'rev': self.revision,
+            'status': self.status,
+            'current_turn': self.current_turn,
+            'players': [p.to_dict() for p in self.players.values() if p._rev > rev],
+            'monsters': [m.to_dict() for m in self.monsters.values() if m._rev > rev],
+            'log': new_log,
+        }
+        removed = [eid for eid, r in self._removed.items() if r > rev]
+        if removed:
+            patch['removed'] = removed
+        if self._queue_rev > rev:
+            patch['turn_queue'] = self.turn_queue
+        if self._map_rev > rev:
+            patch['map_info'] = self.map.info(self._map_rev) if self.map else None
+        return patch
+
+    # --- fog of war: per-player views (view_radius > 0) ---
+
+    def visible_to(self, player_id):
+        """Ids `player_id` sees: itself and the alive entities within view_radius in line of sight."""
+        viewer = self.players.get(player_id)
+        if viewer is None:
+            return set()
+        vx = viewer.x
+        vy = viewer.y
+        seen = {player_id}
+        for eid in self.occupancy.within(vx, vy, self.view_radius):
+            if eid in seen:
+                continue
+            ent = self.players.get(eid) or self.monsters.get(eid)
+            if ent is not None and (not self.map or self.map.sees(vx, vy, ent.x, ent.y)):
+                seen.add(eid)
+        return seen
+
+    def viewers(self):
+        """Players whose clients get per-player views: connected humans."""
+        bots = {b.player_id for b in getattr(self, '_bots', [])}
+        return [pid for pid, p in self.players.items() if p.is_connected and pid not in bots]
+
+    @staticmethod
+    def _visible_log(entries, visible):
+        # moves reveal positions (kept for visible actors), initiative entries list the whole roster
+        out = []
+        for e in entries:
+            event = e.get('event')
+            if event in ('initiative_roll', 'initiative_add'):
+                continue
+            if event == 'move' and e.get('actor_id') not in visible:
+                continue
+            out.append(e)
+        return out
+
+    def log_for(self, player_id, entries):
+        """The log `entries` that `player_id` may read (all of them without fog of war)."""
+        if not self.view_radius:
+            return entries
+        return self._visible_log(entries, self.visible_to(player_id))
+
+    def view_of(self, player_id, record=True):
+        """to_dict() reduced to what `player_id` sees; `record` makes it the base of its next view_patch.
+
+        Built from the entities around the viewer (spatial index), never from
+        the whole room, so a view costs the same in a crowded game.
+        """
+        visible = self.visible_to(player_id)
+        state = {
+            'id': self.id,
+            'name': self.name,
+            'status': self.status,
+            'players': [self.players[eid].to_dict() for eid in visible if eid in self.players],
+            'monsters': [self.monsters[eid].to_dict() for eid in visible if eid in self.monsters],
+            'turn_queue': self.turns.order_of(visible),
+            'current_turn': self.current_turn,
+            'log': self._visible_log(self.log.tail(SNAPSHOT_LOG_ENTRIES), visible),
+            'log_seq': self.log.last_seq,
+            'map_info': self.map.info(self._map_rev) if self.map else None,
+            'rev': self.revision,
+            'seed': self.seed,
+            'view_radius': self.view_radius,
         }
+        if record:
+            self._views[player_id] = visible
+        return state
+
+    def view_patch(self, player_id, patch):
+        """diff_since() patch for `player_id`: changed visible entities, entities that came
+        into view (in full, even if unchanged) and `hidden` ids of those that left it."""
+        visible = self.visible_to(player_id)
+        before = self._views.get(player_id, set())
+        self._views[player_id] = visible
+        out = dict(patch)
+        for key, registry in (('players', self.players), ('monsters', self.monsters)):
+            changed = [d for d in patch[key] if d['id'] in visible]
+            sent = {d['id'] for d in changed}
+            changed.extend(registry[eid].to_dict() for eid in visible - before - sent if eid in registry)
+            out[key] = changed
+        hidden = [eid for eid in before - visible if eid in self.players or eid in self.monsters]
+        if hidden:
+            out['hidden'] = hidden
+        out['log'] = self._visible_log(patch['log'], visible)
+        # the order of the entities in view only: its size does not grow with the room
+        if 'turn_queue' in patch:
+            out['turn_queue'] = self.turns.order_of(visible)
+        return out
+
+    def _emit_views(self, base, result=None, actor_id=None, skip_sid=None):
+        # one delta per connected player, in its own room; the action result
+        # only goes to those who saw the actor
+        patch = self.diff_since(base)
+        for pid in self.viewers():
+            room = _si.player_room(self.id, pid)
+            view = self.view_patch(pid, patch)
+            if result is not None and (actor_id is None or actor_id in self._views[pid]):
+                _si.emit_game(room, 'action_result', result, skip_sid=skip_sid)
+            _si.emit_game(room, 'state_delta', view, skip_sid=skip_sid)
+
+    def emit_delta(self, patch, skip_sid=None, emit=None):
+        """Send a diff_since() patch to the game's clients (per-player views under fog of war)."""
+        if self.view_radius:
+            self.call(self._emit_views, patch['base_rev'], None, None, skip_sid)
+        else:
+            _si.emit_game(self.id, 'state_delta', patch, skip_sid=skip_sid, emit=emit)
+
+    def emit_views(self, event):
+        """Fog of war: send each connected player its own full view as `event`."""
+        def _emit():
+            for pid in self.viewers():
+                _si.emit_game(_si.player_room(self.id, pid), event, self.view_of(pid))
+        self.call(_emit)
+
+    def emit_about(self, event, payload, keys=('playerId',)):
+        """Send `event` to the game room; under fog of war only to the players who see
+        one of the entities named by `payload[keys]`, with the ids they do not see
+        set to None. Runs inside a command (reads positions)."""
+        if not self.view_radius:
+            _si.emit_event(event, payload, to=self.id)
+            return
+        for pid in self.viewers():
+            seen = self.visible_to(pid)
+            if not any(payload.get(k) in seen for k in keys):
+                continue
+            view = {k: (v if k not in keys or v in seen else None) for k, v in payload.items()}
+            _si.emit_event(event, view, to=_si.player_room(self.id, pid))
+
+    def _broadcast(self, base, result=None, actor_id=None):
+        # server-side emit via socketio if available: optional action result,
+        # then only what changed since revision `base`
+        try:
+            if _si and hasattr(_si, 'emit_event') and _si.get_socketio():
+                if self.view_radius:
+                    self._emit_views(base, result, actor_id)
+                    return
+                if result is not None:
+                    _si.emit_game(self.id, 'action_result', result)
+                _si.emit_game(self.id, 'state_delta', self.diff_since(base))
+        except Exception:
+            pass
 
     def process_action(self, player_id, action):
+        started = time.perf_counter()
+        result = self._process_action(player_id, action)
+        metrics.observe_action(action.get('type'), time.perf_counter() - started, result)
+        return result
+
+    def _process_action(self, player_id, action):
         # Action processor: move / attack / end_turn / respawn
         actor = self.players.get(player_id) or self.monsters.get(player_id)
         if not actor:
             return _err('actor_not_found')
+        base = self.revision
         # allow 'respawn'/'revive' actions even if actor is dead; otherwise dead actors cannot act
         typ = action.get('type')
         # Enforce turn order: if a turn queue exists (or current_turn is set), only the entity whose id matches
         # current_turn may perform actions (except respawn/revive which are allowed anytime)
-        if typ not in ('respawn', 'revive') and (self.current_turn is not None or self.turn_queue):
+        if typ not in ('respawn', 'revive') and (self.current_turn is not None or len(self.turns)):
             if actor.id != self.current_turn:
                 return _err('not_your_turn')
         if getattr(actor, 'hp', 0) <= 0 and typ not in ('respawn', 'revive'):
             return _err('actor_dead')
         if typ == 'move':
-            x = int(action.get('x', actor.position['x']))
-            y = int(action.get('y', actor.position['y']))
+            x = int(action.get('x', actor.x))
+            y = int(action.get('y', actor.y))
+            if self.map and not self.map.passable(x, y):
+                return _err('blocked')
             # don't allow moving onto occupied tile (alive entities)
-            occupied = any((p.position.get('x') == x and p.position.get('y') == y) for p in list(self.players.values()) + list(self.monsters.values()) if p.id != actor.id and getattr(p, 'hp', 1) > 0)
-            if occupied:
+            if self.occupancy.is_occupied(x, y, ignore=actor.id):
                 return _err('occupied')
-            actor.position = {'x': x, 'y': y}
+            actor.x = x
+            actor.y = y
+            self.occupancy.place(actor.id, x, y)
+            self.touch(actor)
             # log with readable name and id
-            self.log.append({'event': 'move', 'actor': actor.name, 'actor_id': actor.id, 'pos': actor.position, 'time': time.time()})
-            res = {'ok': True, 'action': 'move', 'pos': actor.position, 'message': f"Déplacé en {actor.position['x']},{actor.position['y']}"}
+            self.add_log({'event': 'move', 'actor': actor.name, 'actor_id': actor.id, 'pos': actor.position, 'time': time.time()})
+            res = {'ok': True, 'action': 'move', 'pos': actor.position, 'message': f"Déplacé en {x},{y}"}
             # advance the turn after a move so player cannot both move and attack in same turn
             try:
                 next_entity = self.engine.advance_turn()
                 res['next'] = next_entity
             except Exception:
                 pass
-            # server-side emit via socketio if available
-            try:
-                if _si and hasattr(_si, 'emit_event'):
-                    _si.emit_event('action_result', res, to=self.id)
-                    _si.emit_event('state_update', self.to_dict(), to=self.id)
-            except Exception:
-                pass
+            self._broadcast(base, res, actor.id)
             return res
 
         elif typ == 'attack':
@@ -227,35 +883,37 @@ class GameState:
             if getattr(target, 'hp', 1) <= 0:
                 return _err('target_dead')
             # perform attack roll (1-20) and damage (1-6) on hit
-            dx = actor.position.get('x', 0) - target.position.get('x', 0)
-            dy = actor.position.get('y', 0) - target.position.get('y', 0)
+            dx = actor.x - target.x
+            dy = actor.y - target.y
             dist = math.sqrt(dx*dx + dy*dy)
-            roll = random.randint(1, 20)
+            roll = self.rng.randint(1, 20)
             hit = (roll >= getattr(target, 'ac', 10))
             dmg = 0
             if hit:
-                dmg = random.randint(1, 6)
-                target.hp -= dmg
+                dmg = self.rng.randint(1, 6)
+                target.hp = max(0, target.hp - dmg)
+                self.touch(target)
             # log attack with readable names and ids
-            self.log.append({'event': 'attack', 'actor': actor.name, 'actor_id': actor.id, 'target': target.name, 'target_id': target.id, 'dist': dist, 'roll': roll, 'hit': hit, 'dmg': dmg, 'time': time.time()})
+            self.add_log({'event': 'attack', 'actor': actor.name, 'actor_id': actor.id, 'target': target.name, 'target_id': target.id, 'dist': dist, 'roll': roll, 'hit': hit, 'dmg': dmg, 'time': time.time()})
             died = False
             if hit and target.hp <= 0:
-                target.hp = 0
                 died = True
+                self.occupancy.remove(target.id)
                 # remove from turn queue if needed
                 try:
                     self.engine.remove_entity(target.id)
                 except Exception:
                     pass
                 # log death with readable name
-                self.log.append({'event': 'death', 'entity': target.name, 'entity_id': target.id, 'time': time.time()})
+                self.add_log({'event': 'death', 'entity': target.name, 'entity_id': target.id, 'time': time.time()})
                 # If a player killed another player, increment the killer's score
                 try:
                     if target_id in self.players and actor.id in self.players:
                         killer = self.players.get(actor.id)
                         killer.score = getattr(killer, 'score', 0) + 1
+                        self.touch(killer)
                         # log the kill event with names
-                        self.log.append({'event': 'kill', 'killer': actor.name, 'killer_id': actor.id, 'victim': target.name, 'victim_id': target.id, 'time': time.time()})
+                        self.add_log({'event': 'kill', 'killer': actor.name, 'killer_id': actor.id, 'victim': target.name, 'victim_id': target.id, 'time': time.time()})
                 except Exception:
                     pass
             msg = f"Attaque {'réussie' if hit else 'manquée'}"
@@ -268,63 +926,35 @@ class GameState:
                 res['next'] = next_entity
             except Exception:
                 pass
-            # emit via socketio if available
-            try:
-                if _si and hasattr(_si, 'emit_event'):
-                    _si.emit_event('action_result', res, to=self.id)
-                    _si.emit_event('state_update', self.to_dict(), to=self.id)
-            except Exception:
-                pass
+            self._broadcast(base, res, actor.id)
             return res
 
         elif typ == 'respawn' or typ == 'revive':
             # revive the actor if dead
             if getattr(actor, 'hp', 1) > 0:
                 return _err('not_dead')
-            actor.hp = getattr(actor, 'max_hp', 10)
             # place on free tile
-            def is_occupied(x, y):
-                for p in list(self.players.values()) + list(self.monsters.values()):
-                    if p.id == actor.id:
-                        continue
-                    pos = p.position or {}
-                    if pos.get('x') == x and pos.get('y') == y and getattr(p, 'hp', 1) > 0:
-                        return True
-                return False
-
-            corners = [(0, 0), (15, 0), (0, 11), (15, 11)]
-            for cx, cy in corners:
-                if not is_occupied(cx, cy):
-                    actor.position = {'x': cx, 'y': cy}
-                    break
-            else:
-                if self.map:
-                    placed = False
-                    for y in range(len(self.map)):
-                        for x in range(len(self.map[0])):
-                            if not is_occupied(x, y):
-                                actor.position = {'x': x, 'y': y}
-                                placed = True
-                                break
-                        if placed:
-                            break
-                    if not placed:
-                        actor.position = {'x': 0, 'y': 0}
-                else:
-                    actor.position = {'x': 0, 'y': 0}
-            self.log.append({'event': 'respawn', 'player': actor.name, 'player_id': actor.id, 'time': time.time()})
+            spawn = self._find_spawn(actor.id)
+            if spawn is None:
+                return _err('no_free_tile')
+            actor.hp = getattr(actor, 'max_hp', 10)
+            x, y = spawn
+            actor.x = x
+            actor.y = y
+            self.occupancy.place(actor.id, x, y)
+            self.touch(actor)
+            self.add_log({'event': 'respawn', 'player': actor.name, 'player_id': actor.id, 'time': time.time()})
             # ensure actor is in turn queue so they become active again
             try:
-                if actor.id not in self.turn_queue:
-                    self.turn_queue.append(actor.id)
-                    if not self.current_turn:
-                        self.current_turn = actor.id
+                self.engine.join_turn_order(actor.id, actor.initiative)
             except Exception:
                 pass
+            self._broadcast(base)
             return {'ok': True, 'action': 'respawn', 'pos': actor.position, 'message': 'Réapparu'}
 
         elif typ == 'end_turn':
             next_entity = self.engine.advance_turn()
+            self._broadcast(base)
             return {'ok': True, 'action': 'end_turn', 'next': next_entity}
 
         else:
@@ -0,0 +1,28 @@
+#!/usr/bin/env bash
+# start_cluster.sh - démarre N workers FunGame (un processus gunicorn + eventlet chacun)
+# Worker i écoute sur le port BASE_PORT+i et possède les parties dont l'id commence par "i-".
+# Les workers communiquent par des sockets unix dans FUNGAME_BUS (voir game/cluster.py) ;
+# placer deploy/nginx.cluster.conf devant pour le routage par partie.
+# Usage:
+#   WORKERS=2 ./scripts/start_cluster.sh
+#   WORKERS=4 BASE_PORT=5000 BIND_HOST=0.0.0.0 ./scripts/start_cluster.sh
+
+set -euo pipefail
+SCRIPT_DIR=$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)
+cd "$SCRIPT_DIR/.."
+
+WORKERS=${WORKERS:-2}
+BASE_PORT=${BASE_PORT:-5000}
+BIND_HOST=${BIND_HOST:-0.0.0.0}
+export FUNGAME_WORKERS=$WORKERS
+export FUNGAME_BUS=${FUNGAME_BUS:-unix:/tmp/fungame-bus}
+
+pids=()
+trap 'kill "${pids[@]}" 2>/dev/null || true' INT TERM EXIT
+for ((i = 0; i < WORKERS; i++)); do
+  FUNGAME_WORKER_INDEX=$i gunicorn -k eventlet -w 1 --bind "$BIND_HOST:$((BASE_PORT + i))" wsgi:app &
+  pids+=($!)
+  echo "worker $i -> $BIND_HOST:$((BASE_PORT + i)) (pid $!)"
+done
+wait -n
+echo "un worker s'est arrêté, arrêt du cluster" >&2
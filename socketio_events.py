@@ -1,12 +1,78 @@
-from flask_socketio import emit, join_room, leave_room
+from flask_socketio import emit as _emit, join_room, leave_room
 from flask import request
 
 # support both package-relative and top-level imports
 from game.state import GameStore
+from game.spectators import spectators
+from game import cluster, wire
+from game.wire import RawJSON
+import metrics
+import socketio_instance as _si
+from logger import get_logger
+
+log = get_logger('socket')
+# per-action traces (high volume): DEBUG, off unless FUNGAME_LOG_LEVELS=actions=DEBUG
+action_log = get_logger('actions')
 
 
 # mapping of websocket session id to (game_id, player_id)
 _session_map = {}
+# map chunks each session already received: sid -> (map rev, {(cx, cy): version})
+_sent_chunks = {}
+# chunks pushed around a player's position (1 = its chunk and the 8 around it,
+# enough to cover the 16x12 client viewport)
+CHUNK_RADIUS = 1
+
+
+def emit(event, *args, **kwargs):
+    # flask_socketio.emit, counted per event name for /api/metrics
+    metrics.count_emit(event)
+    return _emit(event, *args, **kwargs)
+
+
+def _is_binary(game_id, sid):
+    # MessagePack client, as a player or as a spectator
+    return bool(sid) and (_si.is_binary(game_id, sid) or _si.is_binary(_si.spectator_room(game_id), sid))
+
+
+def _snapshot_for(game, sid):
+    # full state in the encoding negotiated by `sid` (cached per revision either way)
+    if game.view_radius:
+        # fog of war: the player's own view, never shared between clients
+        player_id = (_session_map.get(sid) or (None, None))[1]
+        view = game.call(game.view_of, player_id)
+        return wire.pack(view) if sid and _si.is_binary(game.id, sid) else view
+    if _is_binary(game.id, sid):
+        return game.snapshot_msgpack()
+    return RawJSON(game.snapshot_json())
+
+
+def _push_chunks(game, sid, player_id):
+    """Send `sid` the map chunks around its player that it has not received at their current version."""
+    if not sid or not game.map:
+        return 0
+
+    def _collect():
+        player = game.players.get(player_id)
+        if player is None:
+            return None, []
+        rev, known = _sent_chunks.get(sid, (None, {}))
+        if rev != game._map_rev:
+            known = {}
+            _sent_chunks[sid] = (game._map_rev, known)
+        chunks = []
+        for cx, cy in game.map.chunks_around(player.x, player.y, CHUNK_RADIUS):
+            version = game.map.chunk_version(cx, cy)
+            if known.get((cx, cy)) != version:
+                known[(cx, cy)] = version
+                chunks.append(game.map.chunk(cx, cy))
+        return game.map.info(game._map_rev), chunks
+
+    info, chunks = game.call(_collect)
+    if chunks:
+        encoding = wire.MSGPACK if _si.is_binary(game.id, sid) else wire.JSON
+        emit('map_chunks', wire.chunks_message(game.id, info, chunks, encoding), to=sid)
+    return len(chunks)
 
 
 def register_socketio_handlers(socketio):
@@ -15,12 +81,12 @@ def register_socketio_handlers(socketio):
     def on_connect():
         sid = getattr(request, 'sid', None)
         addr = getattr(request, 'remote_addr', None)
-        print(f'client connected sid={sid} remote_addr={addr}')
+        log.info('client connected', sid=sid, remote_addr=addr)
         emit('connected', {'msg': 'connected', 'sid': sid, 'remote_addr': addr})
 
     @socketio.on('join')
     def on_join(data, ack=None):
-        # expected data: { gameId, playerId }
+        # expected data: { gameId, playerId, encoding? ('json' | 'msgpack') }
         data = data or {}
         game_id = data.get('gameId')
         player_id = data.get('playerId')
@@ -30,6 +96,13 @@ def register_socketio_handlers(socketio):
                 try: ack({'error': 'gameId and playerId required'})
                 except Exception: pass
             return
+        if not cluster.is_local(game_id):
+            # the client connected to the wrong worker: it must reconnect with ?game=<gameId>
+            emit('error', {'message': 'game held by another worker', 'worker': cluster.owner_of(game_id)})
+            if callable(ack):
+                try: ack({'error': 'game held by another worker', 'worker': cluster.owner_of(game_id)})
+                except Exception: pass
+            return
         game = GameStore.get_game(game_id)
         if not game:
             emit('error', {'message': 'game not found'})
@@ -51,15 +124,24 @@ def register_socketio_handlers(socketio):
             return
         # join socket.io room
         join_room(game_id)
+        # and the player's own room (per-player views under fog of war)
+        player_room = _si.player_room(game_id, player_id)
+        join_room(player_room)
+        sid = getattr(request, 'sid', None)
+        encoding = wire.negotiate(data.get('encoding')) if sid else wire.JSON
+        if encoding == wire.MSGPACK:
+            # binary clients also get their own room for the packed broadcasts
+            join_room(_si.binary_room(game_id))
+            join_room(_si.binary_room(player_room))
+            _si.set_binary(game_id, sid)
+            _si.set_binary(player_room, sid)
         # mark player connected in game state
-        game.set_player_connected(player_id, True)
+        patch = game.connect_player(player_id, True)
         # store mapping for disconnect handling
-        sid = getattr(request, 'sid', None)
         remote = getattr(request, 'remote_addr', None)
         if sid:
             _session_map[sid] = (game_id, player_id)
-        # verbose log
-        print(f"Player {player_id} connected via socket to game {game_id} (sid={sid}, remote_addr={remote})")
+        log.info('player joined', game=game_id, player=player_id, sid=sid, remote_addr=remote, encoding=encoding)
         # send 'joined' only to the joining client (include player's name so client can display it immediately)
         try:
             player_obj = game.players.get(player_id)
@@ -67,12 +149,16 @@ def register_socketio_handlers(socketio):
         except Exception:
             player_name = None
         if sid:
-            emit('joined', {'gameId': game_id, 'playerId': player_id, 'name': player_name}, to=sid)
+            emit('joined', {'gameId': game_id, 'playerId': player_id, 'name': player_name, 'encoding': encoding}, to=sid)
         else:
             emit('joined', {'gameId': game_id, 'playerId': player_id, 'name': player_name})
-        # send initial state update to all in the room
-        print(f"emitting state_update to game {game_id} players")
-        emit('state_update', game.to_dict(), to=game_id)
+        # full snapshot only for the joining client; the rest of the room gets a delta
+        if sid:
+            emit('state_update', _snapshot_for(game, sid), to=sid)
+            _push_chunks(game, sid, player_id)
+            game.emit_delta(patch, skip_sid=sid, emit=emit)
+        else:
+            emit('state_update', RawJSON(game.snapshot_json()))
         # ack success to caller if they provided a callback
         if callable(ack):
             try:
@@ -80,6 +166,83 @@ def register_socketio_handlers(socketio):
             except Exception:
                 pass
 
+    @socketio.on('sync')
+    def on_sync(data):
+        # client asks for everything since its last applied revision: { gameId, rev }
+        data = data or {}
+        game_id = data.get('gameId')
+        if not game_id:
+            emit('error', {'message': 'gameId required'})
+            return
+        game = GameStore.get_game(game_id)
+        if not game:
+            emit('error', {'message': 'game not found'})
+            return
+        sid = getattr(request, 'sid', None)
+        # fog of war: views are not diffable from an arbitrary revision, resend the full view
+        patch = None if game.view_radius else game.call(game.diff_since, data.get('rev'))
+        if patch is None:
+            # unknown revision (new client, server restart...): resync with a full snapshot
+            emit('state_update', _snapshot_for(game, sid))
+        elif _is_binary(game_id, sid):
+            emit('state_delta', wire.pack(patch))
+        else:
+            emit('state_delta', patch)
+
+    @socketio.on('spectate')
+    def on_spectate(data, ack=None):
+        # read-only watcher: { gameId, encoding? ('json' | 'msgpack') }; no player is created
+        data = data or {}
+        game_id = data.get('gameId')
+        sid = getattr(request, 'sid', None)
+        error = None
+        game = None
+        if not game_id or not sid:
+            error = {'message': 'gameId required'}
+        elif not cluster.is_local(game_id):
+            error = {'message': 'game held by another worker', 'worker': cluster.owner_of(game_id)}
+        else:
+            game = GameStore.get_game(game_id)
+            if not game:
+                error = {'message': 'game not found'}
+            elif game.view_radius:
+                # a spectator would see what the fog hides from the players
+                error = {'message': 'spectating is disabled in fog-of-war games'}
+        if error:
+            emit('error', error)
+            if callable(ack):
+                try: ack(dict(error, error=error['message']))
+                except Exception: pass
+            return
+        previous = spectators.game_of(sid)
+        if previous and previous != game_id:
+            leave_room(_si.spectator_room(previous))
+            leave_room(_si.binary_room(_si.spectator_room(previous)))
+        room = _si.spectator_room(game_id)
+        join_room(room)
+        encoding = wire.negotiate(data.get('encoding'))
+        if encoding == wire.MSGPACK:
+            join_room(_si.binary_room(room))
+        count = spectators.add(game, sid, encoding == wire.MSGPACK)
+        log.info('spectator joined', game=game_id, sid=sid, encoding=encoding, spectators=count)
+        emit('spectating', {'gameId': game_id, 'encoding': encoding, 'fps': spectators.fps}, to=sid)
+        # the snapshot cached for this revision: shared with every other reader
+        emit('state_update', _snapshot_for(game, sid), to=sid)
+        if callable(ack):
+            try:
+                ack({'ok': True})
+            except Exception:
+                pass
+
+    @socketio.on('unspectate')
+    def on_unspectate(data=None):
+        sid = getattr(request, 'sid', None)
+        game_id = spectators.remove(sid)
+        if game_id:
+            leave_room(_si.spectator_room(game_id))
+            leave_room(_si.binary_room(_si.spectator_room(game_id)))
+            log.info('spectator left', game=game_id, sid=sid)
+
     @socketio.on('start_game')
     def on_start(data):
         data = data or {}
@@ -94,9 +257,13 @@ def register_socketio_handlers(socketio):
         if game.status != 'waiting':
             emit('error', {'message': 'game already started or finished'})
             return
-        game.start()
-        print(f"game {game_id} started, broadcasting")
-        emit('game_started', game.to_dict(), to=game_id)
+        game.call(game.start)
+        log.info('game started', game=game_id)
+        if game.view_radius:
+            game.emit_views('game_started')
+        else:
+            _si.emit_game(game_id, 'game_started', RawJSON(game.snapshot_json()), packed=game.snapshot_msgpack,
+                          emit=emit)
 
     @socketio.on('action')
     def on_action(data):
@@ -115,7 +282,7 @@ def register_socketio_handlers(socketio):
         if player_id not in game.players:
             emit('error', {'message': 'player not in game'})
             return
-        result = game.process_action(player_id, action)
+        result = game.dispatch(player_id, action)
         # If result indicates error, send it only to the caller and don't broadcast
         sid = getattr(request, 'sid', None)
         if isinstance(result, dict) and result.get('error'):
@@ -134,24 +301,35 @@ def register_socketio_handlers(socketio):
                 except Exception:
                     pass
             # do not broadcast state in case of client error
-            print(f"rejected action from {player_id} in game {game_id}: {result}")
+            action_log.debug('action rejected', game=game_id, player=player_id, action=action, result=result)
             return
-        # broadcast action result and full state snapshot
-        print(f"action by {player_id} in game {game_id}: {action}, result: {result}")
-        # action_result/state_update emitted from GameState.process_action; do not duplicate here
+        # action result and state delta are broadcast by the game itself
+        action_log.debug('action', game=game_id, player=player_id, action=action, result=result)
+        # action_result/state_delta emitted from GameState.process_action; do not duplicate here
         # still emit an acknowledgement to the caller if desired
         try:
             if sid:
                 emit('action_ack', {'ok': True}, to=sid)
         except Exception:
             pass
+        # the player may now see chunks it has not received yet
+        if action.get('type') in ('move', 'respawn', 'revive'):
+            try:
+                _push_chunks(game, sid, player_id)
+            except Exception as e:
+                log.warning('failed to push map chunks', game=game_id, sid=sid, error=str(e))
 
     @socketio.on('disconnect')
     def on_disconnect():
         sid = getattr(request, 'sid', None)
         remote = getattr(request, 'remote_addr', None)
-        print(f'client disconnected sid={sid} remote_addr={remote}')
+        log.info('client disconnected', sid=sid, remote_addr=remote)
         mapping = _session_map.pop(sid, None)
+        _sent_chunks.pop(sid, None)
+        spectators.remove(sid)
+        if isinstance(mapping, (list, tuple)) and len(mapping) == 2:
+            _si.set_binary(mapping[0], sid, False)
+            _si.set_binary(_si.player_room(*mapping), sid, False)
         if mapping:
             # be robust: mapping might not be a 2-tuple in edge cases
             game_id = None
@@ -163,12 +341,13 @@ def register_socketio_handlers(socketio):
                 player_id = mapping.get('playerId') or mapping.get('player_id')
             else:
                 # unknown format: skip
-                print('warning: unexpected session mapping format', mapping)
+                log.warning('unexpected session mapping format', mapping=mapping)
             if game_id and player_id:
                 game = GameStore.get_game(game_id)
                 if game:
-                    game.set_player_connected(player_id, False)
-                    emit('player_disconnected', {'playerId': player_id}, to=game_id)
+                    patch = game.connect_player(player_id, False)
+                    game.call(game.emit_about, 'player_disconnected', {'playerId': player_id})
+                    game.emit_delta(patch, emit=emit)
 
     # optional: allow explicit leave
     @socketio.on('leave')
@@ -179,11 +358,17 @@ def register_socketio_handlers(socketio):
         if not game_id or not player_id:
             emit('error', {'message': 'gameId and playerId required'})
             return
-        leave_room(game_id)
+        player_room = _si.player_room(game_id, player_id)
+        for room in (game_id, _si.binary_room(game_id), player_room, _si.binary_room(player_room)):
+            leave_room(room)
         sid = getattr(request, 'sid', None)
+        _si.set_binary(game_id, sid, False)
+        _si.set_binary(player_room, sid, False)
         if sid and sid in _session_map:
             _session_map.pop(sid, None)
+        _sent_chunks.pop(sid, None)
         game = GameStore.get_game(game_id)
         if game:
-            game.set_player_connected(player_id, False)
-            emit('player_left', {'playerId': player_id}, to=game_id)
+            patch = game.connect_player(player_id, False)
+            game.call(game.emit_about, 'player_left', {'playerId': player_id})
+            game.emit_delta(patch, emit=emit)
@@ -3,8 +3,12 @@
 Other modules should call set_socketio(socketio_instance) during startup and
 use get_socketio() or emit_event(...) to emit events safely.
 """
+import metrics
+from game import wire
 
 _socketio = None
+# game id -> sids that negotiated the MessagePack encoding (see game.wire)
+_binary_sids = {}
 
 
 def set_socketio(sio):
@@ -33,7 +37,77 @@ def emit_event(event, *args, **kwargs):
         return False
     try:
         sio.emit(event, *args, **kwargs)
+        metrics.count_emit(event)
         return True
     except Exception:
         # swallow to keep server logic robust when socket fails
         return False
+
+
+def binary_room(game_id):
+    """Room holding the MessagePack clients of a game (they are also in the game room)."""
+    return f'{game_id}#bin'
+
+
+def player_room(game_id, player_id):
+    """Room of one player's clients (per-player views in fog-of-war games)."""
+    return f'{game_id}:{player_id}'
+
+
+def spectator_room(game_id):
+    """Room of a game's read-only spectators (see game.spectators)."""
+    return f'{game_id}#spec'
+
+
+def set_binary(game_id, sid, enabled=True):
+    sids = _binary_sids.setdefault(game_id, set())
+    if enabled:
+        sids.add(sid)
+    else:
+        sids.discard(sid)
+        if not sids:
+            _binary_sids.pop(game_id, None)
+
+
+def is_binary(game_id, sid):
+    return sid in _binary_sids.get(game_id, ())
+
+
+def emit_game(game_id, event, payload, skip_sid=None, packed=None, emit=None):
+    """Emit a state-carrying event to a game room in each client's encoding.
+
+    JSON clients get `payload` (or a RawJSON) as usual; MessagePack clients
+    get `packed` (computed once with wire.pack when not given) in their own
+    room. `emit` defaults to emit_event; socket handlers pass their emit.
+    """
+    emit = emit or emit_event
+    binary = _binary_sids.get(game_id)
+    if not binary:
+        return emit(event, payload, to=game_id, skip_sid=skip_sid)
+    skip = list(binary) + ([skip_sid] if skip_sid else [])
+    emit(event, payload, to=game_id, skip_sid=skip)
+    if packed is None:
+        packed = wire.pack(payload)
+    elif callable(packed):
+        # e.g. GameState.snapshot_msgpack: only encoded when someone needs it
+        packed = packed()
+    return emit(event, packed, to=binary_room(game_id), skip_sid=skip_sid)
+
+
+def start_background_task(target, *args, **kwargs):
+    """Start `target` in the background using the Socket.IO async mode.
+
+    Under eventlet this spawns a green thread instead of a real OS thread.
+    Falls back to a daemon thread when no Socket.IO instance is set (tests,
+    scripts).
+    """
+    sio = get_socketio()
+    if sio is not None:
+        try:
+            return sio.start_background_task(target, *args, **kwargs)
+        except Exception:
+            pass
+    import threading
+    t = threading.Thread(target=target, args=args, kwargs=kwargs, daemon=True)
+    t.start()
+    return t
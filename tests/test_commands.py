@@ -0,0 +1,91 @@
+import threading
+
+import pytest
+
+from game.commands import CommandQueue
+
+
+def test_call_returns_the_result_and_reraises_errors():
+    queue = CommandQueue()
+    assert queue.call(lambda a, b=0: a + b, 2, b=3) == 5
+
+    def boom():
+        raise KeyError('x')
+    with pytest.raises(KeyError):
+        queue.call(boom)
+    # an error does not wedge the queue
+    assert queue.call(lambda: 'ok') == 'ok'
+    assert len(queue) == 0
+
+
+def test_reentrant_call_runs_inline():
+    queue = CommandQueue()
+    order = []
+
+    def outer():
+        order.append('outer')
+        # would deadlock if it waited behind the running command
+        order.append(queue.call(lambda: 'inner'))
+        return 'done'
+    assert queue.call(outer) == 'done'
+    assert order == ['outer', 'inner']
+
+
+def test_first_caller_drains_commands_queued_meanwhile():
+    queue = CommandQueue()
+    started = threading.Event()
+    release = threading.Event()
+    ran = []
+
+    def slow():
+        started.set()
+        release.wait(5)
+        ran.append(('slow', threading.get_ident()))
+
+    owner = threading.Thread(target=queue.call, args=(slow,))
+    owner.start()
+    assert started.wait(5)
+    # queued while `slow` runs: the owner thread executes them, in order, after it
+    futures = [queue.submit(lambda i=i: ran.append((i, threading.get_ident()))) for i in range(3)]
+    assert not any(f.done() for f in futures)
+    release.set()
+    for f in futures:
+        f.result(5)
+    owner.join(5)
+    assert [name for name, _ in ran] == ['slow', 0, 1, 2]
+    assert {tid for _, tid in ran} == {owner.ident}
+    # idle again: the next caller executes its own command
+    assert queue.call(threading.get_ident) == threading.get_ident()
+
+
+def test_commands_never_overlap():
+    queue = CommandQueue()
+    state = {'n': 0, 'running': 0, 'overlap': False}
+
+    def bump():
+        state['running'] += 1
+        state['overlap'] |= state['running'] > 1
+        n = state['n']
+        state['n'] = n + 1
+        state['running'] -= 1
+
+    def worker():
+        for _ in range(200):
+            queue.call(bump)
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(10)
+    assert state['n'] == 1600
+    assert not state['overlap']
+
+
+def test_post_never_runs_in_the_caller():
+    queue = CommandQueue()
+    caller = threading.get_ident()
+    ran = queue.post(threading.get_ident)
+    assert ran.result(timeout=5) != caller
+    # a posted command that submits to its own queue still runs inline
+    assert queue.post(lambda: queue.call(lambda: 'inner')).result(timeout=5) == 'inner'
+    assert len(queue) == 0
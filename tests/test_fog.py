@@ -0,0 +1,98 @@
+import pytest
+
+from app import create_app
+from game.state import GameStore
+
+
+@pytest.fixture
+def client():
+    return create_app().test_client()
+
+
+def _fog_game(client):
+    game_id = client.post('/api/games', json={'name': 'F', 'maxPlayers': 4, 'mapWidth': 32, 'mapHeight': 32,
+                                              'viewRadius': 4, 'turnBudget': 0}).get_json()['gameId']
+    return game_id, GameStore.get_game(game_id)
+
+
+def test_rest_join_returns_the_players_view(client):
+    game_id, game = _fog_game(client)
+    a = client.post(f'/api/games/{game_id}/join', json={'autoBot': False}).get_json()
+    b = client.post(f'/api/games/{game_id}/join', json={'autoBot': False}).get_json()
+    # corner spawns of a 32x32 arena: out of each other's view
+    assert [p['id'] for p in b['players']] == [b['playerId']]
+    assert a['playerId'] not in b['turn_queue']
+
+
+def test_log_hides_moves_of_unseen_entities(client):
+    game_id, game = _fog_game(client)
+    joins = [client.post(f'/api/games/{game_id}/join', json={'autoBot': False}).get_json() for _ in range(2)]
+    tokens = {j['playerId']: j['token'] for j in joins}
+    a, b = tokens
+    mover = game.players[a]
+    game.call(game.engine.set_turn, a)
+    assert 'error' not in game.dispatch(a, {'type': 'move', 'x': mover.x + 1, 'y': mover.y})
+
+    def moves(player_id):
+        body = client.get(f'/api/games/{game_id}/log?playerId={player_id}&limit=1000',
+                          headers={'X-Player-Token': tokens[player_id]}).get_json()
+        assert body['next'] == game.log.last_seq
+        return [e for e in body['entries'] if e['event'] == 'move']
+
+    assert [e['actor_id'] for e in moves(a)] == [a]
+    assert moves(b) == []
+
+
+def test_fogged_reads_need_the_players_token(client):
+    game_id, game = _fog_game(client)
+    a = client.post(f'/api/games/{game_id}/join', json={'autoBot': False}).get_json()
+    b = client.post(f'/api/games/{game_id}/join', json={'autoBot': False}).get_json()
+    for path in ('state', 'log'):
+        url = f'/api/games/{game_id}/{path}?playerId={a["playerId"]}'
+        assert client.get(url).status_code == 403
+        assert client.get(url, headers={'X-Player-Token': b['token']}).status_code == 403
+        assert client.get(f'{url}&token={a["token"]}').status_code == 200
+    # without playerId: nobody's view
+    assert client.get(f'/api/games/{game_id}/state').get_json()['players'] == []
+    view = client.get(f'/api/games/{game_id}/state?playerId={a["playerId"]}',
+                      headers={'X-Player-Token': a['token']}).get_json()
+    assert [p['id'] for p in view['players']] == [a['playerId']]
+
+
+def test_room_events_only_name_seen_entities(monkeypatch):
+    from models import GameState, Player
+    import socketio_instance as _si
+    sent = []
+    monkeypatch.setattr(_si, 'emit_event', lambda event, payload, to=None: sent.append((to, payload)))
+    game = GameState(max_players=4, seed=5, turn_budget=0, map_width=32, map_height=32, view_radius=4)
+    players = [Player(name=n, rng=game.rng) for n in 'ABC']
+    for p in players:
+        game.add_player(p)
+        p.is_connected = True
+    a, b, c = players
+    # a and b side by side, c in another corner
+    b.x, b.y = a.x + 1, a.y
+    game.occupancy.rebuild(players)
+    game.emit_about('turn_timeout', {'gameId': game.id, 'playerId': b.id, 'next': c.id}, keys=('playerId', 'next'))
+    rooms = dict(sent)
+    assert set(rooms) == {_si.player_room(game.id, a.id), _si.player_room(game.id, b.id),
+                          _si.player_room(game.id, c.id)}
+    assert rooms[_si.player_room(game.id, a.id)] == {'gameId': game.id, 'playerId': b.id, 'next': None}
+    assert rooms[_si.player_room(game.id, c.id)] == {'gameId': game.id, 'playerId': None, 'next': c.id}
+
+
+def test_view_of_matches_the_filtered_snapshot():
+    from models import GameState, Player
+    game = GameState(max_players=12, seed=5, turn_budget=0, map_width=24, map_height=24, view_radius=6)
+    for _ in range(10):
+        game.add_player(Player(name=None, rng=game.rng))
+    game.start()
+    # the queue starts at the current turn: check a rotated ring too
+    for _ in range(3):
+        game.engine.advance_turn()
+    full = game.to_dict()
+    for pid in game.players:
+        view = game.view_of(pid, record=False)
+        visible = game.visible_to(pid)
+        assert sorted(d['id'] for d in view['players']) == sorted(d['id'] for d in full['players'] if d['id'] in visible)
+        assert view['turn_queue'] == [eid for eid in full['turn_queue'] if eid in visible]
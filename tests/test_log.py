@@ -0,0 +1,64 @@
+from game.log import GameLog
+
+
+def _log(capacity, count):
+    log = GameLog(capacity)
+    for i in range(count):
+        log.append({'i': i})
+    return log
+
+
+def _seqs(entries):
+    return [e['seq'] for e in entries]
+
+
+def test_since_pages_in_order_before_the_ring_is_full():
+    log = _log(5, 3)
+    assert (log.first_seq, log.last_seq, len(log)) == (1, 3, 3)
+    assert _seqs(log.since(0)) == [1, 2, 3]
+    assert _seqs(log.since(1, limit=1)) == [2]
+    assert log.since(3) == []
+
+
+def test_since_across_the_wraparound():
+    # 12 entries in a ring of 5: seq 8..12 retained, stored from slot 2 on
+    log = _log(5, 12)
+    assert (log.first_seq, log.last_seq, len(log)) == (8, 12, 5)
+    assert _seqs(log.since(0)) == [8, 9, 10, 11, 12]
+    assert _seqs(log.since(9, limit=2)) == [10, 11]
+    assert _seqs(log.since(10, limit=100)) == [11, 12]
+    # pages chain through the wrap without gaps or repeats
+    pages, after = [], 7
+    while True:
+        page = log.since(after, limit=2)
+        if not page:
+            break
+        pages.extend(page)
+        after = page[-1]['seq']
+    assert _seqs(pages) == [8, 9, 10, 11, 12]
+    assert [e['i'] for e in pages] == [7, 8, 9, 10, 11]
+
+
+def test_tail_reversed_and_zero_limit():
+    log = _log(4, 10)
+    assert _seqs(log.tail(2)) == [9, 10]
+    assert _seqs(log.tail(50)) == [7, 8, 9, 10]
+    assert _seqs(reversed(log)) == [10, 9, 8, 7]
+    assert log.since(0, limit=0) == []
+
+
+def test_restore_skips_known_entries_and_restarts_after_a_gap():
+    log = _log(4, 3)
+    assert log.restore({'seq': 2}) is None
+    assert log.restore({'seq': 4})['seq'] == 4
+    # entries 5..8 are unknown: the buffer starts over at 9
+    log.restore({'seq': 9, 'i': 'x'})
+    assert (log.first_seq, log.last_seq) == (9, 9)
+    assert [e['i'] for e in log.since(0)] == ['x']
+
+
+def test_clear_keeps_sequence_numbers_monotonic():
+    log = _log(3, 5)
+    log.clear()
+    assert len(log) == 0 and log.since(0) == []
+    assert log.append({})['seq'] == 6
@@ -0,0 +1,62 @@
+import pytest
+
+from game import mapgen
+from game.mapgen import FLOOR, WALL, TileMap
+from models import GameState, Player
+
+
+def _game_on(rows, players=0):
+    game = GameState(max_players=8, seed=1, turn_budget=0)
+    game.map = TileMap.from_rows(rows, spawns=[(0, 0)])
+    for i in range(players):
+        assert game.add_player(Player(name=f'p{i}', rng=game.rng))
+    return game
+
+
+def test_generate_is_deterministic_and_validated():
+    a = mapgen.generate(40, 30, 'dungeon', seed=7)
+    assert a == mapgen.generate(40, 30, 'dungeon', seed=7)
+    assert a != mapgen.generate(40, 30, 'dungeon', seed=8)
+    assert all(a.passable(x, y) for x, y in a.spawns)
+    with pytest.raises(ValueError):
+        mapgen.validate(4, 4)
+    with pytest.raises(ValueError):
+        mapgen.validate(style='maze')
+
+
+def test_moves_onto_walls_or_off_the_map_are_blocked():
+    game = _game_on([[FLOOR, WALL, FLOOR],
+                     [FLOOR, FLOOR, FLOOR]], players=1)
+    pid = next(iter(game.players))
+    game.current_turn = pid
+    assert game.process_action(pid, {'type': 'move', 'x': 1, 'y': 0})['error'] == 'blocked'
+    assert game.process_action(pid, {'type': 'move', 'x': -1, 'y': 0})['error'] == 'blocked'
+    assert (game.players[pid].x, game.players[pid].y) == (0, 0)
+    assert 'error' not in game.process_action(pid, {'type': 'move', 'x': 0, 'y': 1})
+
+
+def test_spawns_only_on_free_floor_and_refuses_when_the_map_is_full():
+    # three floor tiles in a walled map
+    rows = [[WALL] * 6 for _ in range(4)]
+    for x, y in ((1, 1), (4, 1), (2, 3)):
+        rows[y][x] = FLOOR
+    game = _game_on(rows)
+    game.map.spawns = [(0, 0)]  # a wall: skipped
+    for i in range(3):
+        assert game.add_player(Player(name=f'p{i}', rng=game.rng))
+    assert sorted((p.x, p.y) for p in game.players.values()) == [(1, 1), (2, 3), (4, 1)]
+    assert not game.add_player(Player(name='extra', rng=game.rng))
+    assert len(game.players) == 3
+
+
+def test_respawn_without_a_free_tile_is_an_error():
+    game = _game_on([[FLOOR, FLOOR]], players=2)
+    dead, other = list(game.players.values())
+    dead.hp = 0
+    game.occupancy.remove(dead.id)
+    # someone else took the dead player's tile
+    game.occupancy.place('intruder', dead.x, dead.y)
+    game.current_turn = dead.id
+    res = game.process_action(dead.id, {'type': 'respawn'})
+    assert res['error'] == 'no_free_tile'
+    assert dead.hp == 0
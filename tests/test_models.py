@@ -0,0 +1,38 @@
+import pickle
+
+from models import GameState, Monster, Player
+
+
+def _seeded_game(seed=42):
+    game = GameState(name='S', max_players=4, seed=seed, turn_budget=0)
+    for _ in range(3):
+        game.add_player(Player(name=None, rng=game.rng))
+    game.start()
+    return game
+
+
+def test_same_seed_same_game_but_distinct_entity_ids():
+    a = _seeded_game()
+    b = _seeded_game()
+    # ids key the bot scheduler and socket rooms across games: never shared
+    assert not set(a.players) & set(b.players)
+    assert a.id != b.id
+    # the seed still drives names, spawns and initiative
+    assert [(p.name, p.x, p.y, p.initiative) for p in a.players.values()] == \
+        [(p.name, p.x, p.y, p.initiative) for p in b.players.values()]
+    assert [a.players[eid].name for eid in a.turn_queue] == [b.players[eid].name for eid in b.turn_queue]
+
+
+def test_monster_template_survives_serialization_and_replay():
+    game = _seeded_game()
+    base = game.revision
+    monster = Monster(template_id='orc', rng=game.rng)
+    game.monsters[monster.id] = monster
+    game.touch(monster)
+    assert Monster.from_dict(monster.to_dict()).template_id == 'orc'
+    assert pickle.loads(pickle.dumps(game)).monsters[monster.id].template_id == 'orc'
+    # journal replay: the monster is created from the patch
+    replica = pickle.loads(pickle.dumps(game))
+    del replica.monsters[monster.id]
+    replica.apply_patch(game.diff_since(base))
+    assert replica.monsters[monster.id].template_id == 'orc'
@@ -0,0 +1,92 @@
+import json
+import pickle
+
+import pytest
+
+from game.persistence import Persistence
+from game.state import GameStore
+from models import GameState, Player
+
+
+def _play(game, turns):
+    # alternate moves along the column, through the command queue (journaled)
+    for _ in range(turns):
+        actor = game.players[game.current_turn]
+        game.dispatch(actor.id, {'type': 'move', 'x': actor.x, 'y': (actor.y + 1) % game.map.height})
+
+
+def _state(game):
+    return json.loads(json.dumps(game.to_dict(), default=str))
+
+
+@pytest.fixture
+def persistence(tmp_path, monkeypatch):
+    persistence = Persistence(str(tmp_path), snapshot_every=7, flush_interval=0.001)
+    # as GameStore.enable_persistence does
+    monkeypatch.setattr(GameState, 'persistence', persistence)
+    return persistence
+
+
+def _new_game(persistence, seed=3):
+    game = GameState(name='P', max_players=4, seed=seed, turn_budget=0)
+    for name in ('A', 'B'):
+        game.call(game.add_player, Player(name=name, rng=game.rng))
+    game.call(game.start)
+    persistence.snapshot(game)
+    return game
+
+
+def test_snapshot_and_journal_round_trip(persistence):
+    game = _new_game(persistence)
+    # 20 commands: two snapshots, then a journal tail to replay
+    _play(game, 20)
+    assert persistence.flush()
+    restored, = persistence.load_games()
+    assert restored.revision == game.revision
+    assert _state(restored) == _state(game)
+    assert restored.log.last_seq == game.log.last_seq
+
+
+def test_replay_restores_the_rng_position(persistence):
+    game = _new_game(persistence)
+    # 3 + 9 commands: the next one lands in the journal tail, after the snapshot
+    _play(game, 9)
+    # draws after the last snapshot that only the journal knows about
+    game.call(lambda: (game.rng.randint(1, 20), game.touch(next(iter(game.players.values())))))
+    assert persistence.flush()
+    restored, = persistence.load_games()
+    assert restored.rng.draws == game.rng.draws
+    assert [restored.rng.randint(1, 20) for _ in range(5)] == [game.rng.randint(1, 20) for _ in range(5)]
+
+
+def test_restore_disconnects_humans_and_starts_the_idle_clock(persistence, monkeypatch):
+    game = _new_game(persistence)
+    for pid in game.players:
+        game.call(game.set_player_connected, pid, True)
+    assert persistence.flush()
+    monkeypatch.setattr(GameStore, '_games', {})
+    monkeypatch.setattr(GameStore, '_idle_since', {})
+    monkeypatch.setattr(GameStore, '_persistence', None)
+    monkeypatch.setattr(GameState, 'persistence', None)
+    restored, = GameStore.enable_persistence(Persistence(persistence.data_dir))
+    assert not any(p.is_connected for p in restored.players.values())
+    assert game.id in GameStore._idle_since
+
+
+def test_snapshot_is_a_point_in_time_copy():
+    game = GameState(name='F', max_players=4, seed=5, turn_budget=0)
+    for name in ('A', 'B'):
+        game.add_player(Player(name=name, rng=game.rng))
+    game.start()
+    before = _state(game)
+    tiles = bytes(game.map.tiles)
+    frozen = game.frozen()
+    # changes made after the copy (while the writer has not pickled it yet)
+    _play(game, 3)
+    game.map.set(0, 0, 1)
+    restored = pickle.loads(pickle.dumps(frozen))
+    assert _state(restored) == before
+    assert bytes(restored.map.tiles) == tiles
+    # the unchanged map copy is shared until a tile changes
+    assert game.frozen().state['map'] is game.frozen().state['map']
+    assert game.frozen().state['map'].tiles == game.map.tiles
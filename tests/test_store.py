@@ -0,0 +1,51 @@
+import pytest
+
+from game import state
+from game.state import GameStore
+
+
+@pytest.fixture
+def store(monkeypatch):
+    monkeypatch.setattr(GameStore, '_games', {})
+    monkeypatch.setattr(GameStore, '_idle_since', {})
+    monkeypatch.setattr(GameStore, '_persistence', None)
+    monkeypatch.setattr(state, 'MAX_GAMES', 3)
+    return GameStore
+
+
+def _game(store, connected=False, last_active=0.0):
+    game = store.create_game(turn_budget=0)
+    player = store.add_player(game.id, 'A')
+    store.set_player_connected(game.id, player.id, connected)
+    game.last_active = last_active
+    return game
+
+
+def test_full_store_evicts_the_least_recently_active_game_without_humans(store):
+    busy = _game(store, connected=True, last_active=1.0)
+    old = _game(store, last_active=2.0)
+    recent = _game(store, last_active=3.0)
+    new = store.create_game(turn_budget=0)
+    assert new is not None
+    assert set(store._games) == {busy.id, recent.id, new.id}
+    assert old.id not in store._games
+
+
+def test_full_store_of_connected_games_refuses(store):
+    for _ in range(3):
+        _game(store, connected=True)
+    assert store.create_game(turn_budget=0) is None
+
+
+def test_max_players_above_the_entity_cap_is_an_error(store):
+    with pytest.raises(ValueError):
+        store.create_game(max_players=state.MAX_ENTITIES + 1)
+
+
+def test_stopped_bot_leaves_the_turn_order(store):
+    game = _game(store, connected=True)
+    bot = store.start_bot(game.id, think_interval=60)
+    assert bot.player_id in game.turns
+    assert store.stop_bot(game.id, bot.player_id)
+    assert bot.player_id not in game.turns
+    assert game.current_turn != bot.player_id
@@ -0,0 +1,90 @@
+from game.turns import TurnOrder
+
+
+def _ring(*entries, current=None):
+    order = TurnOrder()
+    order.reset(list(entries), current)
+    return order
+
+
+def test_reset_orders_by_initiative_ties_in_given_order():
+    order = _ring((5, 'a'), (18, 'b'), (5, 'c'), (12, 'd'))
+    assert order.ids() == ['b', 'd', 'a', 'c']
+    assert order.current == 'b'
+
+
+def test_advance_wraps_around_the_ring():
+    order = _ring((3, 'a'), (2, 'b'), (1, 'c'))
+    assert [order.advance() for _ in range(4)] == ['b', 'c', 'a', 'b']
+    assert order.ids() == ['b', 'c', 'a']
+
+
+def test_removing_the_current_turn_hands_it_to_the_next():
+    order = _ring((3, 'a'), (2, 'b'), (1, 'c'), current='c')
+    assert order.remove('c')
+    # c was last in the ring: the turn wraps to the first
+    assert order.current == 'a'
+    assert order.ids() == ['a', 'b']
+    assert order.remove('a') and order.current == 'b'
+    assert order.remove('b') and order.current is None
+    assert order.ids() == [] and len(order) == 0
+    assert not order.remove('b')
+
+
+def test_removing_another_entity_keeps_the_current_turn():
+    order = _ring((3, 'a'), (2, 'b'), (1, 'c'), current='b')
+    order.remove('c')
+    assert order.current == 'b'
+    assert order.ids() == ['b', 'a']
+
+
+def test_add_goes_to_its_initiative_rank_without_taking_the_turn():
+    order = _ring((10, 'a'), (5, 'b'), current='b')
+    order.add('c', 7)
+    order.add('d', 20)
+    # equal initiative: after the entities already there
+    order.add('e', 5)
+    assert order.current == 'b'
+    assert order.ids() == ['b', 'e', 'd', 'a', 'c']
+    assert not order.add('a', 1)
+
+
+def test_add_to_an_empty_ring_takes_the_turn():
+    order = TurnOrder()
+    order.add('a', 4)
+    assert order.current == 'a' and order.ids() == ['a']
+    assert order.advance() == 'a'
+
+
+def test_rejoining_after_many_removals_keeps_the_ring_consistent():
+    order = _ring(*[(i % 7, f'e{i}') for i in range(30)])
+    expected = order.ids()
+    # churn: stale keys pile up and get purged
+    for _ in range(5):
+        for i in range(0, 30, 2):
+            order.remove(f'e{i}')
+        for i in range(0, 30, 2):
+            order.add(f'e{i}', i % 7)
+    assert sorted(order.ids()) == sorted(expected)
+    assert len(order._keys) <= 2 * len(order) + 8
+    # the linked ring and its key order agree
+    assert order.ids() == order.order_of(order.ids())
+    # walking the ring visits everyone once
+    seen = [order.advance() for _ in range(len(order))]
+    assert sorted(seen) == sorted(expected)
+
+
+def test_order_of_starts_at_the_current_turn():
+    order = _ring((9, 'a'), (7, 'b'), (5, 'c'), (3, 'd'), current='c')
+    assert order.order_of({'a', 'd', 'zz'}) == ['d', 'a']
+    assert order.order_of({'c', 'b'}) == ['c', 'b']
+
+
+def test_join_drops_the_stale_keys_it_walks_over():
+    ring = TurnOrder()
+    ring.reset([(10, 'a'), (5, 'b'), (1, 'c')])
+    ring.remove('b')
+    # 'd' goes just before the removed 'b' key, which is dropped on the way to 'c'
+    assert ring.add('d', 6)
+    assert ring.ids() == ['a', 'd', 'c']
+    assert [k[2] for k in ring._keys] == ['a', 'd', 'c']
@@ -0,0 +1,16 @@
+from game import wire
+from models import Monster, Player
+
+
+def _expand(entity):
+    # what the frontend's expandEntity does
+    d = dict(zip(wire.ENTITY_FIELDS, entity))
+    d['position'] = {'x': d.pop('x'), 'y': d.pop('y')}
+    return d
+
+
+def test_compact_entities_have_the_json_shape():
+    for ent in (Player(name='A'), Monster(template_id='orc')):
+        assert _expand(wire.compact_entity(ent.to_dict())) == ent.to_dict()
+    # players do not carry a template_id
+    assert len(wire.compact_entity(Player(name='A').to_dict())) == len(wire.ENTITY_FIELDS) - 1
@@ -0,0 +1,391 @@
+"""Socket.IO load generator and end-to-end latency harness.
+
+Creates `--rooms` games through POST /api/games, joins `--clients` simulated
+players per room (POST /api/games/<id>/join with autoBot=false, then the
+`join` socket event) and makes every client fire `action` events at `--rate`
+actions per second for `--duration` seconds.
+
+Every client moves to a random free neighbouring tile (or ends its turn).
+Once a turn order exists only the current entity's move is applied, the
+others are rejected with `action_error` (not your turn), so both the accepted
+and the rejected path are exercised. Reported latencies (p50/p95/p99, in ms):
+
+- ack: `action` -> `action_ack`;
+- error: `action` -> `action_error`;
+- delta: `action` -> the `state_delta` broadcast that applies it (actions
+  broadcast a delta, not a full `state_update`, since revision deltas).
+
+Server CPU and RSS are sampled from /proc (Linux) for `--server-pid`, or for
+the server started with `--spawn` (gunicorn + eventlet, one worker, as in the
+Dockerfile; falls back to socketio.run when gunicorn is not installed). Child
+processes are included. Only python-socketio's client extras are needed::
+
+    pip install "python-socketio[client]"
+    python tools/loadgen.py --spawn --rooms 20 --clients 4 --rate 2 --duration 30
+    python tools/loadgen.py --url http://127.0.0.1:5000 --server-pid 1234 --json out.json
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+
+import socketio
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STEPS = ((1, 0), (-1, 0), (0, 1), (0, -1))
+
+
+def http_json(method, url, body=None, timeout=10):
+    data = json.dumps(body).encode() if body is not None else None
+    req = urllib.request.Request(url, data=data, method=method, headers={'Content-Type': 'application/json'})
+    with urllib.request.urlopen(req, timeout=timeout) as resp:
+        return json.loads(resp.read().decode())
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * (len(values) - 1) + 0.5))]
+
+
+def summarize(values):
+    return {
+        'count': len(values),
+        'p50_ms': percentile(values, 0.50),
+        'p95_ms': percentile(values, 0.95),
+        'p99_ms': percentile(values, 0.99),
+        'max_ms': max(values) if values else None,
+    }
+
+
+class Client:
+    """One simulated player: a Socket.IO connection plus the minimal game view it needs."""
+
+    def __init__(self, url, game_id, player_id, rng):
+        self.url = url
+        self.game_id = game_id
+        self.player_id = player_id
+        self.rng = rng
+        self.lock = threading.Lock()
+        self.positions = {}       # entity id -> (x, y)
+        self.width = self.height = 0
+        self.current_turn = None
+        self.pending = []         # send times awaiting action_ack / action_error
+        self.turn_sent = None     # send time of an in-turn action awaiting its state_delta
+        self.ack_ms = []
+        self.error_ms = []
+        self.delta_ms = []
+        self.sent = 0
+        self.joined = threading.Event()
+        self.sio = socketio.Client(reconnection=False)
+        self.sio.on('state_update', self._on_state)
+        self.sio.on('state_delta', self._on_delta)
+        self.sio.on('action_ack', self._on_ack)
+        self.sio.on('action_error', self._on_error)
+
+    def connect(self):
+        self.sio.connect(self.url, transports=['websocket'])
+        self.sio.emit('join', {'gameId': self.game_id, 'playerId': self.player_id})
+        return self.joined.wait(10)
+
+    def close(self):
+        try:
+            self.sio.disconnect()
+        except Exception:
+            pass
+
+    def _apply_entities(self, entities):
+        for e in entities or []:
+            pos = e.get('position') or {}
+            if e.get('hp', 1) <= 0:
+                self.positions.pop(e['id'], None)
+            elif 'x' in pos:
+                self.positions[e['id']] = (pos['x'], pos['y'])
+
+    def _on_state(self, state):
+        with self.lock:
+            info = state.get('map_info') or {}
+            self.height = info.get('h', 0)
+            self.width = info.get('w', 0)
+            self.positions = {}
+            self._apply_entities(state.get('players'))
+            self._apply_entities(state.get('monsters'))
+            self.current_turn = state.get('current_turn')
+        self.joined.set()
+
+    def _on_delta(self, delta):
+        now = time.perf_counter()
+        with self.lock:
+            self._apply_entities(delta.get('players'))
+            self._apply_entities(delta.get('monsters'))
+            for eid in delta.get('removed') or []:
+                self.positions.pop(eid, None)
+            if delta.get('map_info'):
+                self.height = delta['map_info']['h']
+                self.width = delta['map_info']['w']
+            self.current_turn = delta.get('current_turn')
+            if self.turn_sent is not None and any(p.get('id') == self.player_id for p in delta.get('players') or []):
+                self.delta_ms.append((now - self.turn_sent) * 1000)
+                self.turn_sent = None
+
+    def _pop_pending(self):
+        with self.lock:
+            return self.pending.pop(0) if self.pending else None
+
+    def _on_ack(self, data):
+        sent = self._pop_pending()
+        if sent is not None:
+            self.ack_ms.append((time.perf_counter() - sent) * 1000)
+
+    def _on_error(self, data):
+        sent = self._pop_pending()
+        if sent is not None:
+            self.error_ms.append((time.perf_counter() - sent) * 1000)
+
+    def _choose(self):
+        pos = self.positions.get(self.player_id)
+        if pos is None:
+            return {'type': 'respawn'}
+        taken = set(self.positions.values())
+        steps = list(STEPS)
+        self.rng.shuffle(steps)
+        for dx, dy in steps:
+            x, y = pos[0] + dx, pos[1] + dy
+            if 0 <= x < self.width and 0 <= y < self.height and (x, y) not in taken:
+                return {'type': 'move', 'x': x, 'y': y}
+        return {'type': 'end_turn'}
+
+    def fire(self):
+        with self.lock:
+            action = self._choose()
+            # no turn order yet (no bot rolled initiative): everybody may act
+            my_turn = self.current_turn in (None, self.player_id)
+            now = time.perf_counter()
+            self.pending.append(now)
+            if my_turn and self.turn_sent is None:
+                self.turn_sent = now
+        self.sio.emit('action', {'gameId': self.game_id, 'playerId': self.player_id, 'action': action})
+        self.sent += 1
+
+
+class ProcSampler:
+    """Samples CPU% and RSS of a process tree from /proc once per `interval`."""
+
+    def __init__(self, pid, interval=1.0):
+        self.pid = pid
+        self.interval = interval
+        self.cpu = []
+        self.rss_mb = []
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._tick = os.sysconf('SC_CLK_TCK')
+
+    def _tree(self):
+        children = {}
+        for name in os.listdir('/proc'):
+            if not name.isdigit():
+                continue
+            try:
+                with open(f'/proc/{name}/stat') as f:
+                    ppid = int(f.read().rsplit(')', 1)[1].split()[1])
+            except Exception:
+                continue
+            children.setdefault(ppid, []).append(int(name))
+        pids, todo = [], [self.pid]
+        while todo:
+            pid = todo.pop()
+            pids.append(pid)
+            todo.extend(children.get(pid, []))
+        return pids
+
+    def _read(self):
+        ticks = rss = 0
+        for pid in self._tree():
+            try:
+                with open(f'/proc/{pid}/stat') as f:
+                    fields = f.read().rsplit(')', 1)[1].split()
+                ticks += int(fields[11]) + int(fields[12])   # utime + stime
+                with open(f'/proc/{pid}/status') as f:
+                    for line in f:
+                        if line.startswith('VmRSS:'):
+                            rss += int(line.split()[1])
+            except Exception:
+                pass
+        return ticks / self._tick, rss / 1024
+
+    def _run(self):
+        last_cpu, _ = self._read()
+        last = time.monotonic()
+        while not self._stop.wait(self.interval):
+            cpu, rss = self._read()
+            now = time.monotonic()
+            self.cpu.append((cpu - last_cpu) / (now - last) * 100)
+            self.rss_mb.append(rss)
+            last_cpu, last = cpu, now
+
+    def start(self):
+        if os.path.isdir(f'/proc/{self.pid}'):
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+        return {
+            'cpu_percent_avg': sum(self.cpu) / len(self.cpu) if self.cpu else None,
+            'cpu_percent_max': max(self.cpu) if self.cpu else None,
+            'rss_mb_max': max(self.rss_mb) if self.rss_mb else None,
+            'rss_mb_last': self.rss_mb[-1] if self.rss_mb else None,
+        }
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def spawn_server(port):
+    """Start a local server on `port`, the way the Dockerfile does when possible."""
+    env = dict(os.environ, PYTHONUNBUFFERED='1')
+    env.pop('FUNGAME_DATA_DIR', None)
+    if shutil.which('gunicorn'):
+        cmd = ['gunicorn', '-k', 'eventlet', '-w', '1', '--bind', f'127.0.0.1:{port}', 'wsgi:app']
+    else:
+        cmd = [sys.executable, '-c',
+               f"import eventlet; eventlet.monkey_patch()\n"
+               f"from wsgi import app, socketio\n"
+               f"socketio.run(app, host='127.0.0.1', port={port})"]
+    proc = subprocess.Popen(cmd, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    url = f'http://127.0.0.1:{port}'
+    deadline = time.monotonic() + 20
+    while time.monotonic() < deadline:
+        try:
+            http_json('GET', url + '/api')
+            return proc, url
+        except Exception:
+            if proc.poll() is not None:
+                break
+            time.sleep(0.2)
+    proc.kill()
+    raise RuntimeError('local server did not start: ' + ' '.join(cmd))
+
+
+def run(url, rooms, clients, rate, duration, seed=None, server_pid=None):
+    rng = random.Random(seed)
+    conns = []
+    setup_started = time.perf_counter()
+    for r in range(rooms):
+        game = http_json('POST', url + '/api/games', {'name': f'load-{r}', 'maxPlayers': clients,
+                                                      'seed': rng.getrandbits(32)})
+        for c in range(clients):
+            joined = http_json('POST', f"{url}/api/games/{game['gameId']}/join",
+                               {'playerName': f'load-{r}-{c}', 'autoBot': False})
+            client = Client(url, game['gameId'], joined['playerId'], random.Random(rng.getrandbits(64)))
+            if not client.connect():
+                raise RuntimeError(f"client {joined['playerId']} did not receive its initial state")
+            conns.append(client)
+    setup_s = time.perf_counter() - setup_started
+
+    sampler = ProcSampler(server_pid).start() if server_pid else None
+    # every client fires at `rate`/s, with a random phase so sends are spread out
+    interval = 1.0 / rate
+    started = time.perf_counter()
+    due = [(started + rng.random() * interval, i) for i in range(len(conns))]
+    while True:
+        now = time.perf_counter()
+        if now - started >= duration:
+            break
+        due.sort()
+        when, i = due[0]
+        if when > now:
+            time.sleep(min(when - now, 0.01))
+            continue
+        try:
+            conns[i].fire()
+        except Exception:
+            pass
+        due[0] = (when + interval, i)
+    elapsed = time.perf_counter() - started
+    time.sleep(0.5)   # let in-flight replies arrive
+    server = sampler.stop() if sampler else None
+    for client in conns:
+        client.close()
+
+    sent = sum(c.sent for c in conns)
+    return {
+        'rooms': rooms,
+        'clients_per_room': clients,
+        'rate_per_client': rate,
+        'duration_s': elapsed,
+        'setup_s': setup_s,
+        'actions_sent': sent,
+        'actions_per_s': sent / elapsed if elapsed else 0.0,
+        'ack': summarize([v for c in conns for v in c.ack_ms]),
+        'error': summarize([v for c in conns for v in c.error_ms]),
+        'delta': summarize([v for c in conns for v in c.delta_ms]),
+        'server': server,
+    }
+
+
+def _fmt(stats):
+    if not stats['count']:
+        return 'n=0'
+    return (f"n={stats['count']} p50={stats['p50_ms']:.1f}ms p95={stats['p95_ms']:.1f}ms "
+            f"p99={stats['p99_ms']:.1f}ms max={stats['max_ms']:.1f}ms")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Load-test a FunGame server over Socket.IO.')
+    parser.add_argument('--url', default='http://127.0.0.1:5000', help='server base url (ignored with --spawn)')
+    parser.add_argument('--spawn', action='store_true', help='start a local server (wsgi.py) on a free port')
+    parser.add_argument('--server-pid', type=int, help='pid of the server to sample CPU/memory from')
+    parser.add_argument('--rooms', type=int, default=10, help='number of games')
+    parser.add_argument('--clients', type=int, default=2, help='simulated players per game')
+    parser.add_argument('--rate', type=float, default=1.0, help='actions per second per client')
+    parser.add_argument('--duration', type=float, default=20.0, help='seconds of load')
+    parser.add_argument('--seed', type=int, help='seed for game seeds and client choices')
+    parser.add_argument('--json', dest='json_path', help='also write the report to this JSON file')
+    args = parser.parse_args(argv)
+
+    proc = None
+    url, server_pid = args.url, args.server_pid
+    if args.spawn:
+        proc, url = spawn_server(_free_port())
+        server_pid = proc.pid
+    try:
+        report = run(url, args.rooms, args.clients, args.rate, args.duration, args.seed, server_pid)
+    finally:
+        if proc is not None:
+            proc.terminate()
+            try:
+                proc.wait(5)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+
+    print(f"{report['rooms']} rooms x {report['clients_per_room']} clients, "
+          f"{report['actions_sent']} actions in {report['duration_s']:.1f}s ({report['actions_per_s']:.0f}/s)")
+    print(f"  action -> action_ack:   {_fmt(report['ack'])}")
+    print(f"  action -> action_error: {_fmt(report['error'])}")
+    print(f"  action -> state_delta:  {_fmt(report['delta'])}")
+    server = report['server']
+    if server and server['cpu_percent_avg'] is not None:
+        print(f"  server: cpu avg {server['cpu_percent_avg']:.0f}% max {server['cpu_percent_max']:.0f}%, "
+              f"rss max {server['rss_mb_max']:.0f} MB")
+    if args.json_path:
+        with open(args.json_path, 'w') as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
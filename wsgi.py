@@ -2,14 +2,28 @@
 from app import create_app
 from flask_socketio import SocketIO
 from socketio_events import register_socketio_handlers
+from game.wire import SocketIOJSON
+from game import cluster
+from game.state import GameStore
 
 # create Flask app
 app = create_app()
 # create SocketIO with eventlet async mode for production
 # Enable detailed logging to help diagnose client connection issues
-socketio = SocketIO(app, cors_allowed_origins='*', async_mode='eventlet', logger=True, engineio_logger=True)
+# SocketIOJSON lets handlers emit cached, pre-encoded snapshots (game.wire.RawJSON)
+# In clustered mode (FUNGAME_WORKERS > 1) emits are relayed between workers by
+# game.cluster.ClusterManager; otherwise client_manager() is None (default manager)
+socketio = SocketIO(app, cors_allowed_origins='*', async_mode='eventlet', logger=True, engineio_logger=True,
+                    json=SocketIOJSON, client_manager=cluster.client_manager())
+# expose socketio instance for game-side emits and green background tasks
+import socketio_instance
+socketio_instance.set_socketio(socketio)
 # register handlers
 register_socketio_handlers(socketio)
+# remove games nobody plays anymore (FUNGAME_IDLE_TTL)
+GameStore.start_reaper()
+# announce this worker's games to the others (no-op when not clustered)
+cluster.start(socketio, lambda: GameStore.list_games(local_only=True))
 
 # gunicorn expects a WSGI callable named 'app' (or 'application').
 # Flask-SocketIO can work with gunicorn+eventlet by exposing the Flask app.